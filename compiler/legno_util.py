@@ -3,7 +3,6 @@ import os
 import time
 import json
 import shutil
-import signal
 import numpy as np
 import itertools
 
@@ -25,83 +24,156 @@ def get_device(model_number):
 def get_calibrate_objective(name):
     return llenums.CalibrateObjective(name)
 
-def exec_lscale(args):
+def _lscale_circuit(board,program,args,path_handler,lgraph_adp_file):
     from compiler import lscale
     import compiler.lscale_pass.lscale_ops as scalelib
 
+    with open(lgraph_adp_file,'r') as fh:
+        print("===== %s =====" % (os.path.basename(lgraph_adp_file)))
+        adp = ADP.from_json(board, \
+                            json.loads(fh.read()))
+
+
+    obj = scalelib.ObjectiveFun(args.objective)
+    scale_method = scalelib.ScaleMethod(args.scale_method)
+    calib_obj = get_calibrate_objective(args.calib_obj)
+
+
+    if args.no_scale and not scale_method is scalelib.ScaleMethod.IDEAL:
+        raise Exception("cannot disable scaling transform if you're using the delta model database")
+
+    # time to find each scaled circuit
+    runs = []
+    start = time.time()
+    for idx,scale_adp in enumerate(lscale.scale(board, \
+                                                program, \
+                                                adp, \
+                                                objective=obj, \
+                                                scale_method=scale_method, \
+                                                calib_obj=calib_obj, \
+                                                no_scale=args.no_scale, \
+                                                one_mode=args.one_mode, \
+                                                solver=args.solver, \
+                                                min_distance=args.min_mode_distance, \
+                                                portfolio=args.portfolio)):
+        runs.append(time.time()-start)
+
+        print("<<< writing scaled circuit %d/%d>>>" % (idx,args.scale_adps))
+        scale_adp.metadata.set(ADPMetadata.Keys.LSCALE_ID,idx)
+
+        calib_obj = llenums.CalibrateObjective(scale_adp \
+                                           .metadata[ADPMetadata.Keys.RUNTIME_CALIB_OBJ])
+        filename = path_handler.lscale_adp_file(
+            scale_adp.metadata[ADPMetadata.Keys.LGRAPH_ID],
+            scale_adp.metadata[ADPMetadata.Keys.LSCALE_ID],
+            scale_adp.metadata[ADPMetadata.Keys.LSCALE_SCALE_METHOD],
+            scale_adp.metadata[ADPMetadata.Keys.LSCALE_OBJECTIVE],
+            calib_obj,
+            scale_adp.metadata[ADPMetadata.Keys.RUNTIME_PHYS_DB], \
+            no_scale=scale_adp.metadata[ADPMetadata.Keys.LSCALE_NO_SCALE], \
+            one_mode=scale_adp.metadata[ADPMetadata.Keys.LSCALE_ONE_MODE] \
+        )
+
+        with open(filename,'w') as fh:
+            jsondata = scale_adp.to_json()
+            fh.write(json.dumps(jsondata,indent=4))
+
+        print("<<< writing graph >>>")
+        filename = path_handler.lscale_adp_diagram_file(
+            scale_adp.metadata[ADPMetadata.Keys.LGRAPH_ID],
+            scale_adp.metadata[ADPMetadata.Keys.LSCALE_ID],
+            scale_adp.metadata[ADPMetadata.Keys.LSCALE_SCALE_METHOD],
+            scale_adp.metadata[ADPMetadata.Keys.LSCALE_OBJECTIVE],
+            calib_obj,
+            scale_adp.metadata[ADPMetadata.Keys.RUNTIME_PHYS_DB], \
+            no_scale=scale_adp.metadata[ADPMetadata.Keys.LSCALE_NO_SCALE], \
+            one_mode=scale_adp.metadata[ADPMetadata.Keys.LSCALE_ONE_MODE] \
+        )
+
+        adprender.render(board,scale_adp,filename)
+        if idx >= args.scale_adps:
+            break
+        start = time.time()
+
+    return runs
+
+# worker state, inherited by the forked lscale processes
+_LSCALE_CONTEXT = None
+
+def _lscale_init():
+    import runtime.models.database as dblib
+    board = _LSCALE_CONTEXT[0]
+    # the parent's connection must not be used across the fork. The delta
+    # models were loaded into the model cache before the pool started, and
+    # lscale never writes, so workers reopen the database read-only.
+    if not board.model_number is None:
+        board._physdb = dblib.PhysicalDatabase(board.physdb.filename, \
+                                               read_only=True)
+
+def _lscale_worker(lgraph_adp_file):
+    board,program,args,path_handler = _LSCALE_CONTEXT
+    start = time.time()
+    runs = _lscale_circuit(board,program,args,path_handler,lgraph_adp_file)
+    return runs,time.time()-start
+
+def exec_lscale(args):
+    import multiprocessing
+    import runtime.models.exp_delta_model as exp_delta_model_lib
+    global _LSCALE_CONTEXT
+
+    # the portfolio races its configurations in child processes, and the
+    # daemonic pool workers cannot start children of their own.
+    if args.jobs > 1 and args.portfolio > 1:
+        raise Exception("portfolio solving cannot be combined with --jobs > 1")
+
     board = get_device(args.model_number)
     path_handler = paths.PathHandler(args.subset,args.program)
     program = DSProgDB.get_prog(args.program)
     timer = util.Timer('lscale',path_handler)
+    # circuits are scaled in a fixed order, and each scaled circuit is
+    # identified by its lgraph circuit and its solution index, so the
+    # LSCALE_IDs are the same with any number of jobs.
+    lgraph_adp_files = []
     for dirname, subdirlist, filelist in \
         os.walk(path_handler.lgraph_adp_dir()):
         for lgraph_adp_file in filelist:
             if lgraph_adp_file.endswith('.adp'):
-                with open(dirname+"/"+lgraph_adp_file,'r') as fh:
-                    print("===== %s =====" % (lgraph_adp_file))
-                    adp = ADP.from_json(board, \
-                                        json.loads(fh.read()))
-
-
-                obj = scalelib.ObjectiveFun(args.objective)
-                scale_method = scalelib.ScaleMethod(args.scale_method)
-                calib_obj = get_calibrate_objective(args.calib_obj)
-
-
-                if args.no_scale and not scale_method is scalelib.ScaleMethod.IDEAL:
-                    raise Exception("cannot disable scaling transform if you're using the delta model database")
-
-                timer.start()
-                for idx,scale_adp in enumerate(lscale.scale(board, \
-                                                            program, \
-                                                            adp, \
-                                                            objective=obj, \
-                                                            scale_method=scale_method, \
-                                                            calib_obj=calib_obj, \
-                                                            no_scale=args.no_scale, \
-                                                            one_mode=args.one_mode)):
-                    timer.end()
-
-                    print("<<< writing scaled circuit %d/%d>>>" % (idx,args.scale_adps))
-                    scale_adp.metadata.set(ADPMetadata.Keys.LSCALE_ID,idx)
-
-                    calib_obj = llenums.CalibrateObjective(scale_adp \
-                                                       .metadata[ADPMetadata.Keys.RUNTIME_CALIB_OBJ])
-                    filename = path_handler.lscale_adp_file(
-                        scale_adp.metadata[ADPMetadata.Keys.LGRAPH_ID],
-                        scale_adp.metadata[ADPMetadata.Keys.LSCALE_ID],
-                        scale_adp.metadata[ADPMetadata.Keys.LSCALE_SCALE_METHOD],
-                        scale_adp.metadata[ADPMetadata.Keys.LSCALE_OBJECTIVE],
-                        calib_obj,
-                        scale_adp.metadata[ADPMetadata.Keys.RUNTIME_PHYS_DB], \
-                        no_scale=scale_adp.metadata[ADPMetadata.Keys.LSCALE_NO_SCALE], \
-                        one_mode=scale_adp.metadata[ADPMetadata.Keys.LSCALE_ONE_MODE] \
-                    )
-
-                    with open(filename,'w') as fh:
-                        jsondata = scale_adp.to_json()
-                        fh.write(json.dumps(jsondata,indent=4))
-
-                    print("<<< writing graph >>>")
-                    filename = path_handler.lscale_adp_diagram_file(
-                        scale_adp.metadata[ADPMetadata.Keys.LGRAPH_ID],
-                        scale_adp.metadata[ADPMetadata.Keys.LSCALE_ID],
-                        scale_adp.metadata[ADPMetadata.Keys.LSCALE_SCALE_METHOD],
-                        scale_adp.metadata[ADPMetadata.Keys.LSCALE_OBJECTIVE],
-                        calib_obj,
-                        scale_adp.metadata[ADPMetadata.Keys.RUNTIME_PHYS_DB], \
-                        no_scale=scale_adp.metadata[ADPMetadata.Keys.LSCALE_NO_SCALE], \
-                        one_mode=scale_adp.metadata[ADPMetadata.Keys.LSCALE_ONE_MODE] \
-                    )
-
-                    adprender.render(board,scale_adp,filename)
-                    if idx >= args.scale_adps:
-                        break
-                    timer.start()
-
-
+                lgraph_adp_files.append(os.path.join(dirname,lgraph_adp_file))
+    lgraph_adp_files.sort()
+
+    start = time.time()
+    if args.jobs > 1 and len(lgraph_adp_files) > 1:
+        if not board.model_number is None:
+            exp_delta_model_lib.preload_cached_models(board)
+
+        _LSCALE_CONTEXT = (board,program,args,path_handler)
+        try:
+            ctx = multiprocessing.get_context("fork")
+            with ctx.Pool(processes=min(args.jobs,len(lgraph_adp_files)), \
+                          initializer=_lscale_init) as pool:
+                results = list(pool.imap(_lscale_worker,lgraph_adp_files))
+        finally:
+            _LSCALE_CONTEXT = None
+    else:
+        results = []
+        for lgraph_adp_file in lgraph_adp_files:
+            circ_start = time.time()
+            runs = _lscale_circuit(board,program,args,path_handler,lgraph_adp_file)
+            results.append((runs,time.time()-circ_start))
+
+    runtime = time.time()-start
+    for lgraph_adp_file,(runs,circ_runtime) in zip(lgraph_adp_files,results):
+        for run in runs:
+            timer.add(run)
+        print("[lscale] %s: %d scaled circuits, first=%s total=%.3fs" % \
+              (os.path.basename(lgraph_adp_file),len(runs), \
+               "%.3fs" % runs[0] if len(runs) > 0 else "n/a", \
+               circ_runtime))
+
+    circ_runtime = sum(map(lambda res: res[1], results))
+    print("[lscale] %d circuits, jobs=%d, circuit time=%.3fs wall time=%.3fs" % \
+          (len(lgraph_adp_files),args.jobs,circ_runtime,runtime))
     print("<<< done >>>")
-    timer.kill()
     print(timer)
     timer.save()
 
@@ -123,7 +195,8 @@ def exec_lgraph(args):
                                  synth_depth=args.synth_depth,
                                  vadps=args.vadps,
                                  adps=args.adps, \
-                                 routes=args.routes)):
+                                 routes=args.routes, \
+                                 jobs=args.jobs)):
         timer.end()
         adp.metadata.set(ADPMetadata.Keys.DSNAME, \
                          args.program)
@@ -151,29 +224,32 @@ def exec_lgraph(args):
     timer.kill()
     print(timer)
     timer.save()
+    board.path_index.save()
 
 def exec_lcal(args):
+    import runtime.runtime_session as runtime_session
     if args.model_number is None:
        raise Exception("model number must be provided to calibration procedure")
 
     board = get_device(args.model_number)
     path_handler = paths.PathHandler(args.subset,args.program)
     program = DSProgDB.get_prog(args.program)
-    for dirname, subdirlist, filelist in \
-        os.walk(path_handler.lgraph_adp_dir()):
-        for adp_file in filelist:
-            if adp_file.endswith('.adp'):
-                adp_path = dirname+"/"+adp_file
-                if args.maximize_fit:
-                    runt_meta_util.legacy_calibration(board, adp_path, \
-                                                      llenums.CalibrateObjective.MAXIMIZE_FIT, \
-                                                      widen=True,
-                                                      logfile=None)
-                if args.minimize_error:
-                    runt_meta_util.legacy_calibration(board, adp_path, \
-                                                      llenums.CalibrateObjective.MINIMIZE_ERROR, \
-                                                      widen=True,
-                                                      logfile=None)
+    with runtime_session.open_session() as session:
+        for dirname, subdirlist, filelist in \
+            os.walk(path_handler.lgraph_adp_dir()):
+            for adp_file in filelist:
+                if adp_file.endswith('.adp'):
+                    adp_path = dirname+"/"+adp_file
+                    if args.maximize_fit:
+                        runt_meta_util.legacy_calibration(session, board, adp_path, \
+                                                          llenums.CalibrateObjective.MAXIMIZE_FIT, \
+                                                          widen=True,
+                                                          logfile=None)
+                    if args.minimize_error:
+                        runt_meta_util.legacy_calibration(session, board, adp_path, \
+                                                          llenums.CalibrateObjective.MINIMIZE_ERROR, \
+                                                          widen=True,
+                                                          logfile=None)
 
 
 
@@ -199,41 +275,37 @@ def _lexec_already_ran(ph,board,adp,trial=0,scope=False):
     return True
 
 def exec_lexec(args):
-    EXEC_CMD = "python3 grendel.py exec {adp_path} --model-number {model_number}"
-    if args.scope:
-        EXEC_CMD += " --osc"
+    import runtime.runtime_session as runtime_session
+    import runtime.runt_execute as runt_exec
 
     board = get_device(None)
     path_handler = paths.PathHandler(args.subset,args.program)
     program = DSProgDB.get_prog(args.program)
     timer = util.Timer('lexec',path_handler)
-    for dirname, subdirlist, filelist in \
-        os.walk(path_handler.lscale_adp_dir()):
-        for adp_file in filelist:
-            if adp_file.endswith('.adp'):
-                adp_path = dirname+"/"+adp_file
-                print(adp_path)
-                with open(adp_path,'r') as fh:
-                    print("===== %s =====" % (adp_file))
-                    adp = ADP.from_json(board, \
-                                        json.loads(fh.read()))
-                    kwargs = {
-                        'adp_path': adp_path,
-                        'model_number': adp.metadata[ADPMetadata.Keys.RUNTIME_PHYS_DB]
-                    }
-                    if not _lexec_already_ran(path_handler,board,adp,trial=0, \
-                                              scope=args.scope) or \
-                       args.force:
-                        timer.start()
-                        cmd = EXEC_CMD.format(**kwargs)
-                        code = os.system(cmd)
-                        timer.end()
-                        #input("continue")
-                        if code == signal.SIGINT or code != 0:
-                            raise Exception("User terminated process")
-
-        print(timer)
-        timer.save()
+    # the board connection and the delta model databases are shared by
+    # every execution.
+    with runtime_session.open_session() as session:
+        for dirname, subdirlist, filelist in \
+            os.walk(path_handler.lscale_adp_dir()):
+            for adp_file in filelist:
+                if adp_file.endswith('.adp'):
+                    adp_path = dirname+"/"+adp_file
+                    print(adp_path)
+                    with open(adp_path,'r') as fh:
+                        print("===== %s =====" % (adp_file))
+                        adp = ADP.from_json(board, \
+                                            json.loads(fh.read()))
+                        model_number = adp.metadata[ADPMetadata.Keys.RUNTIME_PHYS_DB]
+                        if not _lexec_already_ran(path_handler,board,adp,trial=0, \
+                                                  scope=args.scope) or \
+                           args.force:
+                            timer.start()
+                            runt_exec.execute(session,adp_path,model_number, \
+                                              osc=args.scope)
+                            timer.end()
+
+            print(timer)
+            timer.save()
 
 def exec_lsim(args):
     from compiler import lsim
@@ -266,6 +338,7 @@ def exec_lemul(args):
         direc = path_handler.lscale_adp_dir()
 
     board = get_device(None)
+    batches = {}
     for dirname, subdirlist, filelist in \
         os.walk(direc):
         for adp_file in filelist:
@@ -299,6 +372,12 @@ def exec_lemul(args):
 
                     print(plot_file)
 
+                    if args.batch:
+                        phys_db = adp.metadata[ADPMetadata.Keys.RUNTIME_PHYS_DB]
+                        if not phys_db in batches:
+                            batches[phys_db] = []
+                        batches[phys_db].append((adp_file,adp,plot_file))
+                        continue
 
                     board = get_device(adp.metadata[ADPMetadata.Keys.RUNTIME_PHYS_DB])
                     lsim.simulate_adp(board,adp,plot_file, \
@@ -306,7 +385,25 @@ def exec_lemul(args):
                                       enable_intervals=not args.no_operating_range, \
                                       enable_physical_model= not args.no_physdb, \
                                       enable_model_error =not args.no_model_error, \
-                                      separate_figures=args.separate_figures)
+                                      separate_figures=args.separate_figures, \
+                                      reference=args.reference)
+
+    for phys_db,batch in batches.items():
+        board = get_device(phys_db)
+        adp_files = list(map(lambda b: b[0], batch))
+        ranking = lsim.simulate_adp_batch(board, \
+                                          list(map(lambda b: b[1], batch)), \
+                                          list(map(lambda b: b[2], batch)), \
+                                          samples=args.samples, \
+                                          enable_quantization=not args.no_quantize, \
+                                          enable_intervals=not args.no_operating_range, \
+                                          enable_physical_model= not args.no_physdb, \
+                                          enable_model_error =not args.no_model_error, \
+                                          separate_figures=args.separate_figures, \
+                                          seed=args.seed)
+        print("===== emulated error ranking [%s] =====" % phys_db)
+        for error,adp_idx,samp_idx in ranking:
+            print("%s sample=%d error=%f" % (adp_files[adp_idx],samp_idx,error))
 
 def print_runtime_stats(path_handler):
     lgraph = util.Timer.load('lgraph',path_handler)
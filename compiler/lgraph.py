@@ -25,6 +25,9 @@ from compiler.lgraph_pass.rules.kirch import KirchhoffRule
 from compiler.lgraph_pass.rules.lutfuse import FuseLUTRule
 from compiler.lgraph_pass.rules.flip import FlipSignRule
 import numpy as np
+import multiprocessing
+import pickle
+import io
 
 
 def get_laws(dev):
@@ -79,13 +82,102 @@ def combine_fragments(frags):
 
 
 
+def synthesize_fragments(board,compute_blocks,laws,variable,expr, \
+                         vadp_fragments,synth_depth):
+    # unification shuffles its options and the join identifiers show up in
+    # the goals, so every variable is searched from the same starting state.
+    # This keeps the fragments independent of which variables were
+    # synthesized before, and of which process synthesized them.
+    random.seed(variable)
+    vadplib.MultiPortVar.IDENT = 0
+    frags = []
+    print("> SYNTH %s = %s" % (variable,expr))
+    for vadp in synthlib.search(board, \
+                                compute_blocks,laws,variable,expr, \
+                                depth=synth_depth):
+        if len(frags) >= vadp_fragments:
+            break
+        frags.append(vadp)
+
+    return frags
+
+# hardware objects (blocks, ports, modes) and laws are shared between the
+# fragments, so they are pickled by reference and resolved against the
+# board on each end of the process pool.
+def _synth_shared_objects(board,laws):
+    objs = {}
+    for blk in board.blocks:
+        objs[("block",blk.name)] = blk
+        for coll_idx,coll in enumerate(blk.field_collections()):
+            for field in coll:
+                objs[("field",blk.name,coll_idx,field.name)] = field
+        for mode_idx,mode in enumerate(blk.modes):
+            objs[("mode",blk.name,mode_idx)] = mode
+
+    for law_idx,law in enumerate(laws):
+        objs[("law",law_idx)] = law
+
+    return objs
+
+class FragmentPickler(pickle.Pickler):
+
+    def __init__(self,fh,objs):
+        pickle.Pickler.__init__(self,fh)
+        self.ids = dict(map(lambda tup: (id(tup[1]),tup[0]), objs.items()))
+
+    def persistent_id(self,obj):
+        return self.ids.get(id(obj))
+
+class FragmentUnpickler(pickle.Unpickler):
+
+    def __init__(self,fh,objs):
+        pickle.Unpickler.__init__(self,fh)
+        self.objs = objs
+
+    def persistent_load(self,key):
+        return self.objs[key]
+
+# worker state, inherited by the forked synthesis processes
+_SYNTH_CONTEXT = None
+
+def _synth_worker(variable_expr):
+    board,compute_blocks,laws,vadp_fragments,synth_depth = _SYNTH_CONTEXT
+    variable,expr = variable_expr
+    frags = synthesize_fragments(board,compute_blocks,laws,variable,expr, \
+                                 vadp_fragments,synth_depth)
+    fh = io.BytesIO()
+    FragmentPickler(fh,_synth_shared_objects(board,laws)).dump(frags)
+    return fh.getvalue()
+
+def synthesize_parallel(board,compute_blocks,laws,prob, \
+                        vadp_fragments,synth_depth,jobs):
+    global _SYNTH_CONTEXT
+    _SYNTH_CONTEXT = (board,compute_blocks,laws,vadp_fragments,synth_depth)
+    variables = list(prob.variables())
+    work = list(map(lambda v: (v,prob.binding(v)), variables))
+    try:
+        ctx = multiprocessing.get_context("fork")
+        with ctx.Pool(processes=min(jobs,len(work))) as pool:
+            results = pool.map(_synth_worker,work,chunksize=1)
+    finally:
+        _SYNTH_CONTEXT = None
+
+    # results are ordered by variable, matching the serial run.
+    objs = _synth_shared_objects(board,laws)
+    fragments = {}
+    for variable,data in zip(variables,results):
+        fragments[variable] = FragmentUnpickler(io.BytesIO(data),objs).load()
+
+    return fragments
+
 def compile(board,prob,
             vadp_fragments=100, \
             synth_depth=12, \
             asm_frags=10, \
             vadps=1, \
             adps=1, \
-            routes=1):
+            routes=1, \
+            jobs=1):
 
     fragments = dict(map(lambda v: (v,[]), prob.variables()))
     compute_blocks = list(filter(lambda blk: \
@@ -94,18 +186,19 @@ def compile(board,prob,
 
     # perform synthesis
     laws = get_laws(board)
-    fragments = {}
-    for variable in prob.variables():
-        fragments[variable] = []
-        expr = prob.binding(variable)
-        print("> SYNTH %s = %s" % (variable,expr))
-        for vadp in synthlib.search(board, \
-                                    compute_blocks,laws,variable,expr, \
-                                    depth=synth_depth):
-            if len(fragments[variable]) >= vadp_fragments:
-                break
-            fragments[variable].append(vadp)
+    if jobs > 1:
+        fragments = synthesize_parallel(board,compute_blocks,laws,prob, \
+                                        vadp_fragments,synth_depth,jobs)
+    else:
+        fragments = {}
+        for variable in prob.variables():
+            fragments[variable] = synthesize_fragments(board,compute_blocks, \
+                                                       laws,variable, \
+                                                       prob.binding(variable), \
+                                                       vadp_fragments, \
+                                                       synth_depth)
 
+    for variable in prob.variables():
         print("VAR %s: %d fragments"  \
               % (variable,len(fragments[variable])))
         if len(fragments[variable]) == 0:
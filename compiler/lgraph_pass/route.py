@@ -3,15 +3,19 @@ import compiler.lgraph_pass.route_solver as route_solver
 import compiler.lgraph_pass.route_problem as routeproblib
 import hwlib.device as devlib
 import hwlib.block as blocklib
+import time
 
 class LocAssignmentStack:
 
   class Entry:
 
     def __init__(self,assigns):
-      assert(isinstance(assigns,routeproblib.LocAssignments))
+      assert(assigns is None or \
+             isinstance(assigns,routeproblib.LocAssignments))
       self.assigns = assigns
       self.negations = []
+      # routing solver for the next view, given this assignment
+      self.solver = None
 
     def add_negation(self,neg):
       assert(isinstance(neg,routeproblib.LocAssignments))
@@ -19,6 +23,8 @@ class LocAssignmentStack:
 
   def __init__(self):
     self._stack =  []
+    self.root = LocAssignmentStack.Entry(None)
+    self.solvers = []
 
   @property
   def ptr(self):
@@ -30,6 +36,12 @@ class LocAssignmentStack:
     else:
       return self._stack[-1]
 
+  def parent(self):
+    if len(self._stack) == 0:
+      return self.root
+    else:
+      return self._stack[-1]
+
   def push(self,v):
     assert(isinstance(v,LocAssignmentStack.Entry))
     assert(not v is None)
@@ -37,13 +49,15 @@ class LocAssignmentStack:
 
   def pop(self):
     if len(self._stack) == 0:
-      return
+      return None
 
+    entry = self._stack[-1]
     tmp = self._stack[:-1]
     self._stack = tmp
+    return entry
 
 def routing_problem(board,view,vadp,entry):
-  if not entry is None:
+  if not entry is None and not entry.assigns is None:
     prob = routeproblib.RoutingProblem(board,view, \
                                        entry.assigns, \
                                        entry.negations)
@@ -178,25 +192,52 @@ def finalize(board,vadp,assigns):
 
   return new_vadp
 
+# the routing problem for a view only depends on the assignment of the
+# previous view, so each solver is built once and reused with the negations
+# of the solutions found so far.
 def route_next_solution(board,vadp,assign_stack):
   views = board.layout.views
-  while assign_stack.ptr <= len(views)-1 and assign_stack.ptr >= 0:
+  while assign_stack.ptr <= len(views)-1:
     print("--> routing view %s" % views[assign_stack.ptr])
     view = views[assign_stack.ptr]
-    # build routing problem
-    prob = routing_problem(board,view,vadp, \
-                           assign_stack.top())
-    assigns = route_solver.solve(prob)
+    parent = assign_stack.parent()
+    if parent.solver is None:
+      start = time.time()
+      prob = routing_problem(board,view,vadp,parent)
+      parent.solver = route_solver.RoutingSolver(prob)
+      # the build time covers the routing problem and its ILP
+      parent.solver.build_time = time.time() - start
+      assign_stack.solvers.append(parent.solver)
+
+    assigns = parent.solver.solve(parent.negations)
+    print("[route] %s" % parent.solver)
     if assigns is None:
-      assign_stack.pop()
+      if assign_stack.ptr == 0:
+        return None
+
+      # backtrack and exclude the assignment from the parent view
+      failed = assign_stack.pop()
+      assign_stack.parent().add_negation(failed.assigns)
     else:
-      assert(not assigns is None)
       assign_stack.push(LocAssignmentStack.Entry(assigns))
 
-  if assign_stack.top() is None:
-    return None
-  else:
-    return assign_stack.top()
+  return assign_stack.top()
+
+def print_route_timing(assign_stack):
+  summary = {}
+  for solver in assign_stack.solvers:
+    view = solver.prob.view
+    if not view in summary:
+      summary[view] = [0,0.0,0.0,0]
+    summary[view][0] += 1
+    summary[view][1] += solver.build_time
+    summary[view][2] += solver.solve_time
+    summary[view][3] += solver.n_solves
+
+  print("----- routing time -----")
+  for view,(n_probs,build_time,solve_time,n_solves) in summary.items():
+    print("view=%s problems=%d build=%.3fs solves=%d solve=%.3fs" % \
+          (view,n_probs,build_time,n_solves,solve_time))
 
 
 
@@ -212,9 +253,11 @@ def route(board,vadp):
   while has_solution:
     result = route_next_solution(board,vadp,assign_stack)
     if not result is None:
+      print_route_timing(assign_stack)
       yield finalize(board,vadp,result.assigns)
       # remove result
       assign_stack.pop()
-      assign_stack.top().add_negation(result.assigns)
+      assign_stack.parent().add_negation(result.assigns)
     else:
+      print_route_timing(assign_stack)
       has_solution = False
@@ -11,10 +11,19 @@ class BlockInstanceResource:
     self.block = block
     self.loc = loc
 
+  @property
+  def key(self):
+    return (self.block.name,tuple(self.loc.address))
+
   def __repr__(self):
     return "res(%s@%s)" % (self.block.name, self.loc)
 
+  def __hash__(self):
+    return hash(self.key)
+
   def __eq__(self,other):
+    if isinstance(other,BlockInstanceResource):
+      return self.key == other.key
     return str(self) == str(other)
 
   def limit(self):
@@ -47,6 +56,21 @@ class ConnectionResource:
                           self.dev.layout.instances(self.dest_block.name))))
     return min(n_src,n_dest)
 
+  @property
+  def key(self):
+    return (self.source_block.name,tuple(self.source_loc.address), \
+            self.source_port.name, \
+            self.dest_block.name,tuple(self.dest_loc.address), \
+            self.dest_port.name)
+
+  def __hash__(self):
+    return hash(self.key)
+
+  def __eq__(self,other):
+    if isinstance(other,ConnectionResource):
+      return self.key == other.key
+    return str(self) == str(other)
+
   def __repr__(self):
     return "res((%s,%s,%s) -> (%s,%s,%s))" % (
       self.source_block.name,self.source_loc,self.source_port.name,
@@ -182,6 +206,10 @@ class RoutingProblem:
     self.identifier_assigns = []
     self.conn_assigns = []
     self.resources = []
+    # hashed indexes over the lists above. The lists preserve
+    # insertion order, which the solver relies on.
+    self._resource_set = set()
+    self._assigns_by_ident = {}
     self.valid = True
     self.message = None
     self.assignments = assignments
@@ -192,8 +220,16 @@ class RoutingProblem:
     self.valid = False
 
 
+  # candidate variables are looked up by (block,ident) and then
+  # matched by location.
   def _get_matching_instance_variable(self,variables ,v):
     assert(isinstance(v,BlockIdentifierAssignVar))
+    key = (v.block.name,v.ident)
+    if isinstance(variables,LocAssignments):
+      variables = [variables.by_ident[key]] \
+                  if key in variables.by_ident else []
+    elif isinstance(variables,dict):
+      variables = variables.get(key,[])
 
     for assign in variables:
       assert(isinstance(assign,BlockIdentifierAssignVar))
@@ -212,19 +248,23 @@ class RoutingProblem:
       not self._get_matching_instance_variable(self.assignments,v) is None
 
 
+  def get_negation(self,neg):
+    prev_assigns = []
+    for assign in neg:
+      assert(isinstance(assign,BlockIdentifierAssignVar))
+      mvar = self._get_matching_instance_variable(self._assigns_by_ident, \
+                                                  assign)
+      if not mvar is None:
+        prev_assigns.append(mvar)
+      else:
+        input("could not find matching var")
+        continue
+
+    return prev_assigns
+
   def get_negations(self):
     for neg in self.negations:
-      prev_assigns = []
-      for assign in neg:
-        assert(isinstance(assign,BlockIdentifierAssignVar))
-        mvar = self._get_matching_instance_variable(self.identifier_assigns,assign)
-        if not mvar is None:
-          prev_assigns.append(mvar)
-        else:
-          input("could not find matching var")
-          continue
-
-      yield prev_assigns
+      yield self.get_negation(neg)
 
 
   def add_virtual_instance(self,block,identifier):
@@ -247,22 +287,23 @@ class RoutingProblem:
                                         loc)
       self.identifier_assigns \
           .append(assign)
+      self._assigns_by_ident.setdefault((block.name,identifier),[]) \
+                            .append(assign)
+      self.add_resources(assign)
 
-      for res in assign.resources():
-            if not res in self.resources:
-              self.resources.append(res)
+  def add_resources(self,assign):
+    for res in assign.resources():
+      if not res in self._resource_set:
+        self._resource_set.add(res)
+        self.resources.append(res)
 
 
 
   def add_virtual_conn(self,sblk,sident,sport, \
                        dblk,dident,dport):
 
-    source_idents = list(filter(lambda v: v.block.name == sblk.name and \
-                           v.ident == sident,
-                           self.identifier_assigns))
-    dest_idents = list(filter(lambda v: v.block.name == dblk.name and \
-                           v.ident == dident,
-                           self.identifier_assigns))
+    source_idents = self._assigns_by_ident.get((sblk.name,sident),[])
+    dest_idents = self._assigns_by_ident.get((dblk.name,dident),[])
 
     n_paths = 0
     for src_assign in source_idents:
@@ -289,9 +330,7 @@ class RoutingProblem:
                    )
           n_paths += 1
           self.conn_assigns.append(assign)
-          for res in assign.resources():
-            if not res in self.resources:
-              self.resources.append(res)
+          self.add_resources(assign)
 
     if n_paths == 0:
       self.fail(" no paths for conn <%s,%d,%s> -> <%s,%d,%s>" \
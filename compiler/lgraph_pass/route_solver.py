@@ -1,4 +1,5 @@
 import pulp
+import time
 import compiler.lgraph_pass.route_problem as routelib
 
 def groupby(keyfun,lst):
@@ -71,96 +72,145 @@ def ilp_and(ilp,c1,c2,name):
   return tempvar
 
 
-def solve(prob):
-  ilp = pulp.LpProblem("routing",pulp.LpMinimize)
-  if not prob.valid:
-    print("failed during problem construction: %s" % prob.message)
-    return None
-
-  ident_assign_by_name = {}
-  for ident_assign in prob.identifier_assigns:
-    ident_assign.ilpvar = pulp.LpVariable(str(ident_assign),
-                                          cat='Binary')
-    ident_assign_by_name[str(ident_assign)] = ident_assign
-
-
-  for conn_assign in prob.conn_assigns:
-    conn_assign.ilpvar = pulp.LpVariable(str(conn_assign),
-                                         cat='Binary')
-
-
-  resource_by_name = {}
-  for resource in prob.resources:
-    resource.ilpvar = pulp.LpVariable(str(resource),
-                                      lowBound=0,
-                                      upBound=resource.limit(),
-                                      cat='Integer')
-    resource_by_name[str(resource)] = resource
-
-  # objective function: minimize resource consumption
-  ilp += sum(map(lambda r: r.ilpvar, prob.resources))
-
-  # each identifier is assigned to exactly one instance
-  for group_name,idents in \
-      group_inst_assign_by_block_identifier(prob.identifier_assigns):
-    ilp += sum(map(lambda ident: ident.ilpvar, idents)) == 1,group_name
-
-  # each connection identifier is assigned to exactly one instance
-  for group_name,idents in \
-      group_conn_assign_by_conn_identifier(prob.conn_assigns):
-    ilp += sum(map(lambda ident: ident.ilpvar, idents)) == 1,group_name
-
-  # a connection assignment implies instance assignments
-  for conn_assign in prob.conn_assigns:
-    src_assign_key = routelib.BlockIdentifierAssignVar(conn_assign.dev, \
-                                             conn_assign.source_block,
-                                             conn_assign.source_ident,
-                                             conn_assign.source_loc)
-    dest_assign_key = routelib.BlockIdentifierAssignVar(conn_assign.dev, \
-                                                conn_assign.dest_block,
-                                              conn_assign.dest_ident,
-                                                conn_assign.dest_loc)
-    src_assign = ident_assign_by_name[str(src_assign_key)]
-    dest_assign = ident_assign_by_name[str(dest_assign_key)]
-
-    name = str(conn_assign)+":instances"
-    and_conn = ilp_and(ilp, \
-                       src_assign.ilpvar, \
-                       dest_assign.ilpvar, \
-                       name+".and")
-    ilp_implies(ilp,conn_assign.ilpvar,and_conn,name+".implies")
-
-  # each resource has a limited number quantity
-  for resource_name,idents in \
-      group_assign_by_resource(prob.identifier_assigns \
-                                       + prob.conn_assigns):
-
-      resource_var = resource_by_name[resource_name].ilpvar
-      ilp += sum(map(lambda ident: ident.ilpvar, idents)) \
-             == resource_var,resource_name
-
-
-  # don't repeat old models
-  for idx,neg in enumerate(prob.get_negations()):
-    if len(neg) > 1:
-      total_assigns = len(neg)
-      assign_clause = sum(map(lambda ident: ident.ilpvar, neg)) + 1
-      print(assign_clause <= total_assigns)
-      ilp += assign_clause <= total_assigns,"negate-model-%d" % idx
-
-
-  ilp.solve()
-  status = pulp.LpStatus[ilp.status]
-  if status == "Optimal":
-    assigns = routelib.LocAssignments()
+class RoutingSolver:
+
+  def __init__(self,prob):
+    self.prob = prob
+    self.ilp = None
+    self.n_negations = 0
+    self.build_time = 0.0
+    self.solve_time = 0.0
+    self.n_solves = 0
+    self.last_solution = None
+
+    start = time.time()
+    if prob.valid:
+      self._build()
+    self.build_time = time.time() - start
+
+  def _build(self):
+    prob = self.prob
+    ilp = pulp.LpProblem("routing",pulp.LpMinimize)
+    ident_assign_by_name = {}
     for ident_assign in prob.identifier_assigns:
-      if ident_assign.ilpvar.varValue == 1.0:
-        assigns.add(ident_assign)
+      ident_assign.ilpvar = pulp.LpVariable(str(ident_assign),
+                                            cat='Binary')
+      ident_assign_by_name[str(ident_assign)] = ident_assign
+
+
+    for conn_assign in prob.conn_assigns:
+      conn_assign.ilpvar = pulp.LpVariable(str(conn_assign),
+                                           cat='Binary')
+
+
+    resource_by_name = {}
+    for resource in prob.resources:
+      resource.ilpvar = pulp.LpVariable(str(resource),
+                                        lowBound=0,
+                                        upBound=resource.limit(),
+                                        cat='Integer')
+      resource_by_name[str(resource)] = resource
+
+    # objective function: minimize resource consumption
+    ilp += sum(map(lambda r: r.ilpvar, prob.resources))
+
+    # each identifier is assigned to exactly one instance
+    for group_name,idents in \
+        group_inst_assign_by_block_identifier(prob.identifier_assigns):
+      ilp += sum(map(lambda ident: ident.ilpvar, idents)) == 1,group_name
+
+    # each connection identifier is assigned to exactly one instance
+    for group_name,idents in \
+        group_conn_assign_by_conn_identifier(prob.conn_assigns):
+      ilp += sum(map(lambda ident: ident.ilpvar, idents)) == 1,group_name
+
+    # a connection assignment implies instance assignments
     for conn_assign in prob.conn_assigns:
-      if conn_assign.ilpvar.varValue == 1.0:
-        assigns.add_conn(conn_assign)
+      src_assign_key = routelib.BlockIdentifierAssignVar(conn_assign.dev, \
+                                               conn_assign.source_block,
+                                               conn_assign.source_ident,
+                                               conn_assign.source_loc)
+      dest_assign_key = routelib.BlockIdentifierAssignVar(conn_assign.dev, \
+                                                  conn_assign.dest_block,
+                                                conn_assign.dest_ident,
+                                                  conn_assign.dest_loc)
+      src_assign = ident_assign_by_name[str(src_assign_key)]
+      dest_assign = ident_assign_by_name[str(dest_assign_key)]
+
+      name = str(conn_assign)+":instances"
+      and_conn = ilp_and(ilp, \
+                         src_assign.ilpvar, \
+                         dest_assign.ilpvar, \
+                         name+".and")
+      ilp_implies(ilp,conn_assign.ilpvar,and_conn,name+".implies")
+
+    # each resource has a limited number quantity
+    for resource_name,idents in \
+        group_assign_by_resource(prob.identifier_assigns \
+                                         + prob.conn_assigns):
+
+        resource_var = resource_by_name[resource_name].ilpvar
+        ilp += sum(map(lambda ident: ident.ilpvar, idents)) \
+               == resource_var,resource_name
+
+    self.ilp = ilp
+
+  # don't repeat old models. Negations are only ever appended, so
+  # only the cuts we haven't seen yet are added to the model.
+  def add_negations(self,negations):
+    for neg in negations[self.n_negations:]:
+      prev_assigns = self.prob.get_negation(neg)
+      if len(prev_assigns) > 1:
+        total_assigns = len(prev_assigns)
+        assign_clause = sum(map(lambda ident: ident.ilpvar, prev_assigns)) + 1
+        self.ilp += assign_clause <= total_assigns, \
+          "negate-model-%d" % self.n_negations
+
+      self.n_negations += 1
+
+  def _warm_start(self):
+    if self.last_solution is None:
+      return False
+
+    for var in self.ilp.variables():
+      if var.name in self.last_solution:
+        var.setInitialValue(self.last_solution[var.name])
+    return True
+
+  def solve(self,negations=[]):
+    if not self.prob.valid:
+      print("failed during problem construction: %s" % self.prob.message)
+      return None
+
+    start = time.time()
+    self.add_negations(negations)
+    warm_start = self._warm_start()
+    self.ilp.solve(pulp.PULP_CBC_CMD(warmStart=warm_start))
+    self.solve_time += time.time() - start
+    self.n_solves += 1
+
+    status = pulp.LpStatus[self.ilp.status]
+    if status == "Optimal":
+      self.last_solution = dict(map(lambda v: (v.name,v.varValue), \
+                                    self.ilp.variables()))
+      prob = self.prob
+      assigns = routelib.LocAssignments()
+      for ident_assign in prob.identifier_assigns:
+        if ident_assign.ilpvar.varValue == 1.0:
+          assigns.add(ident_assign)
+      for conn_assign in prob.conn_assigns:
+        if conn_assign.ilpvar.varValue == 1.0:
+          assigns.add_conn(conn_assign)
+
+      return assigns
+    else:
+      print("[WARN] Failed with status <%s>" % status)
+      return None
+
+  def __repr__(self):
+    return "view=%s build=%.3fs solve=%.3fs solves=%d" % \
+      (self.prob.view,self.build_time,self.solve_time,self.n_solves)
 
-    return assigns
-  else:
-    print("[WARN] Failed with status <%s>" % status)
-    return None
+def solve(prob):
+  solver = RoutingSolver(prob)
+  return solver.solve(prob.negations)
@@ -7,7 +7,7 @@ import ops.base_op as oplib
 import ops.generic_op as genoplib
 import ops.lambda_op as lambdlib
 import numpy as np
-from functools import cmp_to_key
+import heapq
 
 def make_initial_tableau(blocks,laws,variable,expr):
   tab = Tableau()
@@ -245,12 +245,6 @@ def derive_tableaus(dev,tableau,goal):
       raise Exception("unknown relation")
 
 
-def get_valid_tableaus(frontier,depth):
-  for tab,idx in frontier:
-    assert(not tab.success())
-    if idx < depth:
-      yield tab,idx
-
 def tableau_stats(tab,depth):
   cost = 0.0
   for goal in tab.goals:
@@ -261,29 +255,56 @@ def tableau_stats(tab,depth):
   goal_size = len(tab.goals)
   return cost,vadp_size,goal_size,depth
 
-def _order_tableaus(tab1,tab2):
-  cost1,vadp_size1,goal_size1,depth1 = tableau_stats(*tab1)
-  cost2,vadp_size2,goal_size2,depth2 = tableau_stats(*tab2)
-  if cost1 < cost2:
-    return -1
-  elif cost1 > cost2:
-    return 1
-  else:
-    if vadp_size1 < vadp_size2:
-      return -1
-    elif vadp_size1 > vadp_size2:
-      return 1
-    else:
-      if goal_size1 < goal_size2:
-        return -1
-      elif goal_size1 > goal_size2:
-        return 1
-      else:
-        return 0
+class TableauFrontier:
+
+  def __init__(self,depth):
+    self.depth = depth
+    self._heap = []
+    self._visited = {}
+    self._count = 0
+    self.expansions = 0
+    self.duplicates = 0
+    self.max_size = 0
+
+  # returns false if an identical tableau was already reached with at
+  # least as much depth remaining.
+  def visit(self,tab,depth):
+    # solutions are complete, so how deep they were found is irrelevant.
+    if tab.success():
+      depth = 0
+
+    key = tab.canonical()
+    if key in self._visited and self._visited[key] <= depth:
+      self.duplicates += 1
+      return False
+
+    self._visited[key] = depth
+    return True
+
+  def push(self,tab,depth):
+    assert(not tab.success())
+    if depth >= self.depth:
+      return
 
-def sort_tableaus(tabs):
-  tab_key = cmp_to_key(_order_tableaus)
-  tabs.sort(key=tab_key)
+    # tableaus are ordered by cost, vadp size and goal count. Ties are
+    # broken by insertion order.
+    cost,vadp_size,goal_size,_ = tableau_stats(tab,depth)
+    heapq.heappush(self._heap,(cost,vadp_size,goal_size,self._count, \
+                               tab,depth))
+    self._count += 1
+    self.max_size = max(self.max_size,len(self._heap))
+
+  def pop(self):
+    _,_,_,_,tab,depth = heapq.heappop(self._heap)
+    self.expansions += 1
+    return tab,depth
+
+  def __len__(self):
+    return len(self._heap)
+
+  def __repr__(self):
+    return "expansions=%d duplicates=%d frontier=%d max-frontier=%d" % \
+      (self.expansions,self.duplicates,len(self._heap),self.max_size)
 
 def tableau_complexity(tableau,depth):
   cost = 0.0
@@ -301,20 +322,6 @@ def goal_complexity(goal):
 
   return goal.expr.count()
 
-def select_tableau(frontier,complexity):
-  sort_tableaus(frontier)
-  tab,tab_depth = frontier[0]
-  return tab,tab_depth,frontier[1:]
-  '''
-  penalty = list(map(lambda tab: complexity(*tab), frontier))
-  idx = np.argmin(penalty)
-  tableau,tableau_depth = frontier[idx]
-  other_tableaus = list(map(lambda i: frontier[i], \
-                            filter(lambda i: i != idx, \
-                                   range(0,len(frontier)))))
-  return tableau,tableau_depth,other_tableaus
-  '''
-
 def select_goal(goals,complexity):
   penalty = list(map(lambda goal: complexity(goal), goals))
   idx = np.argmin(penalty)
@@ -350,59 +357,61 @@ def search(dev,blocks,laws,variable,expr,depth=20):
   tableau = make_initial_tableau(blocks,laws, \
                                  variable,expr)
 
-  frontier = [(tableau,0)]
+  frontier = TableauFrontier(depth)
+  frontier.visit(tableau,0)
+  frontier.push(tableau,0)
 
   #debug = True
   debug = False
-  next_frontier = []
-  valid_tableaus = list(get_valid_tableaus(frontier,depth))
   solutions = 0
-  while len(valid_tableaus) > 0:
-    tableau,tab_depth,other_tableaus = select_tableau(valid_tableaus, \
-                                                      tableau_complexity)
-    next_frontier = other_tableaus
-    goal,other_goals = select_goal(tableau.goals, \
-                       goal_complexity)
-    if debug:
-      print("\n\n\n")
-      print("-- depth=%d --" % tab_depth)
-      print(">> %s" % goal)
-      for g in other_goals:
-        print("   %s" % g)
-      print("------")
-      input()
-
-    for new_tableau in derive_tableaus(dev,tableau,goal):
-      simpl_tableau = simplify_tableau(new_tableau)
-      if simpl_tableau.success():
-        if debug:
-          print("-- [[solution]] depth=%d  --" % (tab_depth))
-          print(simpl_tableau.goals)
-          input()
-
-        simpl_tableau = simplify_tableau(new_tableau, \
-                                         simplify_laws=True)
-        if not is_concrete_vadp(simpl_tableau.vadp, \
-                                allow_virtual=True):
-          for stmt in simpl_tableau.vadp:
-            print("  %s" % stmt)
-          raise Exception("vadp tableau is not concrete!")
-
-        yield simpl_tableau.vadp
-        print(simpl_tableau)
-        print("SUCCESS")
-        solutions += 1
-      else:
-        next_frontier.append((simpl_tableau,tab_depth + 1))
-        if debug:
-          print("-- depth=%d cost=%f --" % (tab_depth+1, \
-                                            tableau_complexity(simpl_tableau,tab_depth+1)))
-          for goal in simpl_tableau.goals:
-            print(goal)
-          print("--------------")
-
-    valid_tableaus = list(get_valid_tableaus(next_frontier,depth))
-    print("number tableaus: %d" % len(valid_tableaus))
-
-  print("Solutions for <%s=%s>: %d" % (variable,expr,solutions))
-
+  try:
+    while len(frontier) > 0:
+      tableau,tab_depth = frontier.pop()
+      goal,other_goals = select_goal(tableau.goals, \
+                         goal_complexity)
+      if debug:
+        print("\n\n\n")
+        print("-- depth=%d --" % tab_depth)
+        print(">> %s" % goal)
+        for g in other_goals:
+          print("   %s" % g)
+        print("------")
+        input()
+
+      for new_tableau in derive_tableaus(dev,tableau,goal):
+        simpl_tableau = simplify_tableau(new_tableau)
+        if not frontier.visit(simpl_tableau,tab_depth + 1):
+          continue
+
+        if simpl_tableau.success():
+          if debug:
+            print("-- [[solution]] depth=%d  --" % (tab_depth))
+            print(simpl_tableau.goals)
+            input()
+
+          simpl_tableau = simplify_tableau(new_tableau, \
+                                           simplify_laws=True)
+          if not is_concrete_vadp(simpl_tableau.vadp, \
+                                  allow_virtual=True):
+            for stmt in simpl_tableau.vadp:
+              print("  %s" % stmt)
+            raise Exception("vadp tableau is not concrete!")
+
+          yield simpl_tableau.vadp
+          print(simpl_tableau)
+          print("SUCCESS")
+          solutions += 1
+        else:
+          frontier.push(simpl_tableau,tab_depth + 1)
+          if debug:
+            print("-- depth=%d cost=%f --" % (tab_depth+1, \
+                                              tableau_complexity(simpl_tableau,tab_depth+1)))
+            for goal in simpl_tableau.goals:
+              print(goal)
+            print("--------------")
+
+      print("number tableaus: %d" % len(frontier))
+
+    print("Solutions for <%s=%s>: %d" % (variable,expr,solutions))
+  finally:
+    print("[synth] <%s> %s" % (variable,frontier))
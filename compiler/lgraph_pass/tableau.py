@@ -182,6 +182,13 @@ class Tableau:
       return True
     return goal.type == self.type
 
+  # canonical form of the tableau, which does not depend on the order
+  # the goals, relations and statements were derived in.
+  def canonical(self):
+    return (tuple(sorted(map(lambda goal: str(goal), self.goals))), \
+            tuple(sorted(map(lambda rel: str(rel), self.relations))), \
+            tuple(sorted(map(lambda stmt: str(stmt), self.vadp))))
+
   def __repr__(self):
     st = "<<< GOALS >>>\n"
     for goal in self.goals:
@@ -92,7 +92,10 @@ def scale(dev, program, adp, \
           scale_method=scalelib.ScaleMethod.IDEAL, \
           calib_obj=None, \
           no_scale=False, \
-          one_mode=False):
+          one_mode=False, \
+          solver="z3", \
+          min_distance=1, \
+          portfolio=1):
 
   def set_metadata(adp):
     adp.metadata.set(adplib.ADPMetadata.Keys.LSCALE_SCALE_METHOD, \
@@ -128,8 +131,21 @@ def scale(dev, program, adp, \
     yield adp
     return
 
+  if solver == "milp":
+    import compiler.lscale_pass.lscale_milp as lscale_milp
+    if portfolio > 1:
+      raise Exception("portfolio solving is only supported by the z3 solver")
+    solutions = lscale_milp.solve(dev,adp,cstr_prob,obj, \
+                                  min_distance=min_distance)
+  elif solver == "z3":
+    solutions = lscale_solver.solve(dev,adp,cstr_prob,obj, \
+                                    min_distance=min_distance, \
+                                    portfolio=portfolio)
+  else:
+    raise Exception("unknown solver: %s" % solver)
+
   print("<<< solving >>>")
-  for adp in lscale_solver.solve(dev,adp,cstr_prob,obj):
+  for adp in solutions:
     set_metadata(adp)
     for cfg in adp.configs:
       assert(cfg.complete())
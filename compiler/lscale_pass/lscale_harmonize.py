@@ -27,6 +27,12 @@ def get_term(exprs,idx):
         args.append(expr.arg(idx))
     return args
 
+# number the gain variables of each scaling problem from zero, so the
+# problem doesn't depend on the problems solved before it.
+def reset_gain_vars():
+    global GAIN_ID
+    GAIN_ID = 0
+
 def gain_var(idx):
     global GAIN_ID
     varname = (":gain(%d)" % idx)
@@ -0,0 +1,215 @@
+import compiler.lscale_pass.lscale_ops as scalelib
+import compiler.lscale_pass.lscale_solver as lscale_solver
+import pulp
+
+'''
+MILP backend for the scaling problem. In log space, every monomial
+constraint is linear, so the constraint list lowers to a mixed integer
+linear program: each mode variable becomes one binary per mode, with
+exactly one mode selected, and the mode implications become linear
+equalities (or big-M constraints if only some modes imply a value). The
+program is solved with CBC through PuLP.
+'''
+
+# bound on the distance between a log-space variable and a value implied
+# by a mode that is not selected.
+BIG_M = 1000.0
+
+class MILPEnv:
+
+  def __init__(self):
+    self.prob = pulp.LpProblem("lscale",pulp.LpMinimize)
+    self.reals = {}
+    self.modes = {}
+    self.implies = {}
+    self.failed = False
+    self._index = 0
+
+  def _var(self,cat="Continuous"):
+    name = "v%d" % self._index
+    self._index += 1
+    if cat == "Binary":
+      return pulp.LpVariable(name,cat=cat)
+    return pulp.LpVariable(name)
+
+  def decl_real(self,name):
+    if not name in self.reals:
+      self.reals[name] = self._var()
+
+  def decl_mode(self,name,n_modes):
+    if not name in self.modes:
+      self.modes[name] = list(map(lambda _: self._var("Binary"), \
+                                  range(n_modes)))
+      self.prob += pulp.lpSum(self.modes[name]) == 1
+
+  def fail(self,msg):
+    print("fail: %s" % msg)
+    self.failed = True
+
+  def cstr(self,cstr):
+    self.prob += cstr
+
+class MILPSymbolTable(lscale_solver.SymbolTable):
+
+  def declare(self,v):
+    if not str(v) in self.symbols:
+      self.symbols[str(v)] = v
+      if isinstance(v,scalelib.ModeVar):
+        self.smtenv.decl_mode(str(v),len(v.modes))
+      else:
+        self.smtenv.decl_real(str(v))
+
+def monomial_to_milp_expr(env,expr):
+  if isinstance(expr,scalelib.SCVar):
+    return env.reals[str(expr)]
+
+  result = pulp.LpAffineExpression(constant=lscale_solver.take_log(expr.coeff))
+  for term,expo in expr.terms:
+    result += expo*env.reals[str(term)]
+  return result
+
+def scale_cstr_to_milp_cstr(env,cstr):
+  if isinstance(cstr,scalelib.SCEq):
+    env.cstr(monomial_to_milp_expr(env,cstr.lhs) == \
+             monomial_to_milp_expr(env,cstr.rhs))
+
+  elif isinstance(cstr,scalelib.SCLTE):
+    env.cstr(monomial_to_milp_expr(env,cstr.lhs) <= \
+             monomial_to_milp_expr(env,cstr.rhs))
+
+  elif isinstance(cstr,scalelib.SCIntervalCover):
+    if not cstr.valid():
+      print("invalid: %s" % cstr)
+      env.fail("invalid: %s" % cstr)
+      return
+
+    (triv_lb,triv_ub) = cstr.trivial()
+    if not triv_lb:
+      lhs = cstr.submonom.lower.copy()
+      lhs.coeff = lhs.coeff*abs(cstr.subinterval.lower)
+      rhs = cstr.monom.lower.copy()
+      rhs.coeff = rhs.coeff*abs(cstr.interval.lower)
+      env.cstr(monomial_to_milp_expr(env,lhs) <= \
+               monomial_to_milp_expr(env,rhs))
+
+    if not triv_ub:
+      lhs = cstr.submonom.upper.copy()
+      lhs.coeff = lhs.coeff*abs(cstr.subinterval.upper)
+      rhs = cstr.monom.upper.copy()
+      rhs.coeff = rhs.coeff*abs(cstr.interval.upper)
+      env.cstr(monomial_to_milp_expr(env,lhs) <= \
+               monomial_to_milp_expr(env,rhs))
+
+  elif isinstance(cstr,scalelib.SCModeImplies):
+    modes = list(cstr.mode_var.modes)
+    if not cstr.mode in modes:
+      return
+
+    # implications are lowered together once the whole list is read
+    key = (str(cstr.mode_var),str(cstr.dep_var))
+    if not key in env.implies:
+      env.implies[key] = {}
+    logval = lscale_solver.var_value_to_logval(cstr.dep_var,cstr.value)
+    env.implies[key].setdefault(modes.index(cstr.mode),[]).append(logval)
+
+  elif isinstance(cstr,scalelib.SCSubsetOfModes):
+    modes = list(cstr.mode_var.modes)
+    for m in cstr.valid_modes:
+      if not m in modes:
+        raise Exception("mode <%s> not in %s" % (str(m),str(cstr.modes)))
+
+    for index,binvar in enumerate(env.modes[str(cstr.mode_var)]):
+      if not modes[index] in cstr.valid_modes:
+        env.cstr(binvar == 0)
+
+  else:
+    raise Exception("not implemented: %s <%s>" % (cstr,cstr.__class__.__name__))
+
+def mode_implications_to_milp_cstrs(env):
+  for (mode_name,dep_name),values in env.implies.items():
+    binvars = env.modes[mode_name]
+    dep_var = env.reals[dep_name]
+    # a mode that implies two different values cannot be selected
+    for index,logvals in values.items():
+      if max(logvals)-min(logvals) > 1e-9:
+        env.cstr(binvars[index] == 0)
+
+    if len(values) == len(binvars):
+      env.cstr(dep_var == pulp.lpSum(map(lambda tup: tup[1][0]*binvars[tup[0]], \
+                                         values.items())))
+    else:
+      for index,logvals in values.items():
+        env.cstr(dep_var - logvals[0] <= BIG_M*(1-binvars[index]))
+        env.cstr(logvals[0] - dep_var <= BIG_M*(1-binvars[index]))
+
+class MILPSolutionGenerator:
+
+  def __init__(self,dev,adp,symtbl,env,objective,min_distance=1):
+    self.dev = dev
+    self.adp = adp
+    self.symtbl = symtbl
+    self.env = env
+    self.min_distance = min_distance
+    self.env.prob += objective
+    self.solver = pulp.PULP_CBC_CMD(msg=False)
+
+  def solutions(self):
+    adp = self.get_solution()
+    while not adp is None:
+      yield adp
+      adp = self.get_solution()
+
+  def negate_model(self,model):
+    # at least <min_distance> of the mode variables take another mode
+    selected = list(map(lambda tup: self.env.modes[tup[0]][int(tup[1])], \
+                        model.items()))
+    distance = max(1,min(self.min_distance,len(selected)))
+    self.env.cstr(pulp.lpSum(selected) <= len(selected)-distance)
+
+  def get_solution(self):
+    if self.env.failed:
+      print("no solution..")
+      return None
+
+    self.env.prob.solve(self.solver)
+    status = pulp.LpStatus[self.env.prob.status]
+    if status != "Optimal":
+      print("no solution.. (%s)" % status)
+      return None
+    else:
+      print("found solution!")
+
+    result = {}
+    for name,var in self.env.reals.items():
+      result[name] = var.varValue
+    for name,binvars in self.env.modes.items():
+      result[name] = max(range(len(binvars)), \
+                         key=lambda idx: binvars[idx].varValue)
+
+    adp,model_to_negate = lscale_solver.translate_solution(self.dev,self.adp, \
+                                                           self.symtbl,result)
+    # without a choice of modes there is no other solution
+    if len(model_to_negate) == 0:
+      self.env.failed = True
+    else:
+      self.negate_model(model_to_negate)
+    return adp
+
+def solve(dev,adp,cstrs,objective_fun,min_distance=1):
+  env = MILPEnv()
+  symtbl = MILPSymbolTable(env)
+  for cstr in cstrs:
+    for v in cstr.vars():
+      symtbl.declare(v)
+
+  for cstr in cstrs:
+    scale_cstr_to_milp_cstr(env,cstr)
+  mode_implications_to_milp_cstrs(env)
+
+  for v in objective_fun.vars():
+    symtbl.declare(v)
+  objective = monomial_to_milp_expr(env,objective_fun)
+  generator = MILPSolutionGenerator(dev,adp,symtbl,env,objective, \
+                                    min_distance=min_distance)
+  for scaled_adp in generator.solutions():
+    yield scaled_adp
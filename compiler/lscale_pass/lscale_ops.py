@@ -63,6 +63,9 @@ class HardwareInfo:
     self.quality_terms = {}
     for meas in QualityMeasure:
       self.quality_terms[meas] = []
+    # harmonized relations, shared by the instances of a block with the
+    # same modes and delta models
+    self.master_relations = {}
 
   def get_quality_terms(self,qual):
     for term in self.quality_terms[qual]:
@@ -140,6 +143,29 @@ class HardwareInfo:
     safe_ival = ival.scale(0.95)
     return safe_ival
 
+  def prefetch_delta_models(self,adp):
+    if self.scale_method == ScaleMethod.IDEAL:
+      return
+
+    requests = []
+    for config in adp.configs:
+      block = self.dev.get_block(config.inst.block)
+      if not block.requires_calibration():
+        continue
+
+      for mode in self.modes(block.name):
+        cfg = adplib.BlockConfig(config.inst)
+        cfg.modes = [mode]
+        for out in block.outputs:
+          requests.append((block,config.inst.loc,out,cfg))
+
+    # failed lookups are reported when the relations are built
+    try:
+      exp_delta_model_lib.prefetch_cached_models(self.dev,requests, \
+                                                 self.calib_obj)
+    except Exception as e:
+      print("[could not prefetch delta models] %s" % e)
+
   def get_empirical_relation(self,instance,mode,port):
     block = self.dev.get_block(instance.block)
     if self.scale_method == ScaleMethod.IDEAL or \
@@ -150,13 +176,12 @@ class HardwareInfo:
       delta = out.deltas[mode]
       cfg = adplib.BlockConfig(instance)
       cfg.modes = [mode]
-      exp_models = exp_delta_model_lib.get_models(self.dev,  \
-                                                 ['block','loc','output','static_config','calib_obj'],
-                                                 block=block, \
-                                                 loc=instance.loc, \
-                                                 output=out, \
-                                                 config=cfg, \
-                                                 calib_obj=self.calib_obj)
+      exp_models = exp_delta_model_lib.get_cached_models(self.dev,  \
+                                                        block=block, \
+                                                        loc=instance.loc, \
+                                                        output=out, \
+                                                        config=cfg, \
+                                                        calib_obj=self.calib_obj)
       if len(exp_models) == 0:
         print("[[WARN]] no experimental model %s (%s)" \
               % (instance,mode))
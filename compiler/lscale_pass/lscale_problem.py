@@ -4,6 +4,7 @@ import ops.base_op as baseoplib
 import ops.generic_op as genoplib
 import ops.opparse as opparse
 import numpy as np
+import heapq
 import compiler.lscale_pass.lscale_ops as scalelib
 import compiler.lscale_pass.lscale_harmonize as harmlib
 import compiler.math_utils as mathutils
@@ -24,98 +25,185 @@ def _get_intervals(dev,dsinfo,cfg):
 
   return intervals
 
-def _generate_dsinfo_backprop(dev,dsinfo,adp):
-  count = 0
-  for conn in adp.conns:
-    if len(list(filter(lambda c: c.same_dest(conn), adp.conns))) > 1:
-        continue
+def _port_key(inst,port):
+  return (str(inst),port)
 
-    if not dsinfo.has_interval(conn.source_inst,conn.source_port):
-      if dsinfo.has_interval(conn.dest_inst, \
-                             conn.dest_port):
-          source_ival = dsinfo.get_interval(conn.dest_inst, \
-                                            conn.dest_port)
-          dsinfo.set_interval(conn.source_inst,conn.source_port,source_ival)
-          count += 1
-
-  for cfg in adp.configs:
-    blk = dev.get_block(cfg.inst.block)
-    bl_mode = list(cfg.modes)[0]
+def _config_keys(dev,cfg):
+  blk = dev.get_block(cfg.inst.block)
+  ports = blk.inputs.field_names() + blk.outputs.field_names() + \
+          list(map(lambda datum: datum.name, \
+                   cfg.stmts_of_type(adplib.ConfigStmtType.CONSTANT)))
+  return list(map(lambda port: _port_key(cfg.inst,port), ports))
+
+def _backprop_conn(dev,dsinfo,conn):
+  if not dsinfo.has_interval(conn.source_inst,conn.source_port):
+    if dsinfo.has_interval(conn.dest_inst, \
+                           conn.dest_port):
+        source_ival = dsinfo.get_interval(conn.dest_inst, \
+                                          conn.dest_port)
+        dsinfo.set_interval(conn.source_inst,conn.source_port,source_ival)
+        return [_port_key(conn.source_inst,conn.source_port)]
+  return []
+
+def _backprop_output(dev,dsinfo,cfg,out):
+  bl_mode = list(cfg.modes)[0]
+  intervals = _get_intervals(dev,dsinfo,cfg)
+  fxns = dict(map(lambda st: (st.name,st.expr), \
+             filter(lambda st: isinstance(st, adplib.ExprDataConfig), cfg.stmts)))
+  rel = out.relation[bl_mode].substitute(fxns).concretize()
+  all_inputs_bound = all(map(lambda v: v in intervals,rel.vars()))
+
+  updated = []
+  if all_inputs_bound and not out.name in intervals:
+      try:
+         out_interval = ivallib.propagate_intervals(rel,intervals)
+         dsinfo.set_interval(cfg.inst,out.name,out_interval)
+         print("%s:%s : %s" % (cfg.inst, out.name,out_interval))
+         updated.append(_port_key(cfg.inst,out.name))
+      except ivallib.UnknownIntervalError as e:
+         pass
+
+  elif not all_inputs_bound and out.name in intervals:
+       try:
+         inp_intervals = ivallib.backpropagate_intervals(rel,intervals[out.name], \
+                                                         intervals)
+       except ivallib.UnknownIntervalError as e:
+         return updated
+       except ivallib.BackpropFailedError as e:
+         return updated
+
+       for port_name,ival in inp_intervals.items():
+         if not port_name in intervals:
+            dsinfo.set_interval(cfg.inst,port_name,ival)
+            print("%s:%s : %s" % (cfg.inst, port_name,ival))
+            updated.append(_port_key(cfg.inst,port_name))
+
+  return updated
+
+def _recurse_conns(dev,dsinfo,dest_inst,dest_port,src_conns):
+  if dsinfo.has_interval(dest_inst,dest_port):
+    return []
+
+  ival = ivallib.Interval.type_infer(0,0)
+  for src_conn in src_conns:
+    if dsinfo.has_interval(src_conn.source_inst, \
+                           src_conn.source_port):
+      src_ival = dsinfo.get_interval(src_conn.source_inst, \
+                                     src_conn.source_port)
+      ival = ival.add(src_ival)
+    else:
+      return []
+
+  dsinfo.set_interval(dest_inst,dest_port,ival)
+  return [_port_key(dest_inst,dest_port)]
+
+def _recurse_config(dev,dsinfo,cfg):
+  blk = dev.get_block(cfg.inst.block)
+  bl_mode = list(cfg.modes)[0]
+  intervals = _get_intervals(dev,dsinfo,cfg)
+
+  updated = []
+  for out in blk.outputs:
+    if dsinfo.has_interval(cfg.inst,out.name):
+      continue
+
+    rel = out.relation[bl_mode]
+    subs = dict(map(lambda stmt: (stmt.name,stmt.expr), \
+                    cfg.stmts_of_type(adplib.ConfigStmtType.EXPR)))
+    rel = rel.substitute(subs)
+    try:
+      out_interval = ivallib.propagate_intervals(rel,intervals)
+      dsinfo.set_interval(cfg.inst,out.name,out_interval)
+      updated.append(_port_key(cfg.inst,out.name))
+    except ivallib.UnknownIntervalError as e:
+      continue
+
+  return updated
+
+def _propagate(dsinfo,rules):
+  '''
+  Apply the rules until no rule derives a new interval. Each rule is a
+  (reads,fn) pair, where fn derives intervals from the intervals of the
+  ports in reads and returns the ports it set. The rules are applied in
+  sweeps, in order, like a loop over every rule until a fixpoint, but a
+  rule is only revisited once one of the ports it reads is set. Since
+  intervals are only ever set once, this derives the same intervals in
+  the same order. Returns the number of rule applications.
+  '''
+  readers = {}
+  for idx,(reads,_) in enumerate(rules):
+    for key in reads:
+      readers.setdefault(key,[]).append(idx)
+
+  steps = 0
+  pending = set(range(len(rules)))
+  while len(pending) > 0:
+    sweep = list(pending)
+    heapq.heapify(sweep)
+    pending = set()
+    queued = set(sweep)
+    while len(sweep) > 0:
+      idx = heapq.heappop(sweep)
+      queued.remove(idx)
+      _,fn = rules[idx]
+      steps += 1
+      for key in fn():
+        for reader in readers.get(key,[]):
+          # rules later in the sweep see the interval in this sweep
+          if reader > idx and not reader in queued:
+            heapq.heappush(sweep,reader)
+            queued.add(reader)
+          elif reader <= idx:
+            pending.add(reader)
+
+  return steps
+
+def _dsinfo_backprop_rules(dev,dsinfo,adp):
+  dest_count = {}
+  for conn in adp.conns:
+    key = _port_key(conn.dest_inst,conn.dest_port)
+    dest_count[key] = dest_count.get(key,0) + 1
 
-    for out in blk.outputs:
-      intervals = _get_intervals(dev,dsinfo,cfg)
-      fxns = dict(map(lambda st: (st.name,st.expr), \
-                 filter(lambda st: isinstance(st, adplib.ExprDataConfig), cfg.stmts)))
-      rel = out.relation[bl_mode].substitute(fxns).concretize()
-      all_inputs_bound = all(map(lambda v: v in intervals,rel.vars()))
-
-      if all_inputs_bound and not out.name in intervals:
-          try:
-             out_interval = ivallib.propagate_intervals(rel,intervals)
-             dsinfo.set_interval(cfg.inst,out.name,out_interval)
-             print("%s:%s : %s" % (cfg.inst, out.name,out_interval))
-             count += 1
-          except ivallib.UnknownIntervalError as e:
-             continue
-
-      elif not all_inputs_bound and out.name in intervals:
-           try:
-             inp_intervals = ivallib.backpropagate_intervals(rel,intervals[out.name], \
-                                                             intervals)
-           except ivallib.UnknownIntervalError as e:
-             continue
-           except ivallib.BackpropFailedError as e:
-             continue
-
-           for port_name,ival in inp_intervals.items():
-             if not port_name in intervals:
-                dsinfo.set_interval(cfg.inst,port_name,ival)
-                print("%s:%s : %s" % (cfg.inst, port_name,ival))
-                count += 1
-
-  return count
-
-def _generate_dsinfo_recurse(dev,dsinfo,adp):
-  count = 0
+  rules = []
   for conn in adp.conns:
-    if not dsinfo.has_interval(conn.dest_inst,conn.dest_port):
-      ival = ivallib.Interval.type_infer(0,0)
-      for src_conn in \
-          list(filter(lambda c: c.same_dest(conn), adp.conns)):
-        if dsinfo.has_interval(src_conn.source_inst, \
-                               src_conn.source_port):
-          src_ival = dsinfo.get_interval(src_conn.source_inst, \
-                                         src_conn.source_port)
-          ival = ival.add(src_ival)
-        else:
-          ival = None
-          break
+    # the source interval cannot be inferred if multiple ports are summed
+    if dest_count[_port_key(conn.dest_inst,conn.dest_port)] > 1:
+      continue
 
-      if not ival is None:
-        dsinfo.set_interval(conn.dest_inst,conn.dest_port,ival)
-        count += 1
+    reads = [_port_key(conn.source_inst,conn.source_port), \
+             _port_key(conn.dest_inst,conn.dest_port)]
+    rules.append((reads, \
+                  lambda conn=conn: _backprop_conn(dev,dsinfo,conn)))
 
   for cfg in adp.configs:
     blk = dev.get_block(cfg.inst.block)
-    bl_mode = list(cfg.modes)[0]
-    intervals = _get_intervals(dev,dsinfo,cfg)
-
+    reads = _config_keys(dev,cfg)
     for out in blk.outputs:
-      if dsinfo.has_interval(cfg.inst,out.name):
-        continue
+      rules.append((reads, \
+                    lambda cfg=cfg,out=out: _backprop_output(dev,dsinfo,cfg,out)))
 
-      rel = out.relation[bl_mode]
-      subs = dict(map(lambda stmt: (stmt.name,stmt.expr), \
-                      cfg.stmts_of_type(adplib.ConfigStmtType.EXPR)))
-      rel = rel.substitute(subs)
-      try:
-        out_interval = ivallib.propagate_intervals(rel,intervals)
-        dsinfo.set_interval(cfg.inst,out.name,out_interval)
-        count += 1
-      except ivallib.UnknownIntervalError as e:
-        continue
+  return rules
 
-  return count
+def _dsinfo_recurse_rules(dev,dsinfo,adp):
+  by_dest = {}
+  for conn in adp.conns:
+    key = _port_key(conn.dest_inst,conn.dest_port)
+    by_dest.setdefault(key,[]).append(conn)
+
+  rules = []
+  for key,src_conns in by_dest.items():
+    dest_inst,dest_port = src_conns[0].dest_inst,src_conns[0].dest_port
+    reads = [key] + list(map(lambda c: _port_key(c.source_inst,c.source_port), \
+                             src_conns))
+    rules.append((reads, \
+                  lambda dest_inst=dest_inst,dest_port=dest_port,src_conns=src_conns: \
+                  _recurse_conns(dev,dsinfo,dest_inst,dest_port,src_conns)))
+
+  for cfg in adp.configs:
+    rules.append((_config_keys(dev,cfg), \
+                  lambda cfg=cfg: _recurse_config(dev,dsinfo,cfg)))
+
+  return rules
 
 def generate_dynamical_system_info(dev,program,adp):
   dsinfo = scalelib.DynamicalSystemInfo()
@@ -130,11 +218,10 @@ def generate_dynamical_system_info(dev,program,adp):
       ival = ivallib.Interval.type_infer(datum.value,datum.value)
       dsinfo.set_interval(config.inst,datum.name,ival)
 
-  while _generate_dsinfo_backprop(dev,dsinfo,adp) > 0:
-    pass
-
-  while _generate_dsinfo_recurse(dev,dsinfo,adp) > 0:
-    pass
+  backprop_steps = _propagate(dsinfo,_dsinfo_backprop_rules(dev,dsinfo,adp))
+  recurse_steps = _propagate(dsinfo,_dsinfo_recurse_rules(dev,dsinfo,adp))
+  print("interval inference: %d backprop steps, %d recurse steps" % \
+        (backprop_steps,recurse_steps))
 
   return dsinfo
 
@@ -539,6 +626,19 @@ def force_identity_scaling_transform(dev,adp):
       yield scalelib.SCEq(scalelib.PortScaleVar(config.inst,data.name), \
                           scalelib.SCMonomial.make_const(1.0))
 
+def get_master_relation(hwinfo,block,out,baseline,deviations,modes):
+  # the relations are keyed by their text, which holds the delta model
+  # parameters. The gain variables are per-instance coefficients, so
+  # instances with the same relations share the harmonized relation.
+  key = (block.name,out.name,str(baseline), \
+         tuple(map(lambda tup: (str(tup[0]),str(tup[1])), \
+                   zip(modes,deviations))))
+  if not key in hwinfo.master_relations:
+    hwinfo.master_relations[key] = harmlib.get_master_relation(baseline, \
+                                                               deviations, \
+                                                               modes)
+  return hwinfo.master_relations[key]
+
 def generate_constraint_problem(dev,program,adp, \
                                 scale_method=scalelib.ScaleMethod.IDEAL, \
                                 calib_obj=None, \
@@ -560,6 +660,9 @@ def generate_constraint_problem(dev,program,adp, \
   for block in dev.blocks:
     hwinfo.register_modes(block,block.modes)
 
+  hwinfo.prefetch_delta_models(adp)
+  harmlib.reset_gain_vars()
+
   for conn in adp.conns:
     yield scalelib.SCEq(scalelib.PortScaleVar(conn.source_inst,conn.source_port), \
                scalelib.PortScaleVar(conn.dest_inst, conn.dest_port))
@@ -568,7 +671,9 @@ def generate_constraint_problem(dev,program,adp, \
     block = dev.get_block(config.inst.block)
     mode_var = scalelib.ModeVar(config.inst,hwinfo.modes(block.name))
 
-    modes_subset = set(hwinfo.modes(block.name))
+    # the valid modes are kept in mode order, so the problem is the same
+    # from run to run.
+    modes_subset = list(hwinfo.modes(block.name))
     for out in block.outputs:
       # idealized relation
       baseline = hwinfo.get_ideal_relation(config.inst,config.modes[0],out.name)
@@ -589,10 +694,11 @@ def generate_constraint_problem(dev,program,adp, \
           deviation_modes.append(mode)
           print(dev_rel)
 
-      master_rel, modes, mode_assignments = harmlib.get_master_relation(baseline, \
-                                                                        deviations, \
-                                                                        deviation_modes)
-      modes_subset = list(set(modes_subset).intersection(set(modes)))
+      master_rel, modes, mode_assignments = get_master_relation(hwinfo,block,out, \
+                                                                baseline, \
+                                                                deviations, \
+                                                                deviation_modes)
+      modes_subset = list(filter(lambda m: m in modes, modes_subset))
       cstrs,op_monom = generate_factor_constraints(config.inst,master_rel)
       for cstr in cstrs:
         yield cstr
@@ -3,6 +3,7 @@ import compiler.lscale_pass.lscale_ops as scalelib
 import hwlib.block as blocklib
 import hwlib.adp as adplib
 import math
+import multiprocessing
 
 class SymbolTable:
 
@@ -133,18 +134,113 @@ def scale_cstr_to_z3_cstr(smtenv,cstr):
 def scale_objective_fun_to_z3_objective_fun(objfun):
   return monomial_to_z3_expr(objfun)
 
+# build the scaled adp from a solution, which maps variable names to their
+# values in log space and mode variables to mode indices. Also returns the
+# assignment of the mode variables with a choice of modes, which is
+# excluded to find the next solution.
+def translate_solution(dev,adp,symtbl,result):
+  adp = adp.copy(dev)
+  quality = None
+  model_to_negate = {}
+  for var_name,value in result.items():
+    var = symtbl.get(var_name)
+
+    if isinstance(var,scalelib.ModeVar):
+      blkcfg = adp.configs.get(var.inst.block,var.inst.loc)
+      blk = dev.get_block(var.inst.block)
+      mode = blk.modes[int(value)]
+      assert(isinstance(mode,blocklib.BlockMode))
+      blkcfg.modes = [mode]
+      if len(blk.modes) > 1:
+        model_to_negate[var_name] = value
+
+    elif isinstance(var,scalelib.FuncArgScaleVar):
+      if not value is None:
+        blkcfg = adp.configs.get(var.inst.block,var.inst.loc)
+        blkcfg[var.datafield].scf = undo_log(value)
+        if var.arg is None:
+          blkcfg[var.datafield].scfs[var.datafield] = undo_log(value)
+        else:
+          blkcfg[var.datafield].scfs[var.arg] = undo_log(value)
+
+
+    elif isinstance(var,scalelib.PortScaleVar):
+      if not value is None:
+        blkcfg = adp.configs.get(var.inst.block,var.inst.loc)
+        blkcfg[var.port].scf = undo_log(value)
+
+    elif isinstance(var,scalelib.TimeScaleVar):
+      adp.tau = undo_log(value)
+
+    elif isinstance(var,scalelib.InjectVar):
+      val = undo_log(value)
+      blkcfg = adp.configs.get(var.inst.block,var.inst.loc)
+      inj_key = var.field if var.arg is None else var.arg
+      blkcfg[var.field].injs[inj_key] = val
+
+    elif isinstance(var,scalelib.QualityVar):
+      quality = scalelib.QualityMeasure(var.name)
+      val = undo_log(value)
+      if quality == scalelib.QualityMeasure.AQM:
+        adp.metadata.set(adplib.ADPMetadata.Keys.LSCALE_AQM, val)
+      elif quality == scalelib.QualityMeasure.AQMST:
+        adp.metadata.set(adplib.ADPMetadata.Keys.LSCALE_AQMST, val)
+      elif quality == scalelib.QualityMeasure.AVGAQM:
+        adp.metadata.set(adplib.ADPMetadata.Keys.LSCALE_AVGAQM, val)
+      elif quality == scalelib.QualityMeasure.AVGDQM:
+        adp.metadata.set(adplib.ADPMetadata.Keys.LSCALE_AVGDQM, val)
+      elif quality == scalelib.QualityMeasure.AQMOBS:
+        adp.metadata.set(adplib.ADPMetadata.Keys.LSCALE_AQMOBS, val)
+      elif quality == scalelib.QualityMeasure.DQM:
+        adp.metadata.set(adplib.ADPMetadata.Keys.LSCALE_DQM, val)
+      elif quality == scalelib.QualityMeasure.DQME:
+        adp.metadata.set(adplib.ADPMetadata.Keys.LSCALE_DQME, val)
+      else:
+        raise Exception("unknown quality measure: %s" % quality)
+
+    elif isinstance(var,scalelib.ConstCoeffVar) or \
+         isinstance(var,scalelib.PropertyVar):
+      continue
+    else:
+      raise Exception("unimpl: %s" % var)
+
+  return adp,model_to_negate
+
+# solver configurations raced by the portfolio. Each one finds an optimal
+# solution, but they search differently, so one may find it sooner.
+PORTFOLIO = [
+  {},
+  {'random_seed':1},
+  {'optsmt_engine':'symba'},
+  {'random_seed':2, 'arith.solver':2},
+  {'optsmt_engine':'symba', 'random_seed':3},
+  {'random_seed':4, 'phase_selection':0}
+]
+
+def _portfolio_worker(generator,index,queue):
+  try:
+    queue.put((index,generator.optimize(PORTFOLIO[index]),None))
+  except Exception as e:
+    queue.put((index,None,str(e)))
+
 class LScaleSolutionGenerator:
 
-  def __init__(self,dev,adp,symtbl,smtenv,opt=None):
+  def __init__(self,dev,adp,symtbl,smtenv,opt=None,min_distance=1,portfolio=1):
     assert(isinstance(symtbl,SymbolTable))
     assert(isinstance(smtenv,smtlib.SMTEnv))
-    ctx,opt = smtenv.to_z3(optimize=opt)
     self.smtenv = smtenv
     self.symtbl = symtbl
-    self.z3ctx = ctx
-    self.z3opt = opt
+    self.objective = opt
     self.adp = adp
     self.dev = dev
+    self.min_distance = min_distance
+    self.portfolio = min(portfolio,len(PORTFOLIO))
+    # mode assignments of the solutions found so far
+    self.excluded = []
+    self.exhausted = False
+    self.z3ctx = None
+    if self.portfolio <= 1:
+      self.z3ctx,self.z3opt = smtenv.to_z3(optimize=opt)
 
   def solutions(self):
     adp = self.get_solution()
@@ -152,11 +248,63 @@ class LScaleSolutionGenerator:
       yield adp
       adp = self.get_solution()
 
+  def exclude(self,z3ctx,model):
+    # the next solution must select other modes for at least
+    # <min_distance> blocks
+    if self.min_distance <= 1:
+      z3ctx.negate_model(model)
+    else:
+      z3ctx.distance_cstr(model,min(self.min_distance,len(model)))
+
+  # solve the problem from scratch with the given solver parameters
+  def optimize(self,params):
+    z3ctx,z3opt = self.smtenv.to_z3(optimize=self.objective)
+    z3ctx.set_params(params)
+    for model in self.excluded:
+      self.exclude(z3ctx,model)
+
+    if z3opt is None:
+      return z3ctx.solve()
+    else:
+      return z3ctx.optimize()
+
+  # race the portfolio configurations and take the first answer
+  def portfolio_optimize(self):
+    mpctx = multiprocessing.get_context("fork")
+    queue = mpctx.Queue()
+    procs = list(map(lambda idx: mpctx.Process(target=_portfolio_worker, \
+                                               args=(self,idx,queue), \
+                                               daemon=True), \
+                     range(self.portfolio)))
+    for proc in procs:
+      proc.start()
+
+    try:
+      errors = []
+      while len(errors) < len(procs):
+        idx,result,error = queue.get()
+        if error is None:
+          print("[portfolio] configuration %d %s answered first" % \
+                (idx,PORTFOLIO[idx]))
+          return result
+        errors.append(error)
+
+      raise Exception("portfolio failed: %s" % errors[0])
+    finally:
+      for proc in procs:
+        proc.terminate()
+        proc.join()
+
   def get_solution(self):
-    if self.z3opt is None:
+    if self.exhausted:
+      print("no solution..")
+      return None
+
+    if self.portfolio > 1:
+      result = self.portfolio_optimize()
+    elif self.z3opt is None:
       result = self.z3ctx.solve()
     else:
-      self.z3ctx.set_objective(self.z3opt)
       result = self.z3ctx.optimize()
     if result is None:
       print("no solution..")
@@ -164,78 +312,21 @@ class LScaleSolutionGenerator:
     else:
       print("found solution!")
 
-    symtbl = self.symtbl
-    adp = self.adp.copy(self.dev)
-    quality = None
-    model_to_negate = {}
-    for var_name,value in result.items():
-      var = symtbl.get(var_name)
-
-      if isinstance(var,scalelib.ModeVar):
-        blkcfg = adp.configs.get(var.inst.block,var.inst.loc)
-        blk = self.dev.get_block(var.inst.block)
-        mode = blk.modes[int(value)]
-        assert(isinstance(mode,blocklib.BlockMode))
-        blkcfg.modes = [mode]
-        if len(blk.modes) > 1:
-          model_to_negate[var_name] = value
-
-      elif isinstance(var,scalelib.FuncArgScaleVar):
-        if not value is None:
-          blkcfg = adp.configs.get(var.inst.block,var.inst.loc)
-          blkcfg[var.datafield].scf = undo_log(value)
-          if var.arg is None:
-            blkcfg[var.datafield].scfs[var.datafield] = undo_log(value)
-          else:
-            blkcfg[var.datafield].scfs[var.arg] = undo_log(value)
-
-
-      elif isinstance(var,scalelib.PortScaleVar):
-        if not value is None:
-          blkcfg = adp.configs.get(var.inst.block,var.inst.loc)
-          blkcfg[var.port].scf = undo_log(value)
-
-      elif isinstance(var,scalelib.TimeScaleVar):
-        adp.tau = undo_log(value)
-
-      elif isinstance(var,scalelib.InjectVar):
-        val = undo_log(value)
-        blkcfg = adp.configs.get(var.inst.block,var.inst.loc)
-        inj_key = var.field if var.arg is None else var.arg
-        blkcfg[var.field].injs[inj_key] = val
-
-      elif isinstance(var,scalelib.QualityVar):
-        quality = scalelib.QualityMeasure(var.name)
-        val = undo_log(value)
-        if quality == scalelib.QualityMeasure.AQM:
-          adp.metadata.set(adplib.ADPMetadata.Keys.LSCALE_AQM, val)
-        elif quality == scalelib.QualityMeasure.AQMST:
-          adp.metadata.set(adplib.ADPMetadata.Keys.LSCALE_AQMST, val)
-        elif quality == scalelib.QualityMeasure.AVGAQM:
-          adp.metadata.set(adplib.ADPMetadata.Keys.LSCALE_AVGAQM, val)
-        elif quality == scalelib.QualityMeasure.AVGDQM:
-          adp.metadata.set(adplib.ADPMetadata.Keys.LSCALE_AVGDQM, val)
-        elif quality == scalelib.QualityMeasure.AQMOBS:
-          adp.metadata.set(adplib.ADPMetadata.Keys.LSCALE_AQMOBS, val)
-        elif quality == scalelib.QualityMeasure.DQM:
-          adp.metadata.set(adplib.ADPMetadata.Keys.LSCALE_DQM, val)
-        elif quality == scalelib.QualityMeasure.DQME:
-          adp.metadata.set(adplib.ADPMetadata.Keys.LSCALE_DQME, val)
-        else:
-          raise Exception("unknown quality measure: %s" % quality)
-
-      elif isinstance(var,scalelib.ConstCoeffVar) or \
-           isinstance(var,scalelib.PropertyVar):
-        continue
-      else:
-        raise Exception("unimpl: %s" % var)
+    adp,model_to_negate = translate_solution(self.dev,self.adp, \
+                                             self.symtbl,result)
+    # without a choice of modes there is no other solution
+    if len(model_to_negate) == 0:
+      self.exhausted = True
+      return adp
 
-    self.z3ctx.negate_model(model_to_negate)
+    self.excluded.append(model_to_negate)
+    if not self.z3ctx is None:
+      self.exclude(self.z3ctx,model_to_negate)
     return adp
 
 
 
-def solve(dev,adp,cstrs,objective_fun):
+def solve(dev,adp,cstrs,objective_fun,min_distance=1,portfolio=1):
   smtenv = smtlib.SMTEnv()
   symtbl = SymbolTable(smtenv)
   for cstr in cstrs:
@@ -247,8 +338,8 @@ def solve(dev,adp,cstrs,objective_fun):
 
   z3_obj_fun = scale_objective_fun_to_z3_objective_fun(objective_fun)
   generator = LScaleSolutionGenerator(dev,adp,symtbl,smtenv, \
-                                      opt=z3_obj_fun)
+                                      opt=z3_obj_fun, \
+                                      min_distance=min_distance, \
+                                      portfolio=portfolio)
   for scaled_adp in generator.solutions():
     yield scaled_adp
-
-
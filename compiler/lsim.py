@@ -11,7 +11,8 @@ def run_adp_simulation(dev, \
                        enable_model_error=True, \
                        enable_physical_model=True, \
                        enable_intervals=True, \
-                       enable_quantization=True):
+                       enable_quantization=True, \
+                       reference=False):
   sim =  \
          buildsim.build_simulation(dev, \
                                    adp, \
@@ -20,12 +21,73 @@ def run_adp_simulation(dev, \
                                    enable_intervals=enable_intervals,
                                    enable_quantization=enable_quantization)
 
-  res = buildsim.run_simulation(sim,dssim.sim_time)
+  res = buildsim.run_simulation(sim,dssim.sim_time,reference=reference)
   times,values = buildsim.get_dsexpr_trajectories(dev,adp,sim,res, \
                                                   recover=recover)
   return times,values
 
 
+def build_adp_ensemble(dev, \
+                       adps, \
+                       samples=1, \
+                       seed=None, \
+                       enable_model_error=True, \
+                       enable_physical_model=True, \
+                       enable_intervals=True, \
+                       enable_quantization=True):
+  ens = buildsim.ADPEnsemble()
+  for idx,adp in enumerate(adps):
+    sim = buildsim.build_simulation(dev, \
+                                    adp, \
+                                    enable_model_error=enable_model_error, \
+                                    enable_physical_model=enable_physical_model, \
+                                    enable_intervals=enable_intervals,
+                                    enable_quantization=enable_quantization)
+    # each circuit draws its own model errors
+    ens.add(sim,samples=samples, \
+            seed=None if seed is None else seed+idx)
+
+  return ens
+
+def run_adp_ensemble(dev, \
+                     adps, \
+                     dssim, \
+                     samples=1, \
+                     seed=None, \
+                     recover=False, \
+                     enable_model_error=True, \
+                     enable_physical_model=True, \
+                     enable_intervals=True, \
+                     enable_quantization=True):
+  ens = build_adp_ensemble(dev,adps, \
+                           samples=samples, \
+                           seed=seed, \
+                           enable_model_error=enable_model_error, \
+                           enable_physical_model=enable_physical_model, \
+                           enable_intervals=enable_intervals, \
+                           enable_quantization=enable_quantization)
+
+  results = buildsim.run_ensemble(ens,dssim.sim_time)
+  trajectories = []
+  for adp,sim,sample_results in zip(adps,ens.sims,results):
+    trajectories.append(list(map(lambda res: \
+                                 buildsim.get_dsexpr_trajectories(dev,adp,sim,res, \
+                                                                  recover=recover), \
+                                 sample_results)))
+  return trajectories
+
+
+def trajectory_error(ref_times,ref_values,times,values):
+  error = 0.0
+  for var,ref in ref_values.items():
+    if not var in values:
+      continue
+    emul = np.interp(ref_times,times,np.real(values[var]))
+    error += np.sum(np.abs(emul-np.array(ref))**2)
+
+  return error
+
+
 def get_style():
   linestyle= {
     'linewidth':4.0
@@ -89,7 +151,8 @@ def simulate_adp(dev,adp,plot_file, \
                  enable_physical_model=True, \
                  enable_intervals=True, \
                  enable_quantization=True, \
-                 separate_figures=False):
+                 separate_figures=False, \
+                 reference=False):
   print(adp.metadata)
   prog = adp.metadata[adplib.ADPMetadata.Keys.DSNAME]
   dssim = DSProgDB.get_sim(prog)
@@ -99,7 +162,8 @@ def simulate_adp(dev,adp,plot_file, \
                                     dssim, \
                                     enable_model_error=enable_model_error, \
                                     enable_physical_model=enable_physical_model, \
-                                    enable_quantization=enable_quantization)
+                                    enable_quantization=enable_quantization, \
+                                    reference=reference)
   if separate_figures:
     plot_separate_simulations(times,values,plot_file)
   else:
@@ -109,6 +173,48 @@ def simulate_adp(dev,adp,plot_file, \
 
 
 
+def simulate_adp_batch(dev,adps,plot_files, \
+                       samples=1, \
+                       enable_model_error=True, \
+                       enable_physical_model=True, \
+                       enable_intervals=True, \
+                       enable_quantization=True, \
+                       separate_figures=False, \
+                       seed=0):
+  prog = DSProgDB.get_prog(adps[0].metadata[adplib.ADPMetadata.Keys.DSNAME])
+  dssim = DSProgDB.get_sim(prog.name)
+  dev.model_number = adps[0].metadata[adplib.ADPMetadata.Keys.RUNTIME_PHYS_DB]
+  ens = build_adp_ensemble(dev,adps, \
+                           samples=samples, \
+                           seed=seed, \
+                           enable_model_error=enable_model_error, \
+                           enable_physical_model=enable_physical_model, \
+                           enable_intervals=enable_intervals, \
+                           enable_quantization=enable_quantization)
+  results = buildsim.run_ensemble(ens,dssim.sim_time)
+  ref_times,ref_values = prog.execute(dssim)
+
+  ranking = []
+  for adp_idx,(adp,sim,sample_results) in \
+      enumerate(zip(adps,ens.sims,results)):
+    times,values = buildsim.get_dsexpr_trajectories(dev,adp,sim, \
+                                                    sample_results[0], \
+                                                    recover=False)
+    if separate_figures:
+      plot_separate_simulations(times,values,plot_files[adp_idx])
+    else:
+      plot_simulation(times,values,plot_files[adp_idx])
+
+    for samp_idx,res in enumerate(sample_results):
+      times,values = buildsim.get_dsexpr_trajectories(dev,adp,sim,res, \
+                                                      recover=True)
+      error = trajectory_error(ref_times,ref_values,times,values)
+      ranking.append((error,adp_idx,samp_idx))
+
+  ranking.sort()
+  return ranking
+
+
 def simulate_reference(dev,prog,plot_file,separate_figures=False):
   dssim = DSProgDB.get_sim(prog.name)
   T,Z = prog.execute(dssim)
@@ -8,6 +8,7 @@ import ops.base_op as baseoplib
 import ops.generic_op as genoplib
 import ops.op as oplib
 import ops.parametric_surf as parsurflib
+import ops.npop as npoplib
 
 import hwlib.adp as adplib
 import hwlib.block as blocklib
@@ -91,6 +92,135 @@ class ADPSim:
     return st
 
 
+'''
+Compiled numeric kernel for an ADPSim. The block netlist is lowered
+once into two numpy functions over the state array: one that computes
+the derivatives of the state variables and one that computes the
+observed functions. Interval clipping, quantized digital values and
+model error terms are folded into the generated code.
+'''
+class ADPSimKernel:
+
+  def __init__(self,sim,vectorized=False,samples=1,seed=None):
+    self.sim = sim
+    self.vectorized = vectorized or samples > 1
+    self.samples = samples
+    self._rand = np.random.RandomState(seed)
+    self._state_index = {}
+    for idx,var in enumerate(sim.state_vars):
+      self._state_index[str(var)] = idx
+
+    self._body = []
+    self._temps = {}
+    self._env = {}
+    self._draws = {}
+    self._derivative = self._build('derivative', \
+                                   list(map(lambda v: sim.state_var(v), \
+                                            sim.state_vars)), \
+                                   derivative=True)
+    self._functions = self._build('functions', \
+                                  list(map(lambda v: sim.function(v), \
+                                           sim.functions)), \
+                                  derivative=False)
+
+  def state(self,var):
+    return "x[%d]" % self._state_index[str(var)]
+
+  def state_bindings(self):
+    return dict(map(lambda tup: (tup[0],"x[%d]" % tup[1]), \
+                    self._state_index.items()))
+
+  # block subtrees are duplicated for every fanout, so identical
+  # expressions are only computed once.
+  def emit(self,expr):
+    if expr.isidentifier():
+      return expr
+
+    if not expr in self._temps:
+      name = "t%d" % len(self._temps)
+      self._temps[expr] = name
+      self._body.append("%s = %s" % (name,expr))
+
+    return self._temps[expr]
+
+  def bind(self,value):
+    name = "f%d" % len(self._env)
+    self._env[name] = value
+    return name
+
+  # monte carlo draw of a model error term. The first sample is always the
+  # nominal (noise-free) emulation. Block subtrees are lowered once per
+  # fanout and once per kernel, so the draw is made once per <key> and
+  # shared by every lowering of the same block port.
+  def noise(self,stdev,key):
+    if self.samples == 1 or stdev == 0.0:
+      return None
+
+    if not key in self._draws:
+      draws = stdev*self._rand.normal(size=self.samples)
+      draws[0] = 0.0
+      self._draws[key] = self.bind(draws)
+
+    return self._draws[key]
+
+  def clip(self,expr,ival):
+    if self.vectorized:
+      return "np.minimum(np.maximum(%s,%s),%s)" % (expr,repr(ival.lower), \
+                                                   repr(ival.upper))
+    else:
+      return "min(max(%s,%s),%s)" % (expr,repr(ival.lower),repr(ival.upper))
+
+  def _build(self,name,emul_blocks,derivative):
+    self._temps = {}
+    if self.vectorized:
+      self._body = ["x = np.real(x)"]
+    else:
+      self._body = ["x = np.real(x).tolist()"]
+
+    outputs = []
+    for emul_block in emul_blocks:
+      if derivative:
+        outputs.append(emul_block.lower_derivative(self))
+      else:
+        outputs.append(emul_block.lower(self))
+
+    if len(outputs) == 0:
+      retval = "np.zeros(0)"
+    elif self.vectorized:
+      retval = "np.array(np.broadcast_arrays(%s))" % (",".join(outputs))
+    else:
+      retval = "np.array([%s])" % (",".join(outputs))
+
+    return npoplib.compile_function(name,["x"],self._body,retval,self._env)
+
+  def _evaluate(self,fn,n,values):
+    result = fn(np.asarray(values))
+    if self.vectorized:
+      shape = (n,) + np.shape(values)[1:]
+      result = result.reshape(result.shape + (1,)*(len(shape)-result.ndim))
+      result = np.broadcast_to(result,shape)
+    return result
+
+  def derivative(self,values):
+    return self._evaluate(self._derivative,len(self.sim.state_vars),values)
+
+  def functions(self,values):
+    return self._evaluate(self._functions,len(self.sim.functions),values)
+
+  def initial_conds(self):
+    values = np.zeros((len(self.sim.state_vars),self.samples))
+    for idx,var in enumerate(self.sim.state_vars):
+      emul_block = self.sim.state_var(var)
+      values[idx,:] = np.real(emul_block.initial_cond())
+      noise = self.noise(emul_block.ic_error_stdev, \
+                         (emul_block.block.name,str(emul_block.loc), \
+                          emul_block.port.name,'ic'))
+      if not noise is None:
+        values[idx,:] += self._env[noise]
+
+    return values
+
+
 class ADPSimResult:
 
   def __init__(self,sim):
@@ -213,6 +343,18 @@ def validate_model(model,expr,surf,dataset):
         % (model.cfg.inst, model.cfg.mode, \
            np.mean(deviations), np.std(deviations)))
 
+class ModelErrorFunction:
+
+  def __init__(self,error_model,variables,digital_config):
+    self.error_model = error_model
+    self.variables = variables
+    self.digital_config = digital_config
+
+  def __call__(self,*args):
+    values = dict(zip(self.variables,args))
+    values.update(self.digital_config)
+    return self.error_model.get(values)
+
 class ADPEmulVar:
 
   def __init__(self,var):
@@ -222,6 +364,9 @@ class ADPEmulVar:
     assert(str(self.var) in vardict)
     return vardict[str(self.var)]
 
+  def lower(self,kern):
+    return kern.state(self.var)
+
 class ADPEmulBlock:
 
   def __init__(self,board,adp,block,cfg,port,calib_obj):
@@ -242,6 +387,8 @@ class ADPEmulBlock:
     self.enable_model_error = SETTINGS['model_error']
     self.correctable = SETTINGS['correctable']
     self.ll_correctable = SETTINGS['ll_correctable']
+    # measurement noise of the profiling data, used for monte carlo draws.
+    self.error_stdev = 0.0
 
     self._build_model(adp)
 
@@ -322,13 +469,12 @@ class ADPEmulBlock:
                       % (self.port.name,self.block.name))
 
     out = self.block.outputs[self.port.name]
-    models = deltalib.get_models(self.board, \
-                                ['block','loc','output','static_config','calib_obj'],
-                                block=self.block, \
-                                loc=self.loc, \
-                                output=out, \
-                                config=self.cfg, \
-                                calib_obj=self.calib_obj)
+    models = deltalib.get_cached_models(self.board, \
+                                       block=self.block, \
+                                       loc=self.loc, \
+                                       output=out, \
+                                       config=self.cfg, \
+                                       calib_obj=self.calib_obj)
     if len(models) == 0:
       model = None
     else:
@@ -369,6 +515,7 @@ class ADPEmulBlock:
                                         npts=self.npts)
 
         self.error_model = surf
+        self.error_stdev = np.mean(dataset.meas_stdev)
         validate_model(self,expr,surf,dataset)
 
 
@@ -429,6 +576,54 @@ class ADPEmulBlock:
     value = self._compute(self._expr,values)
     return value
 
+  def _lower(self,kern,expr):
+    bindings = kern.state_bindings()
+    for inp,blks in self.inputs.items():
+      terms = list(map(lambda blk: blk.lower(kern), blks))
+      val = "+".join(terms)
+      port = self.block.inputs[inp]
+      if self.enable_intervals:
+        val = kern.clip(val,port.interval[self.cfg.mode])
+
+      bindings[inp] = kern.emit(val)
+
+    if self.user_defined is None:
+      val = kern.emit(npoplib.to_numpy(expr,bindings))
+    else:
+      input_port,inputs,outputs = self.user_defined
+      lut = kern.bind(np.vectorize(lambda v: \
+                                   outputs[util.nearest_value(inputs,v,index=True)]))
+      val = kern.emit("%s(%s)" % (lut,bindings[input_port]))
+
+    if not self.error_model is None and \
+       self.enable_phys and self.enable_model_error:
+      variables = list(filter(lambda v: v in self.error_model.variables, \
+                              bindings.keys()))
+      error_fn = ModelErrorFunction(self.error_model, \
+                                    variables, \
+                                    dict(self.get_digital_config()))
+      if len(variables) == 0:
+        val = kern.emit("%s+%s" % (val,repr(error_fn())))
+      else:
+        fn = kern.bind(np.vectorize(error_fn))
+        args = ",".join(map(lambda v: bindings[v], variables))
+        val = kern.emit("%s+%s(%s)" % (val,fn,args))
+
+    if self.enable_phys and self.enable_model_error:
+      noise = kern.noise(self.error_stdev, \
+                         (self.block.name,str(self.loc),self.port.name))
+      if not noise is None:
+        val = kern.emit("%s+%s" % (val,noise))
+
+    port = self.block.outputs[self.port.name]
+    if self.enable_intervals:
+      val = kern.emit(kern.clip(val,port.interval[self.cfg.mode]))
+
+    return val
+
+  def lower(self,kern):
+    return self._lower(kern,self._expr)
+
   def connect(self,port,emul_blk):
     assert(isinstance(emul_blk,ADPEmulBlock)  \
            or isinstance(emul_blk,ADPEmulVar))
@@ -463,6 +658,9 @@ class ADPStatefulEmulBlock(ADPEmulBlock):
     value = self._compute(self._deriv,values)
     return value
 
+  def lower_derivative(self,kern):
+    return self._lower(kern,self._deriv)
+
 
   def _build_model(self,adp):
     def set_to_ideal_expr():
@@ -472,16 +670,16 @@ class ADPStatefulEmulBlock(ADPEmulBlock):
       self._deriv = self._concretize(integ_expr.deriv)
       self.error_model = None
       self.ic_error_model = None
+      self.ic_error_stdev = 0.0
 
     #expr = blk.outputs[port.name].relation[cfg.mode]
     out = self.block.outputs[self.port.name]
-    models = deltalib.get_models(self.board, \
-                                 ['block','loc','output','static_config','calib_obj'], \
-                                 block=self.block, \
-                                 loc=self.loc, \
-                                 output=out, \
-                                 config=self.cfg, \
-                                 calib_obj=self.calib_obj)
+    models = deltalib.get_cached_models(self.board, \
+                                        block=self.block, \
+                                        loc=self.loc, \
+                                        output=out, \
+                                        config=self.cfg, \
+                                        calib_obj=self.calib_obj)
 
     set_to_ideal_expr()
 
@@ -524,6 +722,7 @@ class ADPStatefulEmulBlock(ADPEmulBlock):
                                         output=errors, \
                                         npts=self.npts)
         self.ic_error_model = surf
+        self.ic_error_stdev = np.mean(dataset.meas_stdev)
         validate_model(self,expr.init_cond,surf,dataset)
 
       else:
@@ -642,10 +841,20 @@ def build_simulation(dev,_adp,  \
   return sim
 
 
-def run_simulation(sim,sim_time):
+def compile_simulation(sim):
+  return ADPSimKernel(sim)
 
-  def dt_func(t,vs):
-    return next_state(sim,vs)
+# the reference mode evaluates the symbolic block expressions on every
+# step and is kept to validate the compiled kernel.
+def run_simulation(sim,sim_time,reference=False):
+
+  if reference:
+    dt_func = lambda t,vs: next_state(sim,vs)
+    fn_func = lambda vs: func_state(sim,vs)
+  else:
+    kern = compile_simulation(sim)
+    dt_func = lambda t,vs: kern.derivative(vs)
+    fn_func = lambda vs: kern.functions(vs)
 
 
   time = sim_time*sim.time_scale
@@ -658,7 +867,7 @@ def run_simulation(sim,sim_time):
   state_vars = list(sim.state_vars)
   if len(state_vars) == 0:
     for t in np.linspace(0,time,int(n)):
-      res.add_point(t*sim.time_constant,[],func_state(sim, {}))
+      res.add_point(t*sim.time_constant,[],fn_func([]))
 
     return res
 
@@ -672,7 +881,7 @@ def run_simulation(sim,sim_time):
   last_seg = 0
   with tqdm.tqdm(total=tqdm_segs) as prog:
     while r.successful() and r.t < time:
-        res.add_point(r.t*sim.time_constant,r.y,func_state(sim,r.y))
+        res.add_point(r.t*sim.time_constant,r.y,fn_func(r.y))
         r.integrate(r.t + dt)
         # update tqdm
         seg = int(tqdm_segs*float(r.t)/float(time))
@@ -684,6 +893,80 @@ def run_simulation(sim,sim_time):
 
   return res
 
+class ADPEnsemble:
+
+  def __init__(self):
+    self.sims = []
+    self.kernels = []
+
+  @property
+  def size(self):
+    return len(self.sims)
+
+  def add(self,sim,samples=1,seed=None):
+    self.sims.append(sim)
+    self.kernels.append(ADPSimKernel(sim,vectorized=True, \
+                                     samples=samples, \
+                                     seed=seed))
+
+  def _layout(self):
+    offset = 0
+    for sim,kern in zip(self.sims,self.kernels):
+      shape = (len(sim.state_vars),kern.samples)
+      size = shape[0]*shape[1]
+      yield sim,kern,offset,size,shape
+      offset += size
+
+
+# integrate every member of the ensemble in one ode. Each simulation runs in
+# its own hardware time scale, so the ensemble is integrated over the
+# dynamical system time and rescaled per member.
+def run_ensemble(ensemble,sim_time):
+  layout = list(ensemble._layout())
+  n_states = sum(map(lambda entry: entry[3], layout))
+
+  def dt_func(t,vs):
+    deriv = np.zeros(n_states,dtype=vs.dtype)
+    for sim,kern,offset,size,shape in layout:
+      values = vs[offset:offset+size].reshape(shape)
+      deriv[offset:offset+size] = sim.time_scale* \
+        kern.derivative(values).reshape(size)
+    return deriv
+
+  def add_points(t,vs):
+    for idx,(sim,kern,offset,size,shape) in enumerate(layout):
+      values = np.real(vs[offset:offset+size]).reshape(shape)
+      funcs = kern.functions(values)
+      for samp in range(kern.samples):
+        results[idx][samp].add_point(t*sim.time_scale*sim.time_constant, \
+                                     values[:,samp], \
+                                     funcs[:,samp])
+
+  results = []
+  for sim,kern in zip(ensemble.sims,ensemble.kernels):
+    results.append(list(map(lambda _: ADPSimResult(sim), \
+                            range(kern.samples))))
+
+  n = 300.0
+  dt = sim_time/n
+  if n_states == 0:
+    for t in np.linspace(0,sim_time,int(n)):
+      add_points(t,np.zeros(0))
+
+    return results
+
+  x0 = np.concatenate(list(map(lambda entry: \
+                               entry[1].initial_conds().reshape(entry[3]), \
+                               layout)))
+  r = ode(dt_func).set_integrator('zvode', \
+                                  method='bdf')
+  r.set_initial_value(x0,t=0.0)
+  while r.successful() and r.t < sim_time:
+    add_points(r.t,r.y)
+    r.integrate(r.t + dt)
+
+  return results
+
 def get_dsexpr_trajectories(dev,adp,sim,res,recover=True):
   dataset = {}
   times = res.times(rectify=recover)
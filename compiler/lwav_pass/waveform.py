@@ -34,8 +34,8 @@ class Waveform:
                  ampl_units,
                  time_scale=1.0,
                  mag_scale=1.0):
-        self.values = values
-        self.times = times
+        self.values = np.asarray(values,dtype=float)
+        self.times = np.asarray(times,dtype=float)
         self.variable = variable
         self.time_scale = time_scale
         self.mag_scale = mag_scale
@@ -44,11 +44,11 @@ class Waveform:
 
     @property
     def max_time(self):
-        return max(self.times)
+        return np.max(self.times)
 
     @property
     def min_time(self):
-        return min(self.times)
+        return np.min(self.times)
 
     @property
     def npts(self):
@@ -67,9 +67,9 @@ class Waveform:
         return self.max_time - self.min_time
 
     def start_from_zero(self):
-        offset = min(self.times)
-        Tnew = list(map(lambda t: t-offset, self.times))
-        return Waveform(self.variable,Tnew,list(self.values), \
+        offset = self.min_time
+        Tnew = self.times - offset
+        return Waveform(self.variable,Tnew,np.array(self.values), \
                         self.time_units,self.ampl_units, \
                         self.time_scale,self.mag_scale)
 
@@ -77,7 +77,7 @@ class Waveform:
     def resample(self,npts):
         F = interp1d(self.times,self.values, \
                      fill_value='extrapolate')
-        Tnew = np.linspace(min(self.times), max(self.times), \
+        Tnew = np.linspace(self.min_time, self.max_time, \
                            num=npts)
         Xnew = F(Tnew)
         return Waveform(self.variable,Tnew,Xnew, \
@@ -85,17 +85,11 @@ class Waveform:
                         self.time_scale,self.mag_scale)
 
     def trim(self,min_time,max_time):
-        start = 0
-        for i,t in enumerate(self.times):
-            if t >= min_time:
-                start = i
-                break;
-
-        end = len(self.times)
-        for i,t in enumerate(self.times):
-            if t > max_time:
-                end = i
-                break;
+        after_start = np.nonzero(self.times >= min_time)[0]
+        start = after_start[0] if len(after_start) > 0 else 0
+
+        after_end = np.nonzero(self.times > max_time)[0]
+        end = after_end[0] if len(after_end) > 0 else len(self.times)
 
         self.times = self.times[start:end]
         self.values = self.values[start:end]
@@ -124,8 +118,8 @@ class Waveform:
                         mag_scale=obj['mag_scale'])
 
     def recover(self):
-        times = list(map(lambda t: self.rec_time(t), self.times))
-        values = list(map(lambda v: self.rec_value(v), self.values))
+        times = self.rec_time(self.times)
+        values = self.rec_value(self.values)
 
         return Waveform(variable=self.variable, \
                         times=times, \
@@ -137,18 +131,18 @@ class Waveform:
 
 
     def error(self,other):
-        start_time = max(min(self.times),min(other.times))
-        end_time = min(max(self.times),max(other.times))
+        start_time = max(self.min_time,other.min_time)
+        end_time = min(self.max_time,other.max_time)
         npts = 200
 
-        times = np.linspace(start_time,end_time,npts)
-        sumsq = 0.0
-        for t in times:
-            v1 = self.value(t)
-            v2 = other.value(t)
-            sumsq += abs(v1-v2)**2
+        if start_time > end_time:
+            raise Exception("time <%f> must be between %f and %f" \
+                            % (start_time,other.min_time,other.max_time))
 
-        return sumsq
+        times = np.linspace(start_time,end_time,npts)
+        v1 = np.interp(times, self.times, self.values)
+        v2 = np.interp(times, other.times, other.values)
+        return np.sum(np.abs(v1-v2)**2)
 
     def align(self,other,scale_slack=0.02, offset_slack=0.0001):
         if not (self.time_units == other.time_units):
@@ -166,15 +160,15 @@ class Waveform:
             (-offset_slack,offset_slack)
         ]
         print("scaf times: [%s,%s]" \
-              % (min(self.times),max(self.times)))
+              % (self.min_time,self.max_time))
 
         print("sign times: [%s,%s]" \
-              % (min(other.times),max(other.times)))
+              % (other.min_time,other.max_time))
         xform,_ = alignutil.align(self.resample(npts), \
                                   other.resample(npts),xform_spec)
         print(xform)
         print("limits: scale=%s offset=%s" % (xform_spec[0], xform_spec[1]))
-        xformed_times=list(map(lambda t: xform['scale']*t - xform['offset'], other.times))
+        xformed_times = xform['scale']*other.times - xform['offset']
 
         return Waveform(other.variable, \
                         times=xformed_times, \
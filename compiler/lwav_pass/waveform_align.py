@@ -43,19 +43,112 @@ def _compute_loss(tscaff, xscaff, tsig,xsig,xform_spec,xform):
                              debug=False)
     return err
 
-def align(scaffold,sig,xform_spec):
+# percent NRMSD of every (scale,offset) transform of the signal. Linear
+# interpolation commutes with the affine time transform, so sampling the
+# transformed signal at the scaffold times is the same as sampling the
+# original signal at (t+offset)/scale, and all candidates are
+# interpolated in one call.
+def _compute_losses(tscaff,xscaff,tsig,xsig,scales,offsets):
+  query = (tscaff[np.newaxis,:] + offsets[:,np.newaxis]) \
+          / scales[:,np.newaxis]
+  xsig_reflow = np.interp(query.ravel(), tsig, xsig, left=0, right=0) \
+                  .reshape(query.shape)
+  MSE = np.sum((xsig_reflow-xscaff)**2,axis=1)/len(tscaff)
+  FS = float(np.max(xscaff) - np.min(xscaff))
+  if FS == 0:
+    FS = np.max(np.abs(xscaff))
+
+  return np.sqrt(MSE)/FS*100.0
+
+# for each scale, find the offsets that maximize the cross-correlation
+# between the scaffold and the scaled signal. The scaffold must be
+# uniformly sampled.
+def _correlation_offsets(tscaff,xscaff,tsig,xsig,scales,offset_spec, \
+                         n_best=3):
+  n = len(tscaff)
+  dt = (tscaff[-1]-tscaff[0])/(n-1)
+  nfft = 1 << int(math.ceil(math.log2(2*n)))
+  lags = np.arange(-(n-1),n)
+  lag_offsets = lags*dt
+  valid = np.logical_and(lag_offsets >= offset_spec[0], \
+                         lag_offsets <= offset_spec[1])
+
+  ref = xscaff - np.mean(xscaff)
+  fref = np.conj(np.fft.rfft(ref,nfft))
+  cand_scales = []
+  cand_offsets = []
+  indices = np.where(valid)[0]
+  for scale in scales:
+    if len(indices) == 0:
+      break
+
+    sig = np.interp(tscaff/scale, tsig, xsig, left=0, right=0)
+    sig = sig - np.mean(sig)
+    corr = np.fft.irfft(fref*np.fft.rfft(sig,nfft),nfft)
+    # corr[k] = sum_t ref[t]*sig[t+k], with negative lags wrapped around
+    corr = np.concatenate((corr[nfft-(n-1):],corr[:n]))
+    best = indices[np.argsort(-corr[indices])[:n_best]]
+    for idx in best:
+      cand_scales.append(scale)
+      cand_offsets.append(lag_offsets[idx])
+
+  # always consider the unshifted signal and the offset limits
+  for offset in [0.0,offset_spec[0],offset_spec[1]]:
+    for scale in scales:
+      cand_scales.append(scale)
+      cand_offsets.append(min(max(offset,offset_spec[0]),offset_spec[1]))
+
+  return np.array(cand_scales),np.array(cand_offsets)
+
+def align(scaffold,sig,xform_spec,n_scales=41,n_refine=21):
   import compiler.lwav_pass.waveform as wavelib
-  n = 100
+  tscaff = np.asarray(scaffold.times,dtype=float)
+  xscaff = np.asarray(scaffold.values,dtype=float)
+  tsig = np.asarray(sig.times,dtype=float)
+  xsig = np.asarray(sig.values,dtype=float)
+  scale_spec,offset_spec = xform_spec
+
   def objfun(x):
-      return _compute_loss(tscaff=np.array(scaffold.times), \
-                           xscaff=np.array(scaffold.values), \
-                           tsig=np.array(sig.times), \
-                           xsig=np.array(sig.values), \
+      return _compute_loss(tscaff=tscaff, \
+                           xscaff=xscaff, \
+                           tsig=tsig, \
+                           xsig=xsig, \
                            xform_spec=xform_spec, \
                            xform=x)
 
-  time_coeff,time_offset = optimize.brute(objfun,xform_spec,Ns=n)
-  tmeas_xform = time_coeff*np.array(sig.times) - time_offset
+  # coarse search: cross-correlation picks candidate offsets for each scale
+  scales = np.linspace(scale_spec[0],scale_spec[1],n_scales)
+  cand_scales,cand_offsets = _correlation_offsets(tscaff,xscaff, \
+                                                  tsig,xsig, \
+                                                  scales,offset_spec)
+  losses = _compute_losses(tscaff,xscaff,tsig,xsig,cand_scales,cand_offsets)
+  idx = np.argmin(losses)
+  best,best_loss = (cand_scales[idx],cand_offsets[idx]),losses[idx]
+
+  # local refinement: a grid over the neighborhood of the best candidate,
+  # then a simplex search from the best grid point.
+  scale_step = (scale_spec[1]-scale_spec[0])/(n_scales-1)
+  offset_step = max((tscaff[-1]-tscaff[0])/(len(tscaff)-1), \
+                    (offset_spec[1]-offset_spec[0])/(n_scales-1))
+  grid_scales = np.clip(best[0]+np.linspace(-scale_step,scale_step,n_refine), \
+                        scale_spec[0],scale_spec[1])
+  grid_offsets = np.clip(best[1]+np.linspace(-offset_step,offset_step,n_refine), \
+                         offset_spec[0],offset_spec[1])
+  grid_scales,grid_offsets = np.meshgrid(grid_scales,grid_offsets)
+  losses = _compute_losses(tscaff,xscaff,tsig,xsig, \
+                           grid_scales.ravel(),grid_offsets.ravel())
+  idx = np.argmin(losses)
+  if losses[idx] < best_loss:
+    best,best_loss = (grid_scales.ravel()[idx],grid_offsets.ravel()[idx]), \
+                     losses[idx]
+
+  xopt = optimize.fmin(objfun,np.array(best),disp=False)
+  xopt = [_clamp(xopt,xform_spec,0), _clamp(xopt,xform_spec,1)]
+  if objfun(xopt) < best_loss:
+    best = xopt
+
+  time_coeff,time_offset = float(best[0]),float(best[1])
+  tmeas_xform = time_coeff*tsig - time_offset
 
   xform = {'scale':time_coeff, 'offset':time_offset}
   print("scale=%f offset=%f" % (time_coeff,time_offset))
@@ -96,6 +96,9 @@ prof_subp.add_argument('--missing',action='store_true', \
                        help="profiling models with missing data")
 prof_subp.add_argument('--force',action="store_true",help='force')
 prof_subp.add_argument('--widen',action="store_true",help='widen modes')
+prof_subp.add_argument('--planner',type=str,default='grid', \
+                       choices=['grid','adaptive'], \
+                       help="profile the full grid, or sample it adaptively until the model error converges (grid)")
 
 
 
@@ -114,6 +117,7 @@ delta_subp.add_argument('model_number',type=str,help='model number')
 delta_subp.add_argument('--force',action="store_true",help='force')
 delta_subp.add_argument('--no-orphans',action="store_true",help='don\'t add models that don\'t already exist')
 delta_subp.add_argument('--min-points',default=10,help='minimum number of points to fit model')
+delta_subp.add_argument('--jobs',type=int,default=1,help='number of processes used to fit models')
 args = parser.parse_args()
 print(args)
 
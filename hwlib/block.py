@@ -1,7 +1,6 @@
 from enum import Enum
 import ops.interval as interval
 import ops.generic_op as oplib
-import ops.lambda_op as lambdoplib
 import hwlib.exceptions as exceptions
 import numpy as np
 import util.util as util
@@ -861,6 +860,8 @@ class DeltaSpec:
             if not self._params[par].typ.is_correctable(low_level):
                 pdict[par] = self._params[par].val
 
+        # sympy is slow to import, and only needed here
+        import ops.lambda_op as lambdoplib
         return lambdoplib.simplify(self.get_model(pdict))
 
     @property
@@ -1,6 +1,11 @@
 import hwlib.block as blocklib
 import util.paths as pathlib
 import itertools
+import hashlib
+import pickle
+import json
+import io
+import os
 
 class Location:
   WILDCARD = "*"
@@ -222,7 +227,11 @@ class Device:
     self.layout = Layout(self)
     self._pins = {}
     self.time_constant = 1.0
+    self.set_model(model_number,model_subdir)
 
+  # bind the device to a model database. Everything else about the
+  # device is independent of the model.
+  def set_model(self,model_number,model_subdir=""):
     if not model_number is None and "/" in model_number:
       args = model_number.split("/")
       self.model_number = args[-1]
@@ -233,6 +242,7 @@ class Device:
       self.model_subdir = model_subdir
 
     self._physdb = None
+    self._path_index = None
     self._paths = pathlib.DeviceStatePathHandler(self.name, \
                                                  self.model_number, \
                                                  model_subdir=self.model_subdir)
@@ -255,6 +265,17 @@ class Device:
 
     return self._physdb
 
+  # index of the routes between block ports. The index only depends on the
+  # layout, so it is shared by every chip on the board.
+  @property
+  def path_index(self):
+    if self._path_index is None:
+      filename = pathlib.DeviceStatePathHandler.get_path_index_file(self.name)
+      self._path_index = PathIndex(self,filename)
+      self._path_index.load()
+
+    return self._path_index
+
   def set_external_pin(self,pin_id,block,loc,port,chan):
     assert(not pin_id in self._pins)
     assert(block.name in self._blocks)
@@ -279,171 +300,383 @@ class Device:
   def blocks(self):
     return self._blocks.values()
 
-def path_exists(dev,sblk,sport,dblk,dport, \
-                num_route_blocks=4):
-  route_blocks = []
-  interim_paths = []
-  start_paths = []
-  end_paths = []
-  for blk in dev.blocks:
-    if blk.type == blocklib.BlockType.ROUTE:
-      assert(len(blk.inputs) == 1)
-      assert(len(blk.outputs) == 1)
-      route_blocks.append(blk.name)
-
-
-  for csblk,csloc,csport, \
-      cdblk,cdloc,cdport in dev.layout.connections:
-    # internal edge on path
-    if csblk in route_blocks and cdblk in route_blocks and \
-       not (csblk,cdblk) in interim_paths:
-      interim_paths.append((csblk,cdblk))
-
-    # ending edge on path
-    elif csblk in route_blocks and cdblk == dblk and \
-         cdport == dport and not (csblk,cdblk,cdport) in end_paths:
-      end_paths.append((csblk, \
-                        cdblk,cdport))
-    # starting edge on path
-    elif cdblk in route_blocks and csblk == sblk and \
-         csport == sport and not (csblk,csport,cdblk) in start_paths:
-      start_paths.append((csblk,csport, \
-                          cdblk))
-
-
-
-  # return if there's a direct connection without route blocks
-  def has_direct_connection():
-    try:
-      for sl,dl in dev.layout.get_connections(sblk,sport, \
-                                              dblk,dport):
-        return True
+# the device state that is specific to a model database
+MODEL_FIELDS = ['model_number','model_subdir','_physdb','_path_index','_paths']
+
+class DeviceSnapshotPickler(pickle.Pickler):
+
+  def __init__(self,fh,dev):
+    pickle.Pickler.__init__(self,fh,protocol=pickle.HIGHEST_PROTOCOL)
+    self.ids = {id(dev):"device"}
+    for blk in dev.blocks:
+      self.ids[id(blk)] = "block:%s" % blk.name
+
+  def persistent_id(self,obj):
+    return self.ids.get(id(obj))
+
+class DeviceSnapshotUnpickler(pickle.Unpickler):
+
+  def __init__(self,fh,dev,blocks):
+    pickle.Unpickler.__init__(self,fh)
+    self.dev = dev
+    self.blocks = blocks
+
+  def persistent_load(self,key):
+    if key == "device":
+      return self.dev
+    return self.blocks[key.split("block:")[1]]
+
+'''
+Serialized device, so the blocks and the layout don't have to be rebuilt
+every time a tool starts. The snapshot holds the blocks, pickled once and
+shared by every device loaded in the process, and the remaining device
+state with and without the layout. It is rebuilt whenever the version or
+any of the source files change.
+'''
+class DeviceSnapshot:
+  VERSION = 1
+
+  def __init__(self,filename,sources):
+    self.filename = filename
+    self.sources = sources
+    self._signature = None
+    self._blocks = None
+    self._states = None
+
+  @property
+  def signature(self):
+    if self._signature is None:
+      digest = hashlib.md5()
+      for src in sorted(self.sources):
+        digest.update(src.encode('utf-8'))
+        with open(src,'rb') as fh:
+          digest.update(fh.read())
+      self._signature = "v%d:%s" % (DeviceSnapshot.VERSION, \
+                                    digest.hexdigest())
+    return self._signature
+
+  def _read(self):
+    if not self._states is None:
+      return True
+
+    if not os.path.exists(self.filename):
       return False
+
+    try:
+      with open(self.filename,'rb') as fh:
+        if pickle.load(fh) != self.signature:
+          return False
+        blocks = pickle.load(fh)
+        states = pickle.load(fh)
     except Exception as e:
+      print("[warn] cannot read device snapshot <%s>: %s" % (self.filename,e))
       return False
 
-  # walk over paths, starting from shortest
-  def walk_paths(curr_path):
-    if len(curr_path) - 2 >= num_route_blocks:
-      return
+    self._blocks,self._states = blocks,states
+    return True
 
-    if len(curr_path) == 0:
-      if has_direct_connection():
-          yield [(sblk,sport),(dblk,dport)]
+  def load(self,model_number,layout=False,model_subdir=""):
+    if not self._read():
+      return None
+
+    dev = Device.__new__(Device)
+    state = DeviceSnapshotUnpickler(io.BytesIO(self._states[layout]), \
+                                    dev,self._blocks).load()
+    dev.__dict__.update(state)
+    dev.set_model(model_number,model_subdir)
+    return dev
+
+  # devices maps the layout flag to a device. The devices must share
+  # their blocks.
+  def save(self,devices):
+    blocks = dict(devices[False]._blocks)
+    states = {}
+    for layout,dev in devices.items():
+      assert(all(map(lambda blk: blocks[blk.name] is blk, dev.blocks)))
+      state = dict(filter(lambda tup: not tup[0] in MODEL_FIELDS, \
+                          dev.__dict__.items()))
+      fh = io.BytesIO()
+      DeviceSnapshotPickler(fh,dev).dump(state)
+      states[layout] = fh.getvalue()
+
+    tmpfile = "%s.%d" % (self.filename,os.getpid())
+    with open(tmpfile,'wb') as fh:
+      pickle.dump(self.signature,fh)
+      pickle.dump(blocks,fh,protocol=pickle.HIGHEST_PROTOCOL)
+      pickle.dump(states,fh,protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmpfile,self.filename)
+
+    # devices loaded later in this process share the saved blocks
+    self._blocks,self._states = blocks,states
+
+class PathIndex:
+  VERSION = 1
+
+  def __init__(self,dev,filename=None):
+    self.dev = dev
+    self.filename = filename
+    self._paths = {}
+    self._exists = {}
+    self._dirty = False
+    self._build_edges()
+
+  def _build_edges(self):
+    self.route_blocks = set()
+    for blk in self.dev.blocks:
+      if blk.type == blocklib.BlockType.ROUTE:
+        assert(len(blk.inputs) == 1)
+        assert(len(blk.outputs) == 1)
+        self.route_blocks.add(blk.name)
+
+    # edges are bucketed by the block/port they are matched against,
+    # and kept in the same order as the layout connections.
+    self.interim_edges = {}
+    self.start_edges = {}
+    self.end_edges = {}
+    connections = list(self.dev.layout.connections)
+    for csblk,csloc,csport, \
+        cdblk,cdloc,cdport in connections:
+      # internal edge on path
+      if csblk in self.route_blocks and cdblk in self.route_blocks:
+        if not csblk in self.interim_edges:
+          self.interim_edges[csblk] = []
+        self.interim_edges[csblk].append((csblk,csloc,cdblk,cdloc))
+      # ending edge on path
+      elif csblk in self.route_blocks:
+        if not (cdblk,cdport) in self.end_edges:
+          self.end_edges[(cdblk,cdport)] = []
+        self.end_edges[(cdblk,cdport)].append((csblk,csloc, \
+                                               cdblk,cdloc,cdport))
+      # starting edge on path
+      elif cdblk in self.route_blocks:
+        if not (csblk,csport) in self.start_edges:
+          self.start_edges[(csblk,csport)] = []
+        self.start_edges[(csblk,csport)].append((csblk,csloc,csport, \
+                                                 cdblk,cdloc))
+
+    # block-level adjacency between route blocks, ignoring locations
+    self.interim_blocks = {}
+    for csblk,edges in self.interim_edges.items():
+      self.interim_blocks[csblk] = []
+      for _,_,cdblk,_ in edges:
+        if not cdblk in self.interim_blocks[csblk]:
+          self.interim_blocks[csblk].append(cdblk)
+
+    digest = hashlib.md5(repr(connections).encode('utf-8')).hexdigest()
+    self.signature = "v%d:%s" % (PathIndex.VERSION,digest)
+
+  def _walk_blocks(self,sblk,sport,dblk,dport,num_route_blocks):
+    start_paths = []
+    for csblk,_,csport,cdblk,_ in self.start_edges.get((sblk,sport),[]):
+      if not (csblk,csport,cdblk) in start_paths:
+        start_paths.append((csblk,csport,cdblk))
+
+    end_paths = []
+    for csblk,_,cdblk,_,cdport in self.end_edges.get((dblk,dport),[]):
+      if not (csblk,cdblk,cdport) in end_paths:
+        end_paths.append((csblk,cdblk,cdport))
+
+    # return if there's a direct connection without route blocks
+    def has_direct_connection():
+      try:
+        for sl,dl in self.dev.layout.get_connections(sblk,sport, \
+                                                     dblk,dport):
+          return True
+        return False
+      except Exception as e:
+        return False
 
-      for sb,sp,db in start_paths:
-        for path in walk_paths([(sb,sp),(db)]):
-          yield path
+    # walk over paths, starting from shortest
+    def walk_paths(curr_path):
+      if len(curr_path) - 2 >= num_route_blocks:
+        return
 
-    else:
-      db = curr_path[-1]
-      for csb,cdb,cdp in end_paths:
-        if csb == db:
-          new_path = list(curr_path)
-          new_path.append((cdb,cdp))
-          yield new_path
+      if len(curr_path) == 0:
+        if has_direct_connection():
+          yield [(sblk,sport),(dblk,dport)]
+
+        for sb,sp,db in start_paths:
+          for path in walk_paths([(sb,sp),(db)]):
+            yield path
 
-      # find
-      for csb,cdb in interim_paths:
-        if csb == db:
+      else:
+        db = curr_path[-1]
+        for csb,cdb,cdp in end_paths:
+          if csb == db:
+            new_path = list(curr_path)
+            new_path.append((cdb,cdp))
+            yield new_path
+
+        # find
+        for cdb in self.interim_blocks.get(db,[]):
           new_path = list(curr_path)
           new_path.append((cdb))
           for path in walk_paths(new_path):
             yield path
 
-  # enumerate all paths
-  for path in walk_paths([]):
-    return True
-  return False
+    return walk_paths([])
 
+  def _walk_paths(self,sblk,sloc,sport,dblk,dloc,dport,num_route_blocks):
+    start_paths = []
+    for csblk,csloc,csport,cdblk,cdloc in \
+        self.start_edges.get((sblk,sport),[]):
+      csloc = Layout.intersection(csloc,sloc)
+      if not csloc is None:
+        start_paths.append((csblk,csloc,csport,cdblk,cdloc))
 
-def distinct_paths(dev,sblk,sloc,sport,dblk,dloc,dport, \
-                   num_route_blocks=4):
-  route_blocks = []
-  interim_paths = []
-  start_paths = []
-  end_paths = []
-  for blk in dev.blocks:
-    if blk.type == blocklib.BlockType.ROUTE:
-      assert(len(blk.inputs) == 1)
-      assert(len(blk.outputs) == 1)
-      route_blocks.append(blk.name)
-
-  for csblk,csloc,csport, \
-      cdblk,cdloc,cdport in dev.layout.connections:
-    # internal edge on path
-    if csblk in route_blocks and cdblk in route_blocks:
-      interim_paths.append((csblk,csloc, \
-                            cdblk,cdloc))
-    # ending edge on path
-    elif csblk in route_blocks and cdblk == dblk and \
-         cdport == dport:
+    end_paths = []
+    for csblk,csloc,cdblk,cdloc,cdport in \
+        self.end_edges.get((dblk,dport),[]):
       cdloc = Layout.intersection(cdloc,dloc)
       if not cdloc is None:
-        end_paths.append((csblk,csloc, \
-                          cdblk,cdloc,cdport))
-    # starting edge on path
-    elif cdblk in route_blocks and csblk == sblk and \
-         csport == sport:
-      csloc = Layout.intersection(csloc,sloc)
-      if not csloc is None:
-        start_paths.append((csblk,csloc,csport, \
-                            cdblk,cdloc))
+        end_paths.append((csblk,csloc,cdblk,cdloc,cdport))
+
+    # return if there's a direct connection without route blocks
+    def has_direct_connection():
+      try:
+        for sl,dl in self.dev.layout.get_connections(sblk,sport, \
+                                                     dblk,dport):
+          dl = Layout.intersection(dl,dloc)
+          sl = Layout.intersection(sl,sloc)
+          if not dl is None and not sl is None:
+            return True
+        return False
+      except Exception as e:
+        return False
+
+    # walk over paths, starting from shortest
+    def walk_paths(curr_path):
+      if len(curr_path) - 2 >= num_route_blocks:
+        return
+
+      if len(curr_path) == 0:
+        if has_direct_connection():
+          yield [(sblk,sloc,sport),(dblk,dloc,dport)]
+
+        for sb,sl,sp,db,dl in start_paths:
+          for path in walk_paths([(sb,sl,sp),(db,dl)]):
+            yield path
+
+      else:
+        db,dl = curr_path[-1]
+        for csb,csl,cdb,cdl,cdp in end_paths:
+          if csb == db and \
+             not Layout.intersection(csl,dl) is None:
+            new_dl = Layout.intersection(dl,csl)
+            new_path = list(curr_path)
+            new_path[-1] = (db,new_dl)
+            new_path.append((cdb,cdl,cdp))
+            yield new_path
+
+        # find
+        for csb,csl,cdb,cdl in self.interim_edges.get(db,[]):
+          if not Layout.intersection(csl,dl) is None:
+            new_dl = Layout.intersection(dl,csl)
+            new_path = list(curr_path)
+            new_path[-1] = (db,new_dl)
+            new_path.append((cdb,cdl))
+            for path in walk_paths(new_path):
+              yield path
+
+    return walk_paths([])
+
+  def path_exists(self,sblk,sport,dblk,dport,num_route_blocks=4):
+    key = (sblk,sport,dblk,dport,num_route_blocks)
+    if not key in self._exists:
+      exists = False
+      for path in self._walk_blocks(sblk,sport,dblk,dport, \
+                                    num_route_blocks):
+        exists = True
+        break
+
+      self._exists[key] = exists
+      self._dirty = True
+
+    return self._exists[key]
+
+  def distinct_paths(self,sblk,sloc,sport,dblk,dloc,dport, \
+                     num_route_blocks=4):
+    key = (sblk,tuple(sloc),sport,dblk,tuple(dloc),dport,num_route_blocks)
+    if not key in self._paths:
+      self._paths[key] = list(self._walk_paths(sblk,list(sloc),sport, \
+                                               dblk,list(dloc),dport, \
+                                               num_route_blocks))
+      self._dirty = True
+
+    return self._paths[key]
 
+  def to_json(self):
+    return {
+      'signature': self.signature,
+      'paths': list(map(lambda tup: [list(tup[0]),tup[1]], \
+                        self._paths.items())),
+      'exists': list(map(lambda tup: [list(tup[0]),tup[1]], \
+                         self._exists.items()))
+    }
+
+  def load(self):
+    if self.filename is None or not os.path.exists(self.filename):
+      return False
+
+    def to_key(key):
+      return tuple(map(lambda k: tuple(k) if isinstance(k,list) else k, \
+                       key))
+
+    def to_node(node):
+      return tuple(map(lambda k: list(k) if isinstance(k,list) else k, \
+                       node))
 
-  # return if there's a direct connection without route blocks
-  def has_direct_connection():
+    # a corrupt index is treated like a stale one
     try:
-      direct_connections = False
-      for sl,dl in dev.layout.get_connections(sblk,sport, \
-                                                dblk,dport):
-        dl = Layout.intersection(dl,dloc)
-        sl = Layout.intersection(sl,sloc)
-        if not dl is None and not sl is None:
-          direct_connections = True
-          break
-
-      return direct_connections
-    except Exception as e:
+      with open(self.filename,'r') as fh:
+        obj = json.loads(fh.read())
+
+      if obj['signature'] != self.signature:
+        print("[warn] path index <%s> is stale, rebuilding" % self.filename)
+        return False
+
+      paths = {}
+      for key,key_paths in obj['paths']:
+        paths[to_key(key)] = list(map(lambda path: \
+                                      list(map(to_node,path)), \
+                                      key_paths))
+
+      exists = {}
+      for key,key_exists in obj['exists']:
+        exists[to_key(key)] = key_exists
+
+    except (ValueError,KeyError,TypeError) as e:
+      print("[warn] path index <%s> is corrupt, rebuilding: %s" % (self.filename,e))
       return False
 
-  # walk over paths, starting from shortest
-  def walk_paths(curr_path):
-    if len(curr_path) - 2 >= num_route_blocks:
+    self._paths.update(paths)
+    self._exists.update(exists)
+    self._dirty = False
+    return True
+
+  def save(self):
+    if self.filename is None or not self._dirty:
       return
 
-    if len(curr_path) == 0:
-      if has_direct_connection():
-          yield [(sblk,sloc,sport),(dblk,dloc,dport)]
+    # write a complete index or none at all, since concurrent and killed
+    # compiles may save the same index.
+    tmpfile = "%s.%d" % (self.filename,os.getpid())
+    with open(tmpfile,'w') as fh:
+      fh.write(json.dumps(self.to_json()))
+    os.replace(tmpfile,self.filename)
+    self._dirty = False
 
-      for sb,sl,sp,db,dl in start_paths:
-        for path in walk_paths([(sb,sl,sp),(db,dl)]):
-          yield path
 
-    else:
-      db,dl = curr_path[-1]
-      for csb,csl,cdb,cdl,cdp in end_paths:
-        if csb == db and \
-           not Layout.intersection(csl,dl) is None:
-          new_dl = Layout.intersection(dl,csl)
-          new_path = list(curr_path)
-          new_path[-1] = (db,new_dl)
-          new_path.append((cdb,cdl,cdp))
-          yield new_path
-
-      # find
-      for csb,csl,cdb,cdl in interim_paths:
-        if csb == db and \
-           not Layout.intersection(csl,dl) is None:
-          new_dl = Layout.intersection(dl,csl)
-          new_path = list(curr_path)
-          new_path[-1] = (db,new_dl)
-          new_path.append((cdb,cdl))
-          for path in walk_paths(new_path):
-            yield path
+def path_exists(dev,sblk,sport,dblk,dport, \
+                num_route_blocks=4):
+  return dev.path_index.path_exists(sblk,sport,dblk,dport, \
+                                    num_route_blocks=num_route_blocks)
 
 
-  # enumerate all paths
-  for path in walk_paths([]):
+def distinct_paths(dev,sblk,sloc,sport,dblk,dloc,dport, \
+                   num_route_blocks=4):
+  for path in dev.path_index.distinct_paths(sblk,sloc,sport, \
+                                            dblk,dloc,dport, \
+                                            num_route_blocks= \
+                                            num_route_blocks):
     yield path
-
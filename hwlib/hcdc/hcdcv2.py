@@ -1,17 +1,23 @@
 import hwlib.device as devlib
-import hwlib.hcdc.fanout
-import hwlib.hcdc.mult
-import hwlib.hcdc.integ
-import hwlib.hcdc.adc
-import hwlib.hcdc.ext_out
-import hwlib.hcdc.ext_in
-import hwlib.hcdc.lut
-import hwlib.hcdc.dac
-import hwlib.hcdc.routeblocks as routeblocks
 import hwlib.hcdc.llenums as llenums
-import hwlib.hcdc.layout as hcdc_layout
+import util.paths as pathlib
+import glob
+import os
+
+def build_device(model_number,layout=False,model_subdir=""):
+    # the block modules build every block when they're imported, so they
+    # are only imported when there's no device snapshot.
+    import hwlib.hcdc.fanout
+    import hwlib.hcdc.mult
+    import hwlib.hcdc.integ
+    import hwlib.hcdc.adc
+    import hwlib.hcdc.ext_out
+    import hwlib.hcdc.ext_in
+    import hwlib.hcdc.lut
+    import hwlib.hcdc.dac
+    import hwlib.hcdc.routeblocks as routeblocks
+    import hwlib.hcdc.layout as hcdc_layout
 
-def get_device(model_number,layout=False,model_subdir=""):
     hcdcv2 = devlib.Device('hcdcv2',model_number=model_number,model_subdir=model_subdir)
     hcdcv2.add_block(hwlib.hcdc.fanout.fan)
     hcdcv2.add_block(hwlib.hcdc.mult.mult)
@@ -45,7 +51,39 @@ def get_device(model_number,layout=False,model_subdir=""):
                             devlib.Location([0,3,2,0]), \
                             'z', \
                             llenums.Channels.NEG)
-    
+
 
 
     return hcdcv2
+
+_SNAPSHOT = None
+
+def _get_snapshot():
+    global _SNAPSHOT
+    if _SNAPSHOT is None:
+        root = os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","..")
+        sources = []
+        for pattern in ["hwlib/*.py","hwlib/hcdc/*.py","ops/*.py"]:
+            sources += glob.glob(os.path.join(root,pattern))
+
+        _SNAPSHOT = devlib.DeviceSnapshot(pathlib.DeviceStatePathHandler \
+                                          .get_device_snapshot_file('hcdcv2'), \
+                                          sources)
+    return _SNAPSHOT
+
+def get_device(model_number,layout=False,model_subdir="",snapshot=True):
+    if not snapshot:
+        return build_device(model_number,layout=layout,model_subdir=model_subdir)
+
+    snap = _get_snapshot()
+    dev = snap.load(model_number,layout=layout,model_subdir=model_subdir)
+    if dev is None:
+        devices = {}
+        for with_layout in [False,True]:
+            devices[with_layout] = build_device(model_number, \
+                                                layout=with_layout, \
+                                                model_subdir=model_subdir)
+        snap.save(devices)
+        dev = devices[layout]
+
+    return dev
@@ -6,6 +6,9 @@ import hwlib.hcdc.llcmd_characterize as llcmd_characterize
 
 set_conn = llcmd_config.set_conn
 set_state = llcmd_config.set_state
+break_conn = llcmd_config.break_conn
+disable = llcmd_config.disable
+clear = llcmd_config.clear
 execute_simulation = llcmd_sim.execute_simulation
 calibrate = llcmd_calibrate.calibrate
 characterize = llcmd_characterize.characterize
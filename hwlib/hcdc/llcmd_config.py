@@ -8,7 +8,16 @@ import hwlib.hcdc.llcmd_compensate as llcmdcomp
 import ops.generic_op as genoplib
 from hwlib.hcdc.llcmd_util import *
 
-def write_lut(runtime,board,blk,loc,adp):
+# configuration commands return the unpacked response. If wait is false,
+# the command is queued on the runtime and the pending command is
+# returned instead.
+def _run(runtime,cmd,wait):
+    pending = runtime.submit(cmd,callback=unpack_response)
+    if not wait:
+        return pending
+    return runtime.wait(pending)
+
+def write_lut(runtime,board,blk,loc,adp,wait=True):
     cfg = adp.configs.get(blk.name,loc)
     do_compensate = adp.metadata[adplib.ADPMetadata.Keys.LSCALE_SCALE_METHOD]  \
         != lscalelib.ScaleMethod.IDEAL
@@ -35,10 +44,13 @@ def write_lut(runtime,board,blk,loc,adp):
                                        header)
         payload_t,payload_d = make_dataset_t(values)
         cmd = cmd_t.build(cmd_data,debug=True)
-        runtime.execute_with_payload(cmd,payload_d)
-        resp = unpack_response(runtime.result())
+        runtime.submit(cmd,payload=payload_d, \
+                       callback=unpack_response)
 
-def set_state(runtime,board,blk,loc,adp):
+    if wait:
+        runtime.drain()
+
+def set_state(runtime,board,blk,loc,adp,wait=True):
     assert(isinstance(adp,adplib.ADP))
     cfg = adp.configs.get(blk.name,loc)
     if not llenums.BlockType(blk.ll_name).has_state():
@@ -62,14 +74,13 @@ def set_state(runtime,board,blk,loc,adp):
     cmd_t,cmd_data = make_circ_cmd(llenums.CircCmdType.SET_STATE, \
                                        state_data)
     cmd = cmd_t.build(cmd_data,debug=True)
-    runtime.execute(cmd)
-    return unpack_response(runtime.result())
+    return _run(runtime,cmd,wait)
 
 
 
 
 def set_conn(runtime,src_blk,src_loc,src_port, \
-             dest_blk,dest_loc,dest_port):
+             dest_blk,dest_loc,dest_port,wait=True):
     if dest_blk.name == 'lut' or \
        src_blk.name == 'lut':
         return
@@ -84,15 +95,54 @@ def set_conn(runtime,src_blk,src_loc,src_port, \
     cmd_t,cmd_data = make_circ_cmd(llenums.CircCmdType.CONNECT, \
                                    conn_data)
     cmd = cmd_t.build(cmd_data,debug=True)
-    runtime.execute(cmd)
-    return unpack_response(runtime.result())
+    return _run(runtime,cmd,wait)
 
 
 
-def disable(runtime,blk,loc):
+def disable(runtime,blk,loc,wait=True):
     loc_t,loc_d = make_block_loc_t(blk,loc)
     cmd_t,cmd_d = make_circ_cmd(llenums.CircCmdType.DISABLE,  \
                                           {'inst':loc_d})
     cmd = cmd_t.build(cmd_d,debug=True)
-    runtime.execute(cmd)
-    return unpack_response(runtime.result())
+    return _run(runtime,cmd,wait)
+
+def break_conn(runtime,src_blk,src_loc,src_port, \
+               dest_blk,dest_loc,dest_port,wait=True):
+    if dest_blk.name == 'lut' or \
+       src_blk.name == 'lut':
+        return
+
+    ident = src_blk.outputs[src_port].ll_identifier
+    sloc_t,sloc_d = make_port_loc(src_blk,src_loc,ident)
+
+    ident = dest_blk.inputs[dest_port].ll_identifier
+    dloc_t,dloc_d = make_port_loc(dest_blk,dest_loc, \
+                                  ident)
+    conn_data = {"src":sloc_d, "dest":dloc_d}
+    cmd_t,cmd_data = make_circ_cmd(llenums.CircCmdType.BREAK, \
+                                   conn_data)
+    cmd = cmd_t.build(cmd_data,debug=True)
+    return _run(runtime,cmd,wait)
+
+# the board keeps its configuration between commands, so the connections
+# and blocks of an adp are torn down before the next adp is programmed.
+# lookup tables have no enable and are overwritten by the next adp.
+def clear(runtime,board,adp,wait=True):
+    for conn in adp.conns:
+        sblk = board.get_block(conn.source_inst.block)
+        dblk = board.get_block(conn.dest_inst.block)
+        break_conn(runtime,sblk,conn.source_inst.loc, \
+                   conn.source_port, \
+                   dblk,conn.dest_inst.loc, \
+                   conn.dest_port, \
+                   wait=False)
+
+    for cfg in adp.configs:
+        blk = board.get_block(cfg.inst.block)
+        if not llenums.BlockType(blk.ll_name).has_state() or \
+           blk.name == 'lut':
+            continue
+        disable(runtime,blk,cfg.inst.loc,wait=False)
+
+    if wait:
+        runtime.drain()
@@ -5,30 +5,63 @@ import hwlib.adp as adplib
 
 import runtime.models.exp_profile_dataset as exp_profile_lib
 
-def profile(runtime,dev, \
-            blk,loc,adp,output_port, \
-            inputs, \
-            method=llenums.ProfileOpType.INPUT_OUTPUT,quiet=False):
+def make_profile_spec(blk,loc,adp,output_port,inputs, \
+                      method=llenums.ProfileOpType.INPUT_OUTPUT):
     state_t = {blk.name:blk.state.concretize(adp,loc)}
-    # build profiling command
     loc_t,loc_d = llutil.make_block_loc_t(blk,loc)
     values = [0.0]*2
     for input_ident,input_val in inputs.items():
         values[input_ident.code()] = input_val
-    if not quiet:
-       print("profile-inputs: %s" % values)
     profile_data = {"method": method.name, \
                     "inst": loc_d,
                     "in_vals": values, \
                     "state":state_t,
                     "output":output_port.name}
+    return profile_data
+
+def make_profile_command(blk,loc,adp,output_port,inputs, \
+                         method=llenums.ProfileOpType.INPUT_OUTPUT,quiet=False):
+    # build profiling command
+    profile_data = make_profile_spec(blk,loc,adp,output_port,inputs, \
+                                     method=method)
+    if not quiet:
+       print("profile-inputs: %s" % profile_data['in_vals'])
 
     cmd_t, cmd_data = llutil.make_circ_cmd(llenums.CircCmdType.PROFILE,
                              profile_data)
     cmd = cmd_t.build(cmd_data,debug=True)
+    return cmd
+
+def profile(runtime,dev, \
+            blk,loc,adp,output_port, \
+            inputs, \
+            method=llenums.ProfileOpType.INPUT_OUTPUT,quiet=False):
+    cmd = make_profile_command(blk,loc,adp,output_port,inputs, \
+                               method=method,quiet=quiet)
     # execute profiling command
     runtime.execute(cmd)
-    resp = llutil.unpack_response(runtime.result(quiet=quiet))
+    return profile_result(dev,runtime.result(quiet=quiet), \
+                          method=method,quiet=quiet)
+
+'''
+Queue a profiling command on the runtime without waiting for the
+measurement. The result is written to the database when the response
+arrives. Call runtime.drain() to wait for all queued measurements.
+'''
+def submit_profile(runtime,dev, \
+                   blk,loc,adp,output_port, \
+                   inputs, \
+                   method=llenums.ProfileOpType.INPUT_OUTPUT,quiet=False):
+    cmd = make_profile_command(blk,loc,adp,output_port,inputs, \
+                               method=method,quiet=quiet)
+    return runtime.submit(cmd, \
+                          callback=lambda resp: profile_result(dev,resp, \
+                                                               method=method, \
+                                                               quiet=quiet), \
+                          quiet=quiet)
+
+def profile_result(dev,result,method=llenums.ProfileOpType.INPUT_OUTPUT,quiet=False):
+    resp = llutil.unpack_response(result)
 
     # reconstruct analog device program
     new_adp= adplib.ADP()
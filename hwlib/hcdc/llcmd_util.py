@@ -85,7 +85,7 @@ def make_exp_cmd(cmdtype,args,flag):
             }
         }
     }
-    return llstructs.cmd_t(),cmd_d
+    return llstructs.compiled(llstructs.cmd_t()),cmd_d
 
 
 def make_circ_cmd(cmdtype,cmddata):
@@ -99,7 +99,7 @@ def make_circ_cmd(cmdtype,cmddata):
             }
         }
     }
-    return llstructs.cmd_t(),cmd_d
+    return llstructs.compiled(llstructs.cmd_t()),cmd_d
 
 def unpack_response(resp):
   if isinstance(resp,grendel_util.HeaderArduinoResponse):
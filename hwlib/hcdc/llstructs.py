@@ -1,6 +1,30 @@
 import construct as cstruct
 import hwlib.hcdc.llenums as llenums
 
+# struct definitions are immutable, so each builder defines its struct
+# once and returns the same instance on every call. Parsing uses the
+# compiled form of the struct.
+_STRUCTS = {}
+_COMPILED = {}
+
+def _cached(fn):
+    def get():
+        if not fn.__name__ in _STRUCTS:
+            _STRUCTS[fn.__name__] = fn()
+        return _STRUCTS[fn.__name__]
+
+    get.__name__ = fn.__name__
+    get.__doc__ = fn.__doc__
+    get.__wrapped__ = fn
+    return get
+
+def compiled(struct):
+    key = id(struct)
+    if not key in _COMPILED:
+        _COMPILED[key] = (struct,struct.compile())
+    return _COMPILED[key][1]
+
+@_cached
 def lut_source_t():
     kwargs = {
         llenums.LUTSourceType.ADC0.value:0,
@@ -10,6 +34,7 @@ def lut_source_t():
     }
     return cstruct.Enum(cstruct.Int8ul,**kwargs)
 
+@_cached
 def dac_source_t():
     kwargs = {
         llenums.DACSourceType.MEM.value:0,
@@ -19,6 +44,7 @@ def dac_source_t():
     }
     return cstruct.Enum(cstruct.Int8ul,**kwargs)
 
+@_cached
 def range_t():
     kwargs = {
         llenums.RangeType.HIGH.value:0,
@@ -28,6 +54,7 @@ def range_t():
     }
     return cstruct.Enum(cstruct.Int8ul,**kwargs)
 
+@_cached
 def sign_t():
     kwargs = {
         llenums.SignType.POS.value:0,
@@ -35,6 +62,7 @@ def sign_t():
     }
     return cstruct.Enum(cstruct.Int8ul,**kwargs)
 
+@_cached
 def bool_t():
     kwargs = {
         llenums.BoolType.TRUE.value:1,
@@ -42,6 +70,7 @@ def bool_t():
     }
     return cstruct.Enum(cstruct.Int8ul,**kwargs)
 
+@_cached
 def block_type_t():
     kwargs = {
         llenums.BlockType.NOBLOCK.name:0,
@@ -58,6 +87,7 @@ def block_type_t():
     }
     return cstruct.Enum(cstruct.Int8ul,**kwargs)
 
+@_cached
 def port_type_t():
     kwargs = {
         llenums.PortType.IN0.name:0,
@@ -70,6 +100,7 @@ def port_type_t():
     return cstruct.Enum(cstruct.Int8ul,**kwargs)
 
 
+@_cached
 def block_loc_t():
     return cstruct.Struct(
         "block" / block_type_t(),
@@ -79,6 +110,7 @@ def block_loc_t():
         "idx"/cstruct.Int8ul
     )
 
+@_cached
 def port_loc_t():
     return cstruct.Struct(
         "loc"/block_loc_t(),
@@ -86,6 +118,7 @@ def port_loc_t():
     )
 
 # state data
+@_cached
 def adc_state_t():
     return cstruct.Struct(
         "test_en" / bool_t(),
@@ -105,6 +138,7 @@ def adc_state_t():
         "range" / range_t()
     )
 
+@_cached
 def dac_state_t():
     return cstruct.Struct(
         "enable" / bool_t(),
@@ -118,6 +152,7 @@ def dac_state_t():
         "const_code" / cstruct.Int8ul
     )
 
+@_cached
 def mult_state_t():
     return cstruct.Struct(
         "vga" / bool_t(),
@@ -130,6 +165,7 @@ def mult_state_t():
         "gain_code" / cstruct.Int8ul,
     )
 
+@_cached
 def fanout_state_t():
     return cstruct.Struct(
         "pmos" / cstruct.Int8ul,
@@ -141,11 +177,13 @@ def fanout_state_t():
         "third" / bool_t()
     )
 
+@_cached
 def lut_state_t():
     return cstruct.Struct(
         "source" / lut_source_t()
     )
 
+@_cached
 def integ_state_t():
     return cstruct.Struct(
         "cal_enable" / cstruct.Array(3,bool_t()),
@@ -165,6 +203,7 @@ def integ_state_t():
     )
 
 
+@_cached
 def exp_cmd_type():
     kwargs = {
         llenums.ExpCmdType.RESET.name:0,
@@ -176,12 +215,14 @@ def exp_cmd_type():
     return cstruct.Enum(cstruct.Int8ul,
                         **kwargs)
 
+@_cached
 def exp_args_t():
     return cstruct.Union(None,
         "floats" / cstruct.Array(3,cstruct.Float32l),
         "ints" / cstruct.Array(3,cstruct.Int32ul)
     )
 
+@_cached
 def exp_cmd_t():
     return cstruct.Struct(
         "type" / exp_cmd_type(),
@@ -190,6 +231,7 @@ def exp_cmd_t():
         "flag" / cstruct.Int8ul
     )
 
+@_cached
 def circ_cmd_type():
     kwargs = {
         llenums.CircCmdType.NULLCMD.name:0,
@@ -208,6 +250,7 @@ def circ_cmd_type():
                         **kwargs)
 
 # return types
+@_cached
 def state_t():
     return cstruct.Union(None,
                          "lut" / lut_state_t(),
@@ -218,6 +261,7 @@ def state_t():
                          "adc" / adc_state_t()
     )
 
+@_cached
 def calibrate_objective_t():
     kwargs = {
         llenums.CalibrateObjective.MINIMIZE_ERROR.name: 0,
@@ -227,6 +271,7 @@ def calibrate_objective_t():
                         **kwargs)
 
 
+@_cached
 def profile_status_t():
     kwargs = {
         llenums.ProfileStatus.SUCCESS.name: 0,
@@ -236,6 +281,7 @@ def profile_status_t():
                         **kwargs)
 
 
+@_cached
 def profile_type_t():
     kwargs = {
         llenums.ProfileOpType.INPUT_OUTPUT.name: 0,
@@ -249,6 +295,7 @@ def profile_type_t():
 
 
 # returned profiling information
+@_cached
 def profile_result_t():
     return cstruct.Struct(
         "mean" / cstruct.Float32l,
@@ -259,18 +306,21 @@ def profile_result_t():
     )
 
 # high-level commmands
+@_cached
 def cmd_set_state_t():
     return cstruct.Struct(
         "inst" / block_loc_t(),
         "state" / state_t()
     )
 
+@_cached
 def cmd_connection_t():
     return cstruct.Struct(
         "src" / port_loc_t(),
         "dest" / port_loc_t()
     )
 
+@_cached
 def profile_spec_t():
     return cstruct.Struct(
         "inst" / block_loc_t(),
@@ -281,9 +331,11 @@ def profile_spec_t():
         "state" / state_t(),
     )
 
+@_cached
 def cmd_profile_t():
     return profile_spec_t()
 
+@_cached
 def cmd_write_lut_t():
     return cstruct.Struct(
         "inst" / block_loc_t(),
@@ -292,12 +344,14 @@ def cmd_write_lut_t():
     )
 
 
+@_cached
 def cmd_block_loc_t():
     return cstruct.Struct(
         "inst" / block_loc_t()
     )
 
 
+@_cached
 def cmd_calib_t():
     return cstruct.Struct(
         "calib_obj" / calibrate_objective_t(),
@@ -305,6 +359,7 @@ def cmd_calib_t():
     )
 
 
+@_cached
 def circ_cmd_data():
     kwargs = {
         llenums.CircCmdType.SET_STATE.value: cmd_set_state_t(),
@@ -321,6 +376,7 @@ def circ_cmd_data():
     }
     return cstruct.Union(None, **kwargs)
 
+@_cached
 def circ_cmd_t():
     return cstruct.Struct(
         "circ_cmd_type" / circ_cmd_type(),
@@ -328,9 +384,11 @@ def circ_cmd_t():
         "circ_cmd_data" / circ_cmd_data()
     )
 
+@_cached
 def flush_cmd_t():
     return cstruct.Int8ul
 
+@_cached
 def cmd_data():
     kwargs = {
         llenums.CmdType.NULL_CMD.value: cstruct.Int8ul,
@@ -340,6 +398,7 @@ def cmd_data():
     }
     return cstruct.Union(None, **kwargs)
 
+@_cached
 def cmd_type():
     kwargs = {
         llenums.CmdType.NULL_CMD.name:0,
@@ -350,6 +409,7 @@ def cmd_type():
     return cstruct.Enum(cstruct.Int8ul,
                         **kwargs)
 
+@_cached
 def cmd_t():
     return cstruct.Struct(
         "cmd_type" / cmd_type(),
@@ -357,6 +417,7 @@ def cmd_t():
         "cmd_data" / cmd_data()
     )
 
+@_cached
 def response_type_t():
     kwargs = {
         llenums.ResponseType.PROFILE_RESULT.value: 0,
@@ -366,14 +427,20 @@ def response_type_t():
                         **kwargs)
 
 
+# the debugger only re-runs a failed build or parse, so well-formed
+# data is processed once.
 def build(struct,data,debug=True):
-    if debug:
-        cstruct.Debugger(struct).build(data)
-
-    return struct.build(data)
+    try:
+        return compiled(struct).build(data)
+    except cstruct.ConstructError:
+        if debug:
+            cstruct.Debugger(struct).build(data)
+        raise
 
 def parse(struct,data,debug=True):
-    if debug:
-        cstruct.Debugger(struct).parse(data)
-
-    return struct.parse(data)
+    try:
+        return compiled(struct).parse(data)
+    except cstruct.ConstructError:
+        if debug:
+            cstruct.Debugger(struct).parse(data)
+        raise
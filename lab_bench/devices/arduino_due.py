@@ -4,6 +4,7 @@ import re
 from tqdm import tqdm
 import numpy as np
 import os
+import json
 
 
 class ArduinoDue:
@@ -17,6 +18,7 @@ class ArduinoDue:
 
     self._serial_port = file_desc
     self._comm = None
+    self._transcript = None
 
   @staticmethod
   def find_device():
@@ -64,6 +66,8 @@ class ArduinoDue:
     line_bytes = self._comm.readline()
     line_valid_bytes = bytearray(filter(lambda b: b < 128, line_bytes))
     strline = line_valid_bytes.decode('utf-8')
+    if not self._transcript is None:
+      self._transcript['lines'].append(strline)
     return strline
 
   def reads_available(self):
@@ -97,7 +101,18 @@ class ArduinoDue:
     self._comm.write(rawbuf)
     self._comm.flush()
 
+  # record the commands written to the board and the lines it returns.
+  # A saved transcript can be replayed with a FakeArduinoDue.
+  def start_transcript(self):
+    self._transcript = {'commands':[], 'lines':[]}
+
+  def save_transcript(self,filename):
+    with open(filename,'w') as fh:
+      fh.write(json.dumps(self._transcript))
+
   def write_command(self,byts):
+    if not self._transcript is None:
+      self._transcript['commands'].append(bytes(byts).hex())
     self.write_bytes(byts, \
                      suffix=bytearray([253,253,253,253,253]), \
                      prefix=bytearray([254,254,254,254,254]))
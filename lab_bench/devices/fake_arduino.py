@@ -0,0 +1,176 @@
+import os
+import tty
+import json
+import time
+import queue
+import select
+import threading
+
+START_DELIM = 254
+END_DELIM = 253
+DELIMS = 5
+
+def split_responses(lines):
+  '''
+  Split the lines read from the board into the lines printed before the
+  first command, and the lines printed for each command. The board
+  announces every command it starts with a [process] line.
+  '''
+  preamble = []
+  responses = []
+  for line in lines:
+    if "AC:>[process]" in line:
+      responses.append([])
+    if len(responses) == 0:
+      preamble.append(line)
+    else:
+      responses[-1].append(line)
+
+  # the blank line printed before the header belongs to the next response
+  for idx in range(len(responses)):
+    prev = preamble if idx == 0 else responses[idx-1]
+    while len(prev) > 0 and prev[-1].strip() == "":
+      responses[idx].insert(0,prev.pop())
+
+  return preamble,responses
+
+def next_message(buf):
+  '''
+  Extract the first delimited command from the buffer. Returns the
+  command bytes and the rest of the buffer, or None if the buffer does
+  not hold a complete command.
+  '''
+  start = bytes([START_DELIM]*DELIMS)
+  end = bytes([END_DELIM]*DELIMS)
+  sidx = buf.find(start)
+  if sidx < 0:
+    return None,buf
+
+  eidx = buf.find(end,sidx+DELIMS)
+  if eidx < 0:
+    return None,buf
+
+  return bytes(buf[sidx+DELIMS:eidx]),buf[eidx+DELIMS:]
+
+class FakeArduinoDue:
+  '''
+  Stand-in for the Arduino Due that replays a recorded transcript
+  (see ArduinoDue.start_transcript) on a pseudo-terminal. The port name
+  is passed to GrendelRunner in place of the serial device. Each command
+  the host writes is answered with the lines recorded for it.
+
+  If strict is set, every command must match the recorded command. The
+  serial link is modeled by delaying each transfer by its transmission
+  time at <baud_rate> (10 bits per byte), and each command takes
+  <exec_time> seconds to execute on the board.
+  '''
+
+  def __init__(self,commands,lines,strict=True,baud_rate=None,exec_time=0.0):
+    self.commands = list(map(lambda cmd: bytes.fromhex(cmd), commands))
+    self.preamble,self.responses = split_responses(lines)
+    if len(self.responses) != len(self.commands):
+      raise Exception("transcript has %d commands but %d responses" \
+                      % (len(self.commands),len(self.responses)))
+
+    self.strict = strict
+    self.baud_rate = baud_rate
+    self.exec_time = exec_time
+    self.received = 0
+    self._master,self._slave = os.openpty()
+    tty.setraw(self._slave)
+    os.set_blocking(self._master,False)
+    self.port = os.ttyname(self._slave)
+    self._messages = queue.Queue()
+    self._running = False
+    self._threads = []
+
+  @staticmethod
+  def load(filename,**kwargs):
+    with open(filename,'r') as fh:
+      transcript = json.loads(fh.read())
+    return FakeArduinoDue(transcript['commands'],transcript['lines'],**kwargs)
+
+  def _transfer_time(self,nbytes):
+    if self.baud_rate is None:
+      return 0.0
+    return nbytes*10.0/self.baud_rate
+
+  def start(self):
+    self._running = True
+    self._threads = [threading.Thread(target=self._receive,daemon=True), \
+                     threading.Thread(target=self._respond,daemon=True)]
+    for thread in self._threads:
+      thread.start()
+    return self
+
+  def stop(self):
+    self._running = False
+    self._messages.put(None)
+    for thread in self._threads:
+      thread.join()
+    os.close(self._master)
+    os.close(self._slave)
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self,*exc):
+    self.stop()
+
+  def _write(self,text):
+    data = text.encode('utf-8')
+    time.sleep(self._transfer_time(len(data)))
+    # the host may stop reading, so the writes give up once the fake
+    # is stopped.
+    while len(data) > 0 and self._running:
+      _,ready,_ = select.select([],[self._master],[],0.05)
+      if len(ready) == 0:
+        continue
+      try:
+        n = os.write(self._master,data)
+      except BlockingIOError:
+        continue
+      data = data[n:]
+
+  # read commands from the host. A command arrives on the board once it
+  # has been transmitted, after any command that is still in flight.
+  def _receive(self):
+    buf = bytearray()
+    arrival = 0.0
+    while self._running:
+      ready,_,_ = select.select([self._master],[],[],0.05)
+      if len(ready) == 0:
+        continue
+
+      try:
+        buf += os.read(self._master,4096)
+      except BlockingIOError:
+        continue
+      except OSError:
+        return
+
+      msg,buf = next_message(buf)
+      while not msg is None:
+        arrival = max(time.time(),arrival) + \
+                  self._transfer_time(len(msg)+2*DELIMS)
+        self._messages.put((msg,arrival))
+        msg,buf = next_message(buf)
+
+  # execute the commands in order and write the recorded responses.
+  def _respond(self):
+    self._write("".join(self.preamble))
+    while True:
+      item = self._messages.get()
+      if item is None:
+        return
+
+      msg,arrival = item
+      time.sleep(max(0.0,arrival-time.time()) + self.exec_time)
+      idx = self.received
+      self.received += 1
+      if idx >= len(self.responses):
+        self._write("\nAC:>[process]\r\n\nAC:>[error][unexpected command %d]\r\n" % idx)
+      elif self.strict and msg != self.commands[idx]:
+        self._write("\nAC:>[process]\r\n\nAC:>[error][command %d does not match transcript]\r\n" % idx)
+      else:
+        self._write("".join(self.responses[idx]))
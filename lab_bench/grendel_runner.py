@@ -1,39 +1,111 @@
 from lab_bench.devices.arduino_due import ArduinoDue
 import lab_bench.grendel_util as grendel_util
 import lab_bench.generic_util as generic_util
+from collections import deque
 
-class GrendelRunner:
+'''
+A command that has been written to the board, but whose response has not
+been read yet. The callback is applied to the response once it arrives,
+and its return value is the value of the command.
+'''
+class PendingCommand:
+
+  def __init__(self,nbytes,callback=None,quiet=False):
+    self.nbytes = nbytes
+    self.callback = callback
+    self.quiet = quiet
+    self.done = False
+    self.value = None
+
+  def resolve(self,resp):
+    self.value = resp if self.callback is None \
+                 else self.callback(resp)
+    self.done = True
 
+class GrendelRunner:
+  # the board reads one command at a time. The commands queued behind it
+  # wait in the serial receive buffer, which holds 128 bytes on the due.
+  RECEIVE_BUFFER_BYTES = 128
+  DELIMITER_BYTES = 10
 
   def __init__(self, \
                board_name="board6", \
                file_desc=None, \
                native=False, \
-               quiet=False):
+               quiet=False, \
+               window=RECEIVE_BUFFER_BYTES):
     self.due = ArduinoDue(file_desc,native=native)
     self.board_name = board_name
     self.quiet = quiet
+    self.window = window
+    self._pending = deque()
+    self._pending_bytes = 0
 
   def initialize(self):
     self.due.open()
 
   def close(self):
+    # responses of commands that were never waited for are dropped
+    self._pending.clear()
+    self._pending_bytes = 0
     self.due.close()
 
   def result(self,quiet=False):
     return grendel_util.get_response(self.due,quiet=self.quiet or quiet)
 
   def execute(self,cmd):
+    self.drain()
     self.due.write_command(cmd)
 
-  def execute_with_payload(self,header_data,payload_data):
+  def _payload_command(self,header_data,payload_data):
     #pad_size= 80 - 10*4
     pad_size= 35
     n_pad = generic_util.compute_pad_bytes(len(header_data), \
                                            pad_size)
     pad_data = bytearray([0]*n_pad)
-    rawbuf = header_data+pad_data+payload_data
+    return header_data+pad_data+payload_data
+
+  def execute_with_payload(self,header_data,payload_data):
+    rawbuf = self._payload_command(header_data,payload_data)
     self.execute(rawbuf)
 
+  # read the response of the oldest pending command. The board executes
+  # commands in order, so responses arrive in submission order.
+  def _receive(self):
+    pending = self._pending.popleft()
+    self._pending_bytes -= pending.nbytes
+    resp = self.result(quiet=pending.quiet)
+    pending.resolve(resp)
+
+  '''
+  Queue a command without waiting for its response. Commands are written
+  as long as the unanswered commands fit in the receive buffer of the
+  board, so the board always has the next command available while the
+  host processes earlier responses.
+  '''
+  def submit(self,cmd,payload=None,callback=None,quiet=False):
+    if not payload is None:
+      cmd = self._payload_command(cmd,payload)
+
+    nbytes = len(cmd) + GrendelRunner.DELIMITER_BYTES
+    while len(self._pending) > 0 and \
+          self._pending_bytes + nbytes > self.window:
+      self._receive()
+
+    pending = PendingCommand(nbytes,callback=callback,quiet=quiet)
+    self.due.write_command(cmd)
+    self._pending.append(pending)
+    self._pending_bytes += nbytes
+    return pending
+
+  def wait(self,pending):
+    while not pending.done:
+      self._receive()
+    return pending.value
+
+  def drain(self):
+    while len(self._pending) > 0:
+      self._receive()
+
   def dispatch(self):
     raise Exception("OverrideMe: fill in with execution and result processing")
@@ -40,6 +40,8 @@ lgraph_subp.add_argument('--asm-fragments',type=int,default=3,
                          help='number of assembly fragments that are generated')
 lgraph_subp.add_argument('--synth-depth',type=int,default=20,
                          help='depth of synthesis fragments that are generated')
+lgraph_subp.add_argument('--jobs',type=int,default=1,
+                         help='number of processes used to synthesize fragments')
 
 lgraph_subp.add_argument('program', type=str,help='benchmark to compile')
 
@@ -61,6 +63,15 @@ lscale_subp.add_argument('--one-mode',action="store_true", \
                          help="only use the medium mode")
 lscale_subp.add_argument('--no-scale',action="store_true", \
                          help="don't scale the circuit")
+lscale_subp.add_argument('--solver', type=str,default="z3", \
+                         choices=['z3','milp'], \
+                         help="solver for the scaling problem.")
+lscale_subp.add_argument('--jobs',type=int,default=1, \
+                         help="number of processes used to scale circuits.")
+lscale_subp.add_argument('--min-mode-distance',type=int,default=1, \
+                         help="number of blocks whose mode differs between scaled circuits.")
+lscale_subp.add_argument('--portfolio',type=int,default=1, \
+                         help="number of z3 configurations raced for each solution (requires --jobs 1).")
 
 
 
@@ -106,6 +117,14 @@ emul_subp.add_argument('--no-model-error', action='store_true', \
                        help='disable physical database.')
 emul_subp.add_argument('--separate-figures', action='store_true', \
                        help='separate figures.')
+emul_subp.add_argument('--reference', action='store_true', \
+                       help='evaluate block expressions symbolically instead of using the compiled kernel.')
+emul_subp.add_argument('--batch', action='store_true', \
+                       help='emulate all circuits in one integration and rank them by error.')
+emul_subp.add_argument('--samples', type=int, default=1, \
+                       help='number of model error samples to emulate per circuit in batch mode.')
+emul_subp.add_argument('--seed', type=int, default=0, \
+                       help='seed of the model error samples in batch mode.')
 
 
 
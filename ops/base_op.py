@@ -31,6 +31,11 @@ class OpType(Enum):
   ROUND ="round"
 
 class Op:
+    # expressions are not modified after construction, so the string form,
+    # hash and free variables are computed once and cached on the node.
+    _repr_cache = None
+    _hash_cache = None
+    _vars_cache = None
 
     def __init__(self,op,args):
         for arg in args:
@@ -83,19 +88,41 @@ class Op:
         argstr = " ".join(map(lambda arg: str(arg),self._args))
         return "(%s %s)" % (self._op.value,argstr)
 
+    def __str__(self):
+        if self._repr_cache is None:
+            self._repr_cache = self.__repr__()
+        return self._repr_cache
+
     def __eq__(self,other):
         assert(isinstance(other,Op))
+        if self is other:
+            return True
+        if hash(self) != hash(other):
+            return False
         return str(self) == str(other)
 
     def __hash__(self):
-        return hash(str(self))
+        if self._hash_cache is None:
+            self._hash_cache = hash(str(self))
+        return self._hash_cache
+
+    def __getstate__(self):
+        # string hashes are salted per process, so the caches are not pickled
+        # and are recomputed by the process that loads the expression.
+        state = dict(self.__dict__)
+        for key in ['_repr_cache','_hash_cache','_vars_cache']:
+            state.pop(key,None)
+        return state
 
     def vars(self):
-        vars = []
-        for arg in self._args:
-            vars += arg.vars()
+        if self._vars_cache is None:
+            vars = []
+            for arg in self._args:
+                vars += arg.vars()
+
+            self._vars_cache = list(set(vars))
 
-        return list(set(vars))
+        return list(self._vars_cache)
 
     def to_json(self):
       args = list(map(lambda arg: arg.to_json(), \
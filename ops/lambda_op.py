@@ -460,53 +460,11 @@ def Div(a,b):
     return genop.Mult(a,Pow(b,genop.Const(-1)))
 
 
-import sympy
-
 class FromSympyFailed(Exception):
     pass
 
-class SympyExtvar(sympy.Function):
-
-    @classmethod
-    def name(self):
-        return "extvar"
-
-    @classmethod
-    def eval(cls, x):
-        return None
-
-    def _eval_is_real(self):
-        return self.args[0].is_real
-
-    def fdiff(self, argindex=1):
-        if argindex == 1:
-            return 1.0
-        else:
-            raise ArgumentIndexError(self, argindex)
-
-
-class SympyEmit(sympy.Function):
-
-
-    @classmethod
-    def name(self):
-        return "emit"
-
-
-    @classmethod
-    def eval(cls, x):
-        return None
-
-    def _eval_is_real(self):
-        return self.args[0].is_real
-
-    def fdiff(self, argindex=1):
-        if argindex == 1:
-            return 1.0
-        else:
-            raise ArgumentIndexError(self, argindex)
-
 def to_sympy(expr,symbols={},wildcard=False,blacklist={},no_aliasing=False):
+    import sympy
     assert(not (no_aliasing and wildcard))
     if expr.op == OpType.VAR:
         if wildcard:
@@ -610,6 +568,7 @@ def to_sympy(expr,symbols={},wildcard=False,blacklist={},no_aliasing=False):
         raise Exception("unimpl: %s" % expr)
 
 def from_sympy(symexpr,no_aliasing=False):
+    import sympy
     if isinstance(symexpr,sympy.Function):
         if isinstance(symexpr, sympy.sin):
             e0 = from_sympy(symexpr.args[0],no_aliasing)
@@ -703,6 +662,7 @@ def equivalent(expr1,expr2):
     return is_equal
 
 def simplify(expr):
+    import sympy
     e_syms = {}
     se = to_sympy(expr,e_syms)
     se_simpl = sympy.simplify(se)
@@ -0,0 +1,114 @@
+import ops.base_op as baseoplib
+import numpy as np
+
+'''
+Lower an expression tree to numpy source text. Every variable in the
+expression must be bound in `bindings`, which maps variable names
+to source text (e.g. a local variable or a state array index). The
+generated code uses numpy ufuncs, so it evaluates elementwise when the
+bound variables are arrays.
+'''
+def to_numpy(expr,bindings):
+  def rec(e):
+    return to_numpy(e,bindings)
+
+  def binop(fmt):
+    return fmt % (rec(expr.arg(0)),rec(expr.arg(1)))
+
+  def unop(fmt):
+    return fmt % rec(expr.arg(0))
+
+  OpType = baseoplib.OpType
+  if expr.op == OpType.VAR or expr.op == OpType.EXTVAR:
+    if not expr.name in bindings:
+      raise Exception("<%s> not bound" % expr.name)
+    return bindings[expr.name]
+
+  elif expr.op == OpType.CONST:
+    return repr(expr.value)
+
+  elif expr.op == OpType.ADD:
+    return binop("(%s+%s)")
+
+  elif expr.op == OpType.MULT:
+    return binop("(%s*%s)")
+
+  elif expr.op == OpType.POW:
+    return binop("(%s**%s)")
+
+  elif expr.op == OpType.MAX:
+    return binop("np.maximum(%s,%s)")
+
+  elif expr.op == OpType.MIN:
+    return binop("np.minimum(%s,%s)")
+
+  elif expr.op == OpType.ROUND:
+    # mirrors Round.compute
+    return binop("np.maximum(%s,%s)")
+
+  elif expr.op == OpType.EMIT or expr.op == OpType.PAREN:
+    return rec(expr.arg(0))
+
+  elif expr.op == OpType.ABS:
+    return unop("np.abs(%s)")
+
+  elif expr.op == OpType.SGN:
+    return unop("np.copysign(1.0,np.real(%s))")
+
+  elif expr.op == OpType.SIN:
+    return unop("np.sin(np.real(%s))")
+
+  elif expr.op == OpType.COS:
+    return unop("np.cos(np.real(%s))")
+
+  elif expr.op == OpType.CLAMP:
+    ival = expr.interval
+    return "np.clip(%s,%s,%s)" % (rec(expr.arg(0)), \
+                                  repr(ival.lower), \
+                                  repr(ival.upper))
+
+  elif expr.op == OpType.NORMALIZE:
+    return "(%s*(%s-%s))" % (repr(1.0/expr.ampl), \
+                             rec(expr.arg(0)), \
+                             repr(expr.offset))
+
+  elif expr.op == OpType.SMOOTH_STEP:
+    return "(%s*np.tanh(%s)+%s)" % (repr(expr.ampl), \
+                                    rec(expr.arg(0)), \
+                                    repr(expr.offset))
+
+  elif expr.op == OpType.CALL:
+    assigns = dict(zip(expr.func.func_args,expr.values))
+    return rec(expr.func.expr.substitute(assigns))
+
+  else:
+    raise Exception("cannot lower to numpy: %s" % expr)
+
+
+'''
+Compile a numpy source listing into a python function. The environment
+provides the globals the function body may reference (bound callables,
+lookup tables, etc).
+'''
+def compile_function(name,args,body,retval,env={}):
+  src = "def %s(%s):\n" % (name,",".join(args))
+  for line in body:
+    src += "  %s\n" % line
+  src += "  return %s\n" % retval
+
+  glbls = dict(env)
+  glbls['np'] = np
+  code = compile(src,"<npop:%s>" % name,"exec")
+  exec(code,glbls)
+  fn = glbls[name]
+  fn.source = src
+  return fn
+
+'''
+Compile an expression into a function that takes the listed variables
+as positional arguments.
+'''
+def lambdify(expr,variables):
+  bindings = dict(map(lambda v: (v,v), variables))
+  return compile_function("expr",variables,[], \
+                          to_numpy(expr,bindings))
@@ -1,15 +1,19 @@
 import ops.interval as ivallib
 import util.util as util
 import numpy as np
-import itertools
 import scipy.interpolate
-import math
+import scipy.spatial
 
 class ParametricSurface:
 
-  def __init__(self):
+  def __init__(self,neighbors=8,expo=4):
     self._bounds= {}
     self.variables =[]
+    # interpolation technique: inverse distance weighting over the
+    # <neighbors> nearest profiled points
+    self.neighbors = neighbors
+    self.expo = expo
+    self._trees = {}
 
   @property
   def dim(self):
@@ -22,49 +26,61 @@ class ParametricSurface:
 
   def zero(self):
     self.outputs = [0.0]*len(self.outputs)
-
+    self._values = np.zeros(len(self.outputs))
+
+  # nearest neighbour index over the profiled points, for the variables
+  # of a query. Indices are built on first use.
+  def _tree(self,variables):
+    if not variables in self._trees:
+      points = np.array(list(map(lambda v: self.inputs[v], variables)), \
+                        dtype=float).T
+      self._trees[variables] = scipy.spatial.cKDTree(points)
+    return self._trees[variables]
+
+  def get_many(self,inputs):
+    variables = tuple(sorted(inputs.keys()))
+    if len(variables) == 0:
+      return np.full(1,self._values[0])
+
+    query = np.array(list(map(lambda v: np.asarray(inputs[v],dtype=float) \
+                              .ravel(), variables)),dtype=float)
+
+    k = min(self.neighbors,len(self._values))
+    dist,idx = self._tree(variables).query(query.T,k=k)
+    dist = dist.reshape(len(query.T),k)
+    idx = idx.reshape(len(query.T),k)
+
+    # queries on a profiled point return its output
+    exact = dist[:,0] == 0.0
+    dist[exact] = 1.0
+    weights = 1.0/dist**self.expo
+    weights[exact] = 0.0
+    weights[exact,0] = 1.0
+    return np.sum(weights*self._values[idx],axis=1)/np.sum(weights,axis=1)
 
   def get(self,inputs):
-    output = 0.0
-    weight = 0.0
-    # interpolation technique: inverse distance weighting
-    expo = 4
-    for idx,out in enumerate(self.outputs):
-      dist = 0.0
-      for v in inputs.keys():
-        dist += (self.inputs[v][idx] - inputs[v])**2
-
-      dist = math.sqrt(dist)**expo
-      if dist == 0:
-        return out
-
-      output += out*dist
-      weight += dist
-
-    return output/weight
+    return float(self.get_many(dict(map(lambda tup: (tup[0],[tup[1]]), \
+                                        inputs.items())))[0])
 
   def get_grid(self,npts):
-    grid = np.zeros(shape=tuple([npts]*self.dim))
-    indices = list(map(lambda _: list(range(npts)), \
-                       range(self.dim)))
     axes = {}
+    values = []
     for var in self.variables:
       ival = self._bounds[var]
       axes[var] = np.linspace(ival.lower,ival.upper,npts)
+      values.append(list(map(lambda idx: ival.by_index(idx,npts), \
+                             range(npts))))
 
-    for inds in itertools.product(*indices):
-      vdict = {}
-      for idx,var in zip(inds,self.variables):
-        vdict[var] = self._bounds[var].by_index(idx,npts)
-
-      grid[inds] = self.get(vdict)
-
-    return axes,grid
+    mesh = np.meshgrid(*values,indexing='ij')
+    grid = self.get_many(dict(zip(self.variables,mesh)))
+    return axes,grid.reshape(tuple([npts]*self.dim))
 
 
   def fit(self,inputs,outputs,npts=10):
     self.inputs = inputs
     self.outputs = outputs
+    self._values = np.array(outputs,dtype=float)
+    self._trees = {}
 
 def build_surface(block,cfg,port,dataset,output,npts=10,normalize=1.0):
     surf = ParametricSurface()
@@ -22,20 +22,28 @@ def unbox_z3_value(value):
 
 class Z3Ctx:
   def __init__(self,env,optimize=False):
+    # each problem gets its own z3 context, so the solutions don't depend
+    # on the problems solved before it in this process.
+    self._context = z3.Context()
     if optimize:
-      self._solver = z3.Optimize()
+      self._solver = z3.Optimize(ctx=self._context)
     else:
-      self._solver = z3.Solver()
+      self._solver = z3.Solver(ctx=self._context)
     self._do_optimize = False
     self._z3vars = {}
     self._smtvars = {}
     self._smtenv = env
     self._sat = None
     self._model = None
+    self._objective = None
 
   def set_objective(self,objfun):
     self._objective_fun = objfun
     self._do_optimize = True
+
+  def set_params(self,params):
+    for name,value in params.items():
+      self._solver.set(name,value)
  
   def sat(self):
     return self._sat
@@ -48,11 +56,11 @@ class Z3Ctx:
 
   def decl(self,typ,var):
     if typ == SMTEnv.Type.REAL:
-      v = z3.Real(var)
+      v = z3.Real(var,ctx=self._context)
     elif typ == SMTEnv.Type.BOOL:
-      v = z3.Bool(var)
+      v = z3.Bool(var,ctx=self._context)
     elif typ == SMTEnv.Type.INT:
-      v = z3.Int(var)
+      v = z3.Int(var,ctx=self._context)
     else:
       raise Exception("????")
 
@@ -95,7 +103,10 @@ class Z3Ctx:
       'sat': True
     }
     assert(self._do_optimize)
-    handle = self._solver.minimize(self._objective_fun)
+    # the objective is added once, every later call reoptimizes it under
+    # the constraints added since.
+    if self._objective is None:
+      self._objective = self._solver.minimize(self._objective_fun)
     result = self._solver.check()
     self._sat = rmap[str(result)]
     if self.sat():
@@ -141,6 +152,12 @@ class Z3Ctx:
     neg_cstr = SMTMapOr(clauses)
     self.cstr(neg_cstr.to_z3(self))
 
+  # at least <distance> of the variables take a value other than in the model
+  def distance_cstr(self,model,distance):
+    diffs = list(map(lambda tup: z3.If(self.z3var(tup[0]) != tup[1],1,0), \
+                     model.items()))
+    self.cstr(z3.Sum(diffs) >= distance)
+
   def next_solution(self):
     assert(self._sat)
     self.negate_model(self._model)
@@ -3,27 +3,47 @@ import hwlib.block as blocklib
 import hwlib.adp as adplib
 import hwlib.hcdc.llenums as llenums
 
-import ops.generic_op as genoplib
-import ops.lambda_op as lambdoplib
+import ops.npop as npoplib
 import ops.op as oplib
 import itertools
 import math
 import numpy as np
-import scipy
+from scipy import optimize
+
+# compiled model functions, keyed by (expression, array inputs, scalar
+# parameters). The fitting routines are called thousands of times over the
+# same handful of delta model relations.
+_MODEL_FUNCTIONS = {}
+
+'''
+Lower an expression to a numpy function fn(x,p0,...,pn). Every variable in
+`arrays` is bound to a row of x and every variable in `scalars` is bound to
+a positional argument, so the function evaluates all data points at once.
+'''
+def _model_function(expr,arrays,scalars):
+  key = (str(expr),tuple(arrays),tuple(scalars))
+  if key in _MODEL_FUNCTIONS:
+    return _MODEL_FUNCTIONS[key]
+
+  bindings = {}
+  for idx,var in enumerate(arrays):
+    bindings[var] = "x[%d]" % idx
+
+  args = ["x"]
+  for idx,var in enumerate(scalars):
+    args.append("p%d" % idx)
+    bindings[var] = args[-1]
+
+  fn = npoplib.compile_function("model",args,[], \
+                                npoplib.to_numpy(expr,bindings))
+  _MODEL_FUNCTIONS[key] = fn
+  return fn
 
 def _prepare_minimize_model(variables,expr,params,bounds={}):
   n_inputs = len(variables)
   #if phys.model.complete:
   #  return False
 
-  repl = {}
-  dataset = [None]*n_inputs
-  for idx,bound_var in enumerate(variables):
-    repl[bound_var] = genoplib.Var("x[%d]" % idx)
-
-  for par,value in params.items():
-    repl[par] = genoplib.Const(value)
-
   bounds_arr = [(None,None)]*n_inputs
   for var,(lower,upper) in bounds.items():
     if not var in variables:
@@ -31,29 +51,14 @@ def _prepare_minimize_model(variables,expr,params,bounds={}):
     idx = variables.index(var)
     bounds_arr[idx] = (lower,upper)
 
-  conc_expr = expr.substitute(repl)
-  _,pyexpr = lambdoplib.to_python(conc_expr)
+  par_names = list(params.keys())
   return {
-    'expr':pyexpr,
+    'func':_model_function(expr,variables,par_names),
+    'args':tuple(map(lambda p: params[p], par_names)),
     'bounds':bounds_arr,
-    'variable_array':variables
+    'x0':list(map(lambda v: 1, variables))
   }
 
-GLOBAL_MIN_PROG = '''
-from scipy import optimize
-import numpy as np
-
-def func(x):
-  return {expr}
-
-
-x0={x0}
-bnds={bounds}
-lbls={variable_array}
-res = optimize.dual_annealing(func,bounds=bnds)
-assigns = dict(zip(lbls,res.x))
-'''
-
 def global_minimize_model(variables,expr,params,bounds={}):
   if len(variables) == 0:
     return {'values': {}, \
@@ -61,36 +66,16 @@ def global_minimize_model(variables,expr,params,bounds={}):
             'objective_val': expr.compute({})}
 
   fields = _prepare_minimize_model(variables,expr,params,bounds)
-  fields["x0"] = list(map(lambda v: 1, variables))
-  #print(scipy.__version__)
-  snippet = GLOBAL_MIN_PROG.format(**fields) \
-                    .replace('math.','np.')
-  loc = {}
-  exec(snippet,globals(),loc)
+  res = optimize.dual_annealing(fields['func'], \
+                                bounds=fields['bounds'], \
+                                args=fields['args'])
   return {
-    'values': loc['assigns'],
-    'success': loc['res'].success,
-    'objective_val': loc['res'].fun
+    'values': dict(zip(variables,res.x)),
+    'success': res.success,
+    'objective_val': res.fun
   }
 
 
-
-LOCAL_MIN_PROG = '''
-from scipy.optimize import minimize
-import numpy as np
-
-def func(x):
-  return {expr}
-
-
-x0={x0}
-bnds={bounds}
-lbls={variable_array}
-res = minimize(func,x0,bounds=bnds)
-assigns = dict(zip(lbls,res.x))
-'''
-
-
 def local_minimize_model(variables,expr,params,bounds={}):
   if len(variables) == 0:
     return {'values': {}, \
@@ -98,56 +83,30 @@ def local_minimize_model(variables,expr,params,bounds={}):
             'objective_val': expr.compute({})}
 
   fields = _prepare_minimize_model(variables,expr,params,bounds)
-  fields["x0"] = list(map(lambda v: 1, variables))
-  snippet = LOCAL_MIN_PROG.format(**fields) \
-                    .replace('math.','np.')
-  loc = {}
-  exec(snippet,globals(),loc)
+  res = optimize.minimize(fields['func'],fields['x0'], \
+                          args=fields['args'], \
+                          bounds=fields['bounds'])
   return {
-    'values': loc['assigns'],
-    'success': loc['res'].success,
-    'objective_val': loc['res'].fun
+    'values': dict(zip(variables,res.x)),
+    'success': res.success,
+    'objective_val': res.fun
   }
 
 
 def minimize_model(variables,expr,params,bounds={}):
   return local_minimize_model(variables,expr,params,bounds)
 
-FIT_PROG = '''
-from scipy.optimize import curve_fit
-import numpy as np
-
-def func(x,{free_vars}):
-  return {expr}
-
-
-xdata = {x_dataset}
-#print("xdata:",xdata)
-
-ydata = {y_dataset}
-#print("ydata:",ydata)
-
-#print("func:",func)
-
-
-popt,pcov = curve_fit(func,xdata,ydata)
-lbls = [{free_var_array}]
-assigns = dict(zip(lbls,popt))
-perr = np.sqrt(np.diag(pcov))
-'''
-
 
 def fit_model(all_vars,expr,data):
-
-  #print("*********START OF FIT_MODEL*********")
+  expr_vars = expr.vars()
   inputs = {}
   for varname,datum in data['inputs'].items():
-    if varname in expr.vars():
+    if varname in expr_vars:
       inputs[varname] = datum
 
   variables = []
   for varname in all_vars:
-    if varname in expr.vars():
+    if varname in expr_vars:
       variables.append(varname)
 
   if len(variables) == 0:
@@ -155,59 +114,33 @@ def fit_model(all_vars,expr,data):
     return
 
   meas_output = data['meas_mean']
-  n_inputs = len(inputs.keys())
-
-  #if phys.model.complete:
-  #  return False
-  repl = {}
-  dataset = [None]*n_inputs
-  for idx,bound_var in enumerate(inputs.keys()):
-    assert(len(inputs[bound_var]) == len(meas_output))
-    dataset[idx] = inputs[bound_var]
-    #print("dataset[idx] is:", dataset[idx])
-    repl[bound_var] = genoplib.Var("x[%d]" % idx)
-    #print("repl[bound_var]: ",repl[bound_var])
-
-  conc_expr = expr.substitute(repl)
-  _,pyexpr = lambdoplib.to_python(conc_expr)
-  fields = {
-    'free_vars':",".join(variables),
-    'free_var_array':",".join(map(lambda p: '"%s"' % p, variables)),
-    'x_dataset': str(dataset),
-    'y_dataset': str(meas_output),
-    'expr':pyexpr
-  }
-  #print("fields:",fields)
-  snippet = FIT_PROG.format(**fields) \
-                    .replace('math.','np.')
-
-  loc = {}
-  if len(data['meas_mean']) == 0:
+  if len(meas_output) == 0:
     raise Exception("fit_model: cannot fit empty dataset")
 
-  exec(snippet,globals(),loc)
-  parameters = loc['lbls']
-  parameter_values = loc['popt']
-  parameter_stdevs = loc['perr']
+  for bound_var,datum in inputs.items():
+    assert(len(datum) == len(meas_output))
+
+  func = _model_function(expr,list(inputs.keys()),variables)
+  xdata = np.array(list(inputs.values()),dtype=float)
+  ydata = np.array(meas_output,dtype=float)
+  popt,pcov = optimize.curve_fit(func,xdata,ydata)
+  perr = np.sqrt(np.diag(pcov))
   return {
-    'params': dict(zip(parameters,parameter_values)),
-    'param_error': parameter_stdevs
+    'params': dict(zip(variables,popt)),
+    'param_error': perr,
+    'param_cov': pcov
   }
 
 def predict_output(variable_assigns,expr,data):
-  inputs = data['inputs']
-  meas_output = data['meas_mean']
-  npts = len(meas_output)
-  pred = []
-  for idx in range(0,npts):
-    assigns = dict(map(lambda inp: (inp,inputs[inp][idx]), \
-                       inputs.keys()))
-    for param,val in variable_assigns.items():
-      assigns[param] = val
-    value = expr.compute(assigns)
-    pred.append(value)
-
-  return pred
+  params = list(variable_assigns.keys())
+  inputs = list(filter(lambda inp: not inp in variable_assigns, \
+                       data['inputs'].keys()))
+  npts = len(data['meas_mean'])
+  func = _model_function(expr,inputs,params)
+  xdata = np.array(list(map(lambda inp: data['inputs'][inp], inputs)), \
+                   dtype=float)
+  pred = func(xdata,*map(lambda p: variable_assigns[p], params))
+  return list(np.broadcast_to(pred,(npts,)))
 
 def fit_delta_model_to_data(delta_model,relation,data):
   dataset = {}
@@ -10,6 +10,7 @@ import base64
 import json
 import numpy as np
 from enum import Enum
+from contextlib import contextmanager
 
 
 CREATE_DATA_TABLE = '''
@@ -25,6 +26,24 @@ primary key (block,loc,output,static_config,hidden_config,method)
 );
 '''
 
+# profile points, stored as float64 column-major blobs. Points are
+# appended in chunks, keyed by the index of the first point in the chunk.
+CREATE_POINTS_TABLE = '''
+CREATE TABLE IF NOT EXISTS profile_points (
+block text,
+loc text,
+output text,
+static_config text,
+hidden_config text,
+method text,
+chunk integer,
+size integer,
+columns text,
+points blob,
+primary key (block,loc,output,static_config,hidden_config,method,chunk)
+);
+'''
+
 CREATE_DELTA_TABLE = '''
 CREATE TABLE IF NOT EXISTS delta_models (
 block text,
@@ -49,22 +68,40 @@ primary key (block,static_config,output)
 );
 '''
 
+CREATE_INDICES = [
+  "CREATE INDEX IF NOT EXISTS delta_models_by_cfg ON delta_models (block,static_config,calib_obj);",
+  "CREATE INDEX IF NOT EXISTS profile_data_by_cfg ON profile_data (block,static_config);"
+]
+
 class PhysicalDatabase:
   class DB(Enum):
     DELTA_MODELS = "delta_models"
     PHYS_MODELS = "phys_models"
     PROFILE_DATASET = "profile_data"
+    PROFILE_POINTS = "profile_points"
 
-  def __init__(self,filename):
+  def __init__(self,filename,read_only=False):
     self.filename = filename
+    self.read_only = read_only
 
     print("file: %s" % self.filename)
-    self.conn = sqlite3.connect(self.filename)
-    self.curs = self.conn.cursor()
-    self.curs.execute(CREATE_PHYS_TABLE)
-    self.curs.execute(CREATE_DELTA_TABLE)
-    self.curs.execute(CREATE_DATA_TABLE)
-    self.conn.commit()
+    if read_only:
+      self.conn = sqlite3.connect("file:%s?mode=ro" % self.filename, \
+                                  uri=True,timeout=30.0)
+      self.curs = self.conn.cursor()
+    else:
+      self.conn = sqlite3.connect(self.filename,timeout=30.0)
+      # write-ahead logging lets readers proceed while a writer is active.
+      self.conn.execute("PRAGMA journal_mode=WAL;")
+      self.curs = self.conn.cursor()
+      self.curs.execute(CREATE_PHYS_TABLE)
+      self.curs.execute(CREATE_DELTA_TABLE)
+      self.curs.execute(CREATE_DATA_TABLE)
+      self.curs.execute(CREATE_POINTS_TABLE)
+      for cmd in CREATE_INDICES:
+        self.curs.execute(cmd)
+      self.conn.commit()
+    self._transactions = 0
     self.keys = {}
     self.keys[PhysicalDatabase.DB.PHYS_MODELS] = ['block','static_config','output','model']
     self.keys[PhysicalDatabase.DB.DELTA_MODELS] = ['block','loc','output', \
@@ -73,54 +110,139 @@ class PhysicalDatabase:
     self.keys[PhysicalDatabase.DB.PROFILE_DATASET] = ['block','loc','output', \
                                               'static_config','hidden_config', \
                                               'method','dataset']
+    self.keys[PhysicalDatabase.DB.PROFILE_POINTS] = ['block','loc','output', \
+                                             'static_config','hidden_config', \
+                                             'method','chunk','size', \
+                                             'columns','points']
 
     self.updateable = {}
     self.updateable[PhysicalDatabase.DB.PHYS_MODELS] = ['model']
     self.updateable[PhysicalDatabase.DB.DELTA_MODELS] = ['model','model_error']
     self.updateable[PhysicalDatabase.DB.PROFILE_DATASET] = ['dataset']
+    self.updateable[PhysicalDatabase.DB.PROFILE_POINTS] = ['size','columns','points']
 
+    self.primary_keys = {}
+    self.primary_keys[PhysicalDatabase.DB.PHYS_MODELS] = ['block','static_config','output']
+    self.primary_keys[PhysicalDatabase.DB.DELTA_MODELS] = ['block','loc','output', \
+                                                           'static_config','hidden_config', \
+                                                           'calib_obj']
+    self.primary_keys[PhysicalDatabase.DB.PROFILE_DATASET] = ['block','loc','output', \
+                                                              'static_config','hidden_config', \
+                                                              'method']
+    self.primary_keys[PhysicalDatabase.DB.PROFILE_POINTS] = ['block','loc','output', \
+                                                             'static_config','hidden_config', \
+                                                             'method','chunk']
 
+  # group writes into a single transaction, which is committed when the
+  # outermost block exits and rolled back if it raises.
+  @contextmanager
+  def transaction(self):
+    self._transactions += 1
+    try:
+      yield self
+    except:
+      self._transactions -= 1
+      if self._transactions == 0:
+        self.conn.rollback()
+      raise
 
-  def insert(self,db,fields):
+    self._transactions -= 1
+    if self._transactions == 0:
+      self.conn.commit()
+
+  # write a consistent copy of the database to <filename>. The copy
+  # includes committed writes only, and doesn't use a write-ahead log,
+  # so read-only connections leave no side files behind.
+  def snapshot(self,filename):
+    dest = sqlite3.connect(filename)
+    try:
+      self.conn.backup(dest)
+      dest.execute("PRAGMA journal_mode=DELETE;")
+    finally:
+      dest.close()
+
+  def close(self):
+    self.conn.close()
+
+  def _commit(self):
+    if self._transactions == 0:
+      self.conn.commit()
+
+  # values are stored as text, as they were when the statements were
+  # formatted strings. Binary values are stored as blobs.
+  def _row_values(self,db,fields):
+    return list(map(lambda k: fields[k] if isinstance(fields[k],bytes) \
+                    else str(fields[k]), self.keys[db]))
+
+  def _insert_stmt(self,db):
     assert(isinstance(db,PhysicalDatabase.DB))
     row_fields = ",".join(self.keys[db])
-    row_values = ",".join(map(lambda k: "'{%s}'" % k, self.keys[db]))
-    INSERT = '''INSERT INTO %s (%s) VALUES (%s)''' % (db.value, \
-                                                        row_fields, \
-                                                        row_values)
-    cmd = INSERT.format(**fields)
-    self.curs.execute(cmd)
-    self.conn.commit()
+    row_values = ",".join(map(lambda k: "?", self.keys[db]))
+    return "INSERT INTO %s (%s) VALUES (%s)" % (db.value, \
+                                                row_fields, \
+                                                row_values)
+
+  def _upsert_stmt(self,db):
+    upd_frag = ",".join(map(lambda upd: "%s=excluded.%s" % (upd,upd), \
+                            self.updateable[db]))
+    return "%s ON CONFLICT (%s) DO UPDATE SET %s" % (self._insert_stmt(db), \
+                                                    ",".join(self.primary_keys[db]), \
+                                                    upd_frag)
+
+  def insert(self,db,fields):
+    self.curs.execute(self._insert_stmt(db), \
+                      self._row_values(db,fields))
+    self._commit()
+
+  def insert_many(self,db,rows):
+    self.curs.executemany(self._insert_stmt(db), \
+                          map(lambda fields: self._row_values(db,fields), rows))
+    self._commit()
+
+  # insert the row, or update the updateable fields of the row
+  # with the same primary key.
+  def upsert(self,db,fields):
+    self.curs.execute(self._upsert_stmt(db), \
+                      self._row_values(db,fields))
+    self._commit()
+
+  def upsert_many(self,db,rows):
+    self.curs.executemany(self._upsert_stmt(db), \
+                          map(lambda fields: self._row_values(db,fields), rows))
+    self._commit()
 
   def _where_clause(self,db,fields):
     assert(isinstance(db,PhysicalDatabase.DB))
     reqs = []
+    values = []
     where_clause = dict(filter(lambda tup: tup[0] in self.keys[db], \
                                fields.items()))
     for k,v in where_clause.items():
-      reqs.append("%s='%s'" % (k,v.replace("'","''")))
+      reqs.append("%s=?" % k)
+      values.append(str(v))
 
     if len(reqs) > 0:
-      return "WHERE "+(" AND ".join(reqs))
+      return "WHERE "+(" AND ".join(reqs)), values
     else:
-      return ""
+      return "", values
 
   def update(self,db,where_clause,fields):
     assert(isinstance(db,PhysicalDatabase.DB))
-    where_clause_frag = self._where_clause(db,where_clause)
+    where_clause_frag,where_values = self._where_clause(db,where_clause)
     assert(len(where_clause_frag) > 0)
-    upd_frag = ",".join(map(lambda upd: "%s='{%s}'" % (upd,upd), \
+    upd_frag = ",".join(map(lambda upd: "%s=?" % upd, \
                             self.updateable[db]))
+    upd_values = list(map(lambda upd: str(fields[upd]), \
+                          self.updateable[db]))
 
     UPDATE = "UPDATE %s SET %s %s" % (db.value,upd_frag, \
                                       where_clause_frag)
-    cmd = UPDATE.format(**fields)
-    self.curs.execute(cmd)
-    self.conn.commit()
+    self.curs.execute(UPDATE,upd_values+where_values)
+    self._commit()
 
   def _select(self,db,action_clause,where_clause,distinct=False):
     assert(isinstance(db,PhysicalDatabase.DB))
-    where_clause_frag = self._where_clause(db,where_clause)
+    where_clause_frag,where_values = self._where_clause(db,where_clause)
     if distinct:
       command = "SELECT DISTINCT"
     else:
@@ -133,17 +255,22 @@ class PhysicalDatabase:
                               db=db.value,
                               where=where_clause_frag)
 
-    result = self.curs.execute(SELECT)
-    for row in self.curs.fetchall():
-      yield row
+    # rows are streamed from a dedicated cursor, so other statements can
+    # be issued while the caller iterates.
+    curs = self.conn.execute(SELECT,where_values)
+    try:
+      for row in curs:
+        yield row
+    finally:
+      curs.close()
 
   def delete(self,db,where_clause):
     assert(isinstance(db,PhysicalDatabase.DB))
-    where_clause_frag = self._where_clause(db,where_clause)
+    where_clause_frag,where_values = self._where_clause(db,where_clause)
     DELETE = '''DELETE FROM {table} {where}'''
     cmd = DELETE.format(table=db.value, where=where_clause_frag)
-    self.curs.execute(cmd)
-    self.conn.commit()
+    self.curs.execute(cmd,where_values)
+    self._commit()
 
   def select(self,db,fields):
     assert(isinstance(db,PhysicalDatabase.DB))
@@ -162,5 +289,3 @@ class PhysicalDatabase:
                                      where_clause,\
                                      distinct=True):
       yield dict(zip(field_names,field_values))
-
-
@@ -8,6 +8,7 @@ import runtime.runtime_util as runtime_util
 import runtime.models.database as dblib
 
 import numpy as np
+import os
 from enum import Enum
 
 class ExpDeltaModel:
@@ -300,7 +301,7 @@ def __to_delta_models(dev,matches):
       print("[warn] threw error when unpacking delta model: %s" % e)
       continue
 
-def update(dev,model):
+def to_db_row(model):
     assert(isinstance(model,ExpDeltaModel))
     #fields['phys_model'] = phys_util.encode_dict(fields['phys_model'])
     where_clause = {
@@ -316,15 +317,14 @@ def update(dev,model):
     insert_clause['model'] = runtime_util.encode_dict(model.to_json())
     insert_clause['calib_obj'] = model.calib_obj.value
     insert_clause['model_error'] = model.model_error
-    matches = list(dev.physdb \
-                   .select(dblib.PhysicalDatabase.DB.DELTA_MODELS,where_clause))
-    if len(matches) == 0:
-      dev.physdb.insert(dblib.PhysicalDatabase.DB.DELTA_MODELS,insert_clause)
-    elif len(matches) == 1:
-      dev.physdb.update(dblib.PhysicalDatabase.DB.DELTA_MODELS, \
-                        where_clause,insert_clause)
-    else:
-      raise Exception("cannot haave more than one match")
+    return insert_clause
+
+def update(dev,model):
+    dev.physdb.upsert(dblib.PhysicalDatabase.DB.DELTA_MODELS, \
+                      to_db_row(model))
+
+def update_rows(dev,rows):
+    dev.physdb.upsert_many(dblib.PhysicalDatabase.DB.DELTA_MODELS,rows)
 
 
 
@@ -413,6 +413,95 @@ def get_all(dev):
   matches = list(dev.physdb.select(dblib.PhysicalDatabase.DB.DELTA_MODELS, {}))
   return list(__to_delta_models(dev,matches))
 
+def _decode_models(dev,matches):
+  return list(__to_delta_models(dev,matches))
+
+# read-only cache of the delta models in the database, indexed by
+# (block,loc,output,static_config,calib_obj). Rows are decoded on first
+# lookup, and the cache is reloaded whenever the database files change.
+# The cached models are shared, so they must not be modified.
+class ExpDeltaModelCache:
+
+  def __init__(self,dev):
+    self.dev = dev
+    self.filename = dev.physdb.filename
+    self._stamp = None
+    self._rows = {}
+    self._models = {}
+
+  def _db_stamp(self):
+    stamp = []
+    # writes land in the write-ahead log before they reach the database
+    for filename in [self.filename, self.filename+"-wal"]:
+      if os.path.exists(filename):
+        st = os.stat(filename)
+        stamp.append((st.st_mtime_ns,st.st_size))
+      else:
+        stamp.append(None)
+
+    return tuple(stamp)
+
+  def _refresh(self):
+    stamp = self._db_stamp()
+    if stamp == self._stamp:
+      return
+
+    self._rows = {}
+    self._models = {}
+    for row in self.dev.physdb.select(dblib.PhysicalDatabase.DB.DELTA_MODELS, {}):
+      key = (row['block'],row['loc'],row['output'], \
+             row['static_config'],row['calib_obj'])
+      if not key in self._rows:
+        self._rows[key] = []
+      self._rows[key].append(row)
+
+    # the select has no ORDER BY, so the rows are sorted explicitly. Within
+    # a key, the rows only differ in their hidden configuration.
+    for rows in self._rows.values():
+      rows.sort(key=lambda row: row['hidden_config'])
+
+    self._stamp = stamp
+
+  def get_models(self,block,loc,output,config,calib_obj):
+    self._refresh()
+    key = (block.name,str(loc),output.name, \
+           runtime_util.get_static_cfg(block,config), \
+           calib_obj.value)
+    if not key in self._models:
+      self._models[key] = _decode_models(self.dev,self._rows.get(key,[]))
+
+    return list(self._models[key])
+
+  # decode the models of every (block,loc,output,config) request at once
+  def prefetch(self,requests,calib_obj):
+    for block,loc,output,config in requests:
+      self.get_models(block,loc,output,config,calib_obj)
+
+_CACHES = {}
+
+def _get_cache(dev):
+  filename = dev.physdb.filename
+  if not filename in _CACHES or not _CACHES[filename].dev is dev:
+    _CACHES[filename] = ExpDeltaModelCache(dev)
+  return _CACHES[filename]
+
+def get_cached_models(dev,block,loc,output,config,calib_obj):
+  if calib_obj is None:
+    raise Exception("get_cached_models: expected calibration objective")
+
+  return _get_cache(dev).get_models(block,loc,output,config,calib_obj)
+
+# load the delta models table into the cache, so processes forked
+# afterwards share it without querying the database.
+def preload_cached_models(dev):
+  _get_cache(dev)._refresh()
+
+def prefetch_cached_models(dev,requests,calib_obj):
+  if calib_obj is None:
+    raise Exception("prefetch_cached_models: expected calibration objective")
+
+  _get_cache(dev).prefetch(requests,calib_obj)
+
 
 '''
 def get_calibrated_output(dev,block,loc,output,cfg,calib_obj):
@@ -239,18 +239,8 @@ def update(dev,model):
     insert_clause = dict(where_clause)
     insert_clause['model'] = runtime_util \
                              .encode_dict(model.to_json())
-
-    matches = list(dev.physdb.select(dblib\
-                                     .PhysicalDatabase \
-                                     .DB.PHYS_MODELS,where_clause))
-    if len(matches) == 0:
-      dev.physdb.insert(dblib \
-                        .PhysicalDatabase \
-                        .DB.PHYS_MODELS,insert_clause)
-    elif len(matches) == 1:
-      dev.physdb.update(dblib \
-                        .PhysicalDatabase \
-                        .DB.PHYS_MODELS, \
-                        where_clause, insert_clause)
+    dev.physdb.upsert(dblib \
+                      .PhysicalDatabase \
+                      .DB.PHYS_MODELS,insert_clause)
 
 
@@ -8,6 +8,7 @@ import runtime.runtime_util as runtime_util
 import runtime.models.database as dblib
 import ops.generic_op as genoplib
 import ops.op as oplib
+import numpy as np
 from enum import Enum
 
 import util.util as util
@@ -27,8 +28,10 @@ class ExpProfileDataset:
     self.ideal_mean = []
     self.meas_mean = []
     self.meas_stdev = []
-
-
+    # number of points already written to the database, and the file
+    # of that database
+    self.stored = 0
+    self.stored_in = None
 
     variables = self.relation().vars()
     for input_port in self.block.inputs:
@@ -104,7 +107,21 @@ class ExpProfileDataset:
 
 
 
+  # columns loaded from the database are read-only arrays. They are
+  # turned back into lists when new points are added.
+  def _make_appendable(self):
+    for cols in [self.inputs,self.data]:
+      for k,v in cols.items():
+        if isinstance(v,np.ndarray):
+          cols[k] = v.tolist()
+
+    if isinstance(self.ideal_mean,np.ndarray):
+      self.ideal_mean = self.ideal_mean.tolist()
+      self.meas_mean = self.meas_mean.tolist()
+      self.meas_stdev = self.meas_stdev.tolist()
+
   def add(self,config,inputs,mean,std):
+    self._make_appendable()
     assigns = {}
     for input_name in self.inputs.keys():
       self.inputs[input_name].append(inputs[input_name])
@@ -124,8 +141,36 @@ class ExpProfileDataset:
   def size(self):
     return len(self.ideal_mean)
 
+  def columns(self):
+    cols = []
+    for name,values in self.inputs.items():
+      cols.append(("input:%s" % name, values))
+    for name,values in self.data.items():
+      cols.append(("data:%s" % name, values))
+
+    cols.append(("ideal",self.ideal_mean))
+    cols.append(("mean",self.meas_mean))
+    cols.append(("stdev",self.meas_stdev))
+    return cols
+
+  def set_columns(self,cols):
+    for name,values in cols.items():
+      kind,_,field = name.partition(":")
+      if kind == "input":
+        self.inputs[field] = values
+      elif kind == "data":
+        self.data[field] = values
+      elif name == "ideal":
+        self.ideal_mean = values
+      elif name == "mean":
+        self.meas_mean = values
+      elif name == "stdev":
+        self.meas_stdev = values
+      else:
+        raise Exception("unknown column: %s" % name)
+
   @staticmethod
-  def from_json(dev,data):
+  def from_json(dev,data,columns=None):
     blk = dev.get_block(data['block'])
     output = blk.outputs[data['output']]
     loc = devlib.Location.from_json(data['loc'])
@@ -133,6 +178,13 @@ class ExpProfileDataset:
     method = llenums.ProfileOpType(data['method'])
 
     ds = ExpProfileDataset(blk,loc,output,cfg,method)
+    # the points are stored separately, in columnar form
+    if not 'inputs' in data:
+      if not columns is None:
+        ds.set_columns(columns)
+        ds.stored = len(ds)
+        ds.stored_in = dev.physdb.filename
+      return ds
 
     for input_name in ds.inputs.keys():
       ds.inputs[input_name] = data['inputs'][input_name]
@@ -147,22 +199,29 @@ class ExpProfileDataset:
 
     return ds
 
-  def to_json(self):
+  # the header describes the dataset without its points
+  def header_to_json(self):
     return {
       'block': self.block.name,
       'loc':self.loc.to_json(),
       'config': self.config.to_json(),
       'output': self.output.name,
-      'inputs': self.inputs,
-      'method': self.method.value,
-      'data': self.data,
-      'ideal': self.ideal_mean,
-      'meas': {
-        'mean': self.meas_mean,
-        'stdev': self.meas_stdev
-      }
+      'method': self.method.value
     }
 
+  def to_json(self):
+    obj = self.header_to_json()
+    obj['inputs'] = dict(map(lambda tup: (tup[0],list(tup[1])), \
+                             self.inputs.items()))
+    obj['data'] = dict(map(lambda tup: (tup[0],list(tup[1])), \
+                           self.data.items()))
+    obj['ideal'] = list(self.ideal_mean)
+    obj['meas'] = {
+      'mean': list(self.meas_mean),
+      'stdev': list(self.meas_stdev)
+    }
+    return obj
+
   def __len__(self):
     return len(self.meas_mean)
 
@@ -184,11 +243,54 @@ class ExpProfileDataset:
 
     return st
 
-def __to_datasets(dev,matches):
+def _dataset_key(row):
+  return (row['block'],row['loc'],row['output'], \
+          row['static_config'],row['hidden_config'],row['method'])
+
+def _encode_points(dataset,start):
+  cols = dataset.columns()
+  points = np.array(list(map(lambda col: np.asarray(col[1],dtype=np.float64)[start:], \
+                             cols)), \
+                    dtype=np.float64)
+  return ",".join(map(lambda col: col[0], cols)), points.tobytes()
+
+# the columns of a single chunk are views into the blob. Datasets stored
+# in several chunks are concatenated.
+def _decode_points(rows):
+  chunks = []
+  for row in sorted(rows, key=lambda row: int(row['chunk'])):
+    names = row['columns'].split(",")
+    points = np.frombuffer(row['points'],dtype=np.float64) \
+               .reshape(len(names),int(row['size']))
+    chunks.append(dict(zip(names,points)))
+
+  if len(chunks) == 1:
+    return chunks[0]
+
+  return dict(map(lambda name: (name, \
+                                np.concatenate(list(map(lambda ch: ch[name], \
+                                                        chunks)))), \
+                  chunks[0].keys()))
+
+def _select_points(dev,where_clause):
+  points = {}
+  for row in dev.physdb.select(dblib.PhysicalDatabase.DB.PROFILE_POINTS, \
+                               where_clause):
+    key = _dataset_key(row)
+    if not key in points:
+      points[key] = []
+    points[key].append(row)
+  return points
+
+def __to_datasets(dev,matches,where_clause={}):
+  points = _select_points(dev,where_clause) if len(matches) > 0 else {}
   for match in matches:
     try:
+      key = _dataset_key(match)
+      columns = _decode_points(points[key]) if key in points else None
       yield ExpProfileDataset.from_json(dev, \
-                                        runtime_util.decode_dict(match['dataset']))
+                                        runtime_util.decode_dict(match['dataset']), \
+                                        columns)
     except Exception as e:
       pass
 
@@ -245,6 +347,9 @@ def _derive_where_clause(clauses,block,loc,output,cfg,method,calib_obj):
 
 
 
+# only the points added since the dataset was loaded are written. A
+# dataset with no points stored in this database replaces any existing
+# dataset, so copying a dataset to another database writes all of it.
 def update(dev,dataset):
     assert(isinstance(dataset,ExpProfileDataset))
     #fields['phys_dataset'] = phys_util.encode_dict(fields['phys_dataset'])
@@ -256,16 +361,26 @@ def update(dev,dataset):
       'static_config': dataset.static_cfg,
       'hidden_config': dataset.hidden_cfg
     }
-    insert_clause = dict(where_clause)
-    insert_clause['dataset'] = runtime_util.encode_dict(dataset.to_json())
-
-    matches = list(dev.physdb.select(dblib.PhysicalDatabase.DB.PROFILE_DATASET, \
-                                     where_clause))
-    if len(matches) == 0:
-      dev.physdb.insert(dblib.PhysicalDatabase.DB.PROFILE_DATASET,insert_clause)
-    elif len(matches) == 1:
-      dev.physdb.update(dblib.PhysicalDatabase.DB.PROFILE_DATASET, \
-                        where_clause,insert_clause)
+    stored = dataset.stored \
+             if dataset.stored_in == dev.physdb.filename else 0
+    with dev.physdb.transaction():
+      if stored == 0:
+        insert_clause = dict(where_clause)
+        insert_clause['dataset'] = runtime_util.encode_dict(dataset.header_to_json())
+        dev.physdb.upsert(dblib.PhysicalDatabase.DB.PROFILE_DATASET,insert_clause)
+        dev.physdb.delete(dblib.PhysicalDatabase.DB.PROFILE_POINTS,where_clause)
+
+      if len(dataset) > stored:
+        columns,points = _encode_points(dataset,stored)
+        insert_clause = dict(where_clause)
+        insert_clause['chunk'] = stored
+        insert_clause['size'] = len(dataset)-stored
+        insert_clause['columns'] = columns
+        insert_clause['points'] = points
+        dev.physdb.insert(dblib.PhysicalDatabase.DB.PROFILE_POINTS,insert_clause)
+
+    dataset.stored = len(dataset)
+    dataset.stored_in = dev.physdb.filename
 
 def load(dev,block,loc,output,cfg,method):
     where_clause = {
@@ -279,7 +394,7 @@ def load(dev,block,loc,output,cfg,method):
     matches = list(dev.physdb.select(dblib.PhysicalDatabase.DB.PROFILE_DATASET,
                                      where_clause))
     if len(matches) == 1:
-      return list(__to_datasets(dev,matches))[0]
+      return list(__to_datasets(dev,matches,where_clause))[0]
     elif len(matches) == 0:
       pass
     else:
@@ -305,12 +420,14 @@ def remove_all(dev):
   where_clause = {}
   dev.physdb.delete(dblib.PhysicalDatabase.DB.PROFILE_DATASET, \
                     where_clause)
+  dev.physdb.delete(dblib.PhysicalDatabase.DB.PROFILE_POINTS, \
+                    where_clause)
 
 
 def get_datasets(dev,clauses,block=None,loc=None,output=None,config=None,method=None,calib_obj=None):
   where_clause = _derive_where_clause(clauses,block,loc,output,config,method,calib_obj)
   matches = list(dev.physdb.select(dblib.PhysicalDatabase.DB.PROFILE_DATASET, where_clause))
-  datasets = list(__to_datasets(dev,matches))
+  datasets = list(__to_datasets(dev,matches,where_clause))
   return datasets
 
 
@@ -318,6 +435,8 @@ def remove_datasets(dev,clauses,block=None,loc=None,output=None,config=None,meth
   where_clause = _derive_where_clause(clauses,block,loc,output,config,calib_obj)
   dev.physdb.delete(dblib.PhysicalDatabase.DB.PROFILE_DATASET, \
                     where_clause)
+  dev.physdb.delete(dblib.PhysicalDatabase.DB.PROFILE_POINTS, \
+                    where_clause)
 
 
 
@@ -7,9 +7,12 @@ import random
 import itertools
 import ops.opparse as opparse
 import time
+import math
+import numpy as np
 import matplotlib.pyplot as plt
 
 import runtime.runtime_util as runtime_util
+import runtime.fit.model_fit as fitlib
 
 class ProfilePlanner:
 
@@ -17,6 +20,9 @@ class ProfilePlanner:
     self.block = block
     self.loc = loc
     self.config = cfg
+    # adaptive planners choose the next inputs from the measurements
+    # of the previous ones, see observe()
+    self.adaptive = False
 
   def next_hidden(self):
     raise NotImplementedError
@@ -28,6 +34,8 @@ class ProfilePlanner:
   def next_dynamic(self):
     raise NotImplementedError
 
+  def observe(self,dataset):
+    pass
 
 
 class BruteForcePlanner(ProfilePlanner):
@@ -121,6 +129,247 @@ class SingleDefaultPointPlanner(BruteForcePlanner):
     self.hidden_iterator = None
     return value
 
+class AdaptivePlanner(SingleDefaultPointPlanner):
+  '''
+  Profiles the default hidden state, measuring the points of the n x m
+  grid of the brute force planner where the delta model is least certain.
+  The planner measures a space-filling seed design, then fits the delta
+  model to the measurements and picks the next <batch> grid points with the
+  highest score, which grows with the distance to the nearest measured
+  point, the residuals of the nearest measured points and the predictive
+  standard deviation of the fit. Profiling stops once the standard error
+  of the model error is within <tolerance> of the model error, and the
+  model error moved less than its standard error over the last <patience>
+  batches, or when <max_points> points are measured.
+
+  The profiler measures each batch and passes the dataset to observe(),
+  which plans the next batch. Points already in the dataset are reused.
+  Methods other than INPUT_OUTPUT are profiled on the full grid.
+  '''
+
+  def __init__(self,block,loc,output,method,cfg,n,m,reps, \
+               max_points,min_points=0,batch=4,patience=2,tolerance=0.1):
+    SingleDefaultPointPlanner.__init__(self,block,loc,output,method,cfg, \
+                                       n,m,reps)
+    self.max_points = max_points
+    self.min_points = min_points
+    self.batch = batch
+    self.patience = patience
+    self.tolerance = tolerance
+    self.model_errors = []
+    self.converged = False
+
+  @property
+  def relation(self):
+    spec = self.output.deltas[self.config.mode]
+    return self.method.get_expr(self.block,spec.relation)
+
+  def new_dynamic(self):
+    BruteForcePlanner.new_dynamic(self)
+    self.adaptive = (self.method == llenums.ProfileOpType.INPUT_OUTPUT)
+    if not self.adaptive:
+      return
+
+    # the grid of the brute force planner is the candidate set
+    points = list(dict.fromkeys(self.dynamic_iterator))
+    self.dynamic_iterator = None
+    self._grid = np.array(points,dtype=float).reshape(len(points), \
+                                                      len(self._dynamic_fields))
+    self._lower = self._grid.min(axis=0)
+    scale = self._grid.max(axis=0) - self._lower
+    self._scale = np.where(scale > 0, scale, 1.0)
+    # points closer than a grid cell are not measured in the same batch
+    spacing = []
+    for col in self._normalize(self._grid).T:
+      diffs = np.diff(np.unique(col))
+      spacing.append(diffs.min() if len(diffs) > 0 else 0.0)
+    self._spacing = max(math.sqrt(sum(map(lambda h: h*h, spacing))),1e-6)
+
+    self._batch = []
+    # grid points requested so far. Failed measurements are not stored,
+    # so they are not requested again.
+    self._requested = np.zeros(len(self._grid),dtype=bool)
+    self._initial_points = None
+    self.model_errors = []
+    self.converged = False
+
+  def next_dynamic(self):
+    if not self.adaptive:
+      return BruteForcePlanner.next_dynamic(self)
+
+    if len(self._batch) == 0:
+      return None
+
+    self.dynamic_index += 1
+    values = self._batch.pop(0)
+    return dict(zip(self._dynamic_fields,values))
+
+  def _normalize(self,points):
+    return (points - self._lower)/self._scale
+
+  def _columns(self,points):
+    return dict(map(lambda tup: (tup[1],list(points[:,tup[0]])), \
+                    enumerate(self._dynamic_fields)))
+
+  def _fit(self,points,meas):
+    data = {'inputs':self._columns(points), 'meas_mean':list(meas)}
+    spec = self.output.deltas[self.config.mode]
+    try:
+      result = fitlib.fit_model(spec.params,self.relation,data)
+    except Exception:
+      return None
+
+    if result is None:
+      return None
+
+    pred = np.array(fitlib.predict_output(result['params'], \
+                                          self.relation,data))
+    error = math.sqrt(np.mean((meas-pred)**2))
+    return result,meas-pred,error
+
+  # standard deviation of the fitted relation at the given points, from
+  # the linearized parameter covariance.
+  def _predictive_std(self,result,points):
+    params = result['params']
+    cov = np.array(result['param_cov'],dtype=float)
+    if not np.all(np.isfinite(cov)):
+      return None
+
+    data = {'inputs':self._columns(points), 'meas_mean':[0.0]*len(points)}
+    base = np.array(fitlib.predict_output(params,self.relation,data))
+    jac = np.zeros((len(points),len(params)))
+    for idx,par in enumerate(params.keys()):
+      step = 1e-6*max(1.0,abs(params[par]))
+      pert = dict(params)
+      pert[par] += step
+      jac[:,idx] = (np.array(fitlib.predict_output(pert,self.relation,data)) \
+                    - base)/step
+
+    var = np.einsum('ij,jk,ik->i',jac,cov,jac)
+    return np.sqrt(np.maximum(var,0.0))
+
+  def _select(self,candidates,scores,n):
+    scores = np.array(scores,dtype=float)
+    selected = []
+    for _ in range(min(n,len(candidates))):
+      idx = int(np.argmax(scores))
+      selected.append(idx)
+      dist = np.linalg.norm(candidates-candidates[idx],axis=1)
+      scores = scores*(1.0-np.exp(-(dist/self._spacing)**2))
+      scores[idx] = -1.0
+    return selected
+
+  # farthest point sampling, starting from the measured points
+  def _space_filling(self,candidates,measured,n):
+    if len(measured) > 0:
+      dist = np.min(np.linalg.norm(candidates[:,None,:]-measured[None,:,:], \
+                                   axis=2),axis=1)
+    else:
+      dist = np.full(len(candidates),np.inf)
+
+    selected = []
+    for _ in range(min(n,len(candidates))):
+      idx = int(np.argmax(dist))
+      selected.append(idx)
+      dist = np.minimum(dist,np.linalg.norm(candidates-candidates[idx],axis=1))
+      dist[idx] = -1.0
+    return selected
+
+  def _request(self,indices):
+    self._requested[indices] = True
+    self._batch = list(map(lambda i: tuple(self._grid[i]), indices))
+
+  def _measured(self,dataset):
+    if dataset is None or len(dataset) == 0:
+      return np.zeros((0,len(self._dynamic_fields))),np.zeros(0)
+
+    columns = []
+    for field in self._dynamic_fields:
+      if field in dataset.inputs:
+        columns.append(dataset.inputs[field])
+      else:
+        columns.append(dataset.data[field])
+
+    return np.array(columns,dtype=float).T, \
+      np.array(dataset.meas_mean,dtype=float)
+
+  def _has_converged(self,points,meas):
+    # the model error of the last <patience> batches is recomputed from
+    # the dataset, so profiling resumes where an earlier run stopped.
+    npts = len(meas)
+    errors = []
+    for size in range(npts-self.patience*self.batch,npts+1,self.batch):
+      fit = self._fit(points[:size],meas[:size]) if size > 0 else None
+      if fit is None:
+        return False
+      errors.append(fit[2])
+
+    nparams = len(self.output.deltas[self.config.mode].params)
+    stderr = errors[-1]/math.sqrt(2.0*max(1,npts-nparams))
+    if stderr > self.tolerance*errors[-1]:
+      return False
+    return all(map(lambda err: abs(errors[-1]-err) <= stderr, errors))
+
+  def observe(self,dataset):
+    points,meas = self._measured(dataset)
+    npts = len(meas)
+    normed = self._normalize(self._grid)
+    measured = self._normalize(points)
+    if npts > 0:
+      dist = np.min(np.linalg.norm(normed[:,None,:]-measured[None,:,:], \
+                                   axis=2),axis=1)
+      remaining = np.where((dist > 1e-9) & ~self._requested)[0]
+    else:
+      remaining = np.where(~self._requested)[0]
+
+    if self._initial_points is None:
+      self._initial_points = npts
+    budget = self.max_points - self._initial_points \
+      - int(np.sum(self._requested))
+    if budget <= 0 or len(remaining) == 0:
+      self.converged = True
+      return
+
+    nparams = len(self.output.deltas[self.config.mode].params)
+    n_seed = max(nparams+2,2**len(self._dynamic_fields)+1,self.batch)
+    n = min(self.batch,budget)
+    fit = self._fit(points,meas) if npts >= n_seed else None
+    if fit is None:
+      selected = self._space_filling(normed[remaining],measured, \
+                                     min(max(n_seed-npts,n),budget))
+      self._request(remaining[selected])
+      return
+
+    result,residuals,error = fit
+    self.model_errors.append(error)
+    print("adaptive npts=%d model-error=%f" % (npts,error))
+    if npts >= self.min_points and \
+       self._has_converged(points,meas):
+      print("adaptive converged npts=%d" % npts)
+      self.converged = True
+      return
+
+    candidates = normed[remaining]
+    std = self._predictive_std(result,self._grid[remaining])
+    if std is None:
+      std = np.zeros(len(remaining))
+
+    # inverse distance weighted residuals of the nearest measurements
+    dist = np.linalg.norm(candidates[:,None,:]-measured[None,:,:],axis=2)
+    k = min(3,npts)
+    nearest = np.argsort(dist,axis=1)[:,:k]
+    weights = 1.0/np.take_along_axis(dist,nearest,axis=1)
+    local = np.sum(weights*np.abs(residuals)[nearest],axis=1) \
+      /np.sum(weights,axis=1)
+    coverage = np.minimum(1.0,dist.min(axis=1)/(4*self._spacing))
+
+    # the dataset is fit without weights, so the residuals at most double
+    # the priority of a region, which keeps the design close to uniform.
+    scale = max(error,1e-12)
+    scores = coverage*(1.0+np.minimum(1.0,local/scale)) + std/scale
+    selected = self._select(candidates,scores,n)
+    self._request(remaining[selected])
+
 class SingleTargetedPointPlanner(BruteForcePlanner):
 
   def __init__(self,block,loc,output,cfg,method,n,m,reps,hidden_codes):
@@ -4,8 +4,9 @@ import hwlib.adp as adplib
 import hwlib.hcdc.llstructs as llstructs
 import hwlib.hcdc.llenums as llenums
 from hwlib.hcdc.llcmd_calibrate import calibrate
-from hwlib.hcdc.llcmd_profile import profile
+from hwlib.hcdc.llcmd_profile import submit_profile
 import hwlib.hcdc.hcdcv2 as hcdclib
+import runtime.models.exp_profile_dataset as exp_profile_lib
 import itertools
 import ops.op as oplib
 
@@ -52,32 +53,47 @@ def profile_hidden_state(runtime,dev,planner,hidden,adp=None,quiet=False):
   planner.new_dynamic()
   output = planner.output
   method = planner.method
-  dynamic = planner.next_dynamic()
-  while not dynamic is None:
-    input_vals = {}
-    for name,value in dynamic.items():
-      if planner.block.data.has(name):
-        assert(isinstance(config[name],  \
-                          adplib.ConstDataConfig))
-        config[name].value = value
-      else:
-        st = planner.block.inputs[name]
-        input_vals[st.ll_identifier] = value
-    
-    if not quiet:
-       print("-> input %s" % str(dynamic))
+  # the measurements are pipelined: each input point is queued on the
+  # board while the responses of earlier points are stored, and the
+  # measurements of the hidden state are committed together.
+  with dev.physdb.transaction():
+    while True:
+      dynamic = planner.next_dynamic()
+      # adaptive planners pick the next inputs from the measurements, so
+      # the queued measurements are collected first.
+      if dynamic is None and planner.adaptive:
+        runtime.drain()
+        planner.observe(exp_profile_lib.load(dev,planner.block,planner.loc, \
+                                             output,config,method))
+        dynamic = planner.next_dynamic()
 
-    profile(runtime, \
-            dev, \
-            planner.block, \
-            planner.loc, \
-            new_adp, \
-            output.ll_identifier, \
-            method=method, \
-            inputs=input_vals, \
-            quiet=quiet)
+      if dynamic is None:
+        break
 
-    dynamic = planner.next_dynamic()
+      input_vals = {}
+      for name,value in dynamic.items():
+        if planner.block.data.has(name):
+          assert(isinstance(config[name],  \
+                            adplib.ConstDataConfig))
+          config[name].value = value
+        else:
+          st = planner.block.inputs[name]
+          input_vals[st.ll_identifier] = value
+
+      if not quiet:
+         print("-> input %s" % str(dynamic))
+
+      submit_profile(runtime, \
+                     dev, \
+                     planner.block, \
+                     planner.loc, \
+                     new_adp, \
+                     output.ll_identifier, \
+                     method=method, \
+                     inputs=input_vals, \
+                     quiet=quiet)
+
+    runtime.drain()
 
 def profile_all_hidden_states(runtime,dev,planner,adp=None,quiet=False):
   planner.new_hidden()
@@ -2,10 +2,9 @@ from hwlib.adp import ADP,ADPMetadata
 
 import runtime.runtime_util as runtime_util
 import runtime.runtime_meta_util as runtime_meta_util
+import runtime.runtime_session as runtime_session
 import runtime.models.exp_delta_model as delta_model_lib
 
-from lab_bench.grendel_runner import GrendelRunner
-
 import hwlib.hcdc.llenums as llenums
 import hwlib.hcdc.llcmd as llcmd
 import time
@@ -16,14 +15,12 @@ def is_calibrated(board,blk,loc,cfg,calib_obj):
                                         block=blk,loc=loc,config=cfg, calib_obj=calib_obj)
     return len(models) > 0
 
-def calibrate_adp(args):
-    board = runtime_util.get_device(args.model_number)
-    adp = runtime_util.get_adp(board,args.adp,widen=args.widen)
+def calibrate(session,model_number,adp_file,calib_obj,widen=False):
+    board = session.get_device(model_number)
+    adp = runtime_util.get_adp(board,adp_file,widen=widen)
     logger = runtime_meta_util.get_calibration_time_logger(board,'calib')
 
-    runtime = GrendelRunner()
-    runtime.initialize()
-    calib_obj = llenums.CalibrateObjective(args.method)
+    runtime = session.runner
 
     for cfg in adp.configs:
         blk = board.get_block(cfg.inst.block)
@@ -85,3 +82,12 @@ def calibrate_adp(args):
                            calib_obj=calib_obj.value, \
                            operation='fit',runtime=runtime_sec)
 
+    # the session's board runs the next pass, so the blocks are torn down
+    llcmd.clear(runtime,board,adp)
+
+
+def calibrate_adp(args,session=None):
+    calib_obj = llenums.CalibrateObjective(args.method)
+    with runtime_session.open_session(session) as sess:
+        calibrate(sess,args.model_number,args.adp,calib_obj, \
+                  widen=args.widen)
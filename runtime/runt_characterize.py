@@ -1,11 +1,10 @@
 from hwlib.adp import ADP,ADPMetadata, BlockConfig,BlockInst
 
 import runtime.runtime_util as runtime_util
+import runtime.runtime_session as runtime_session
 import runtime.models.exp_delta_model as exp_delta_model_lib
 import runtime.models.exp_profile_dataset as exp_profile_dataset_lib
 
-from lab_bench.grendel_runner import GrendelRunner
-
 import hwlib.device as devlib
 
 import hwlib.hcdc.llcmd_util as llutil
@@ -109,14 +108,15 @@ def characterize_configured_block(runtime,board,block,cfg, \
             )
 
 
-def characterize_adp(args):
-    board = runtime_util.get_device(args.model_number,layout=True)
-    runtime = GrendelRunner()
-    runtime.initialize()
-    if not args.adp is None:
-        adp = runtime_util.get_adp(board,args.adp,widen=args.widen)
-        if args.adp_locs:
-           args.num_locs = 1
+def characterize(session,model_number,adp_file=None, \
+                 grid_size=25,num_hidden_codes=50,num_locs=5, \
+                 adp_locs=False,widen=False):
+    board = session.get_device(model_number,layout=True)
+    runtime = session.runner
+    if not adp_file is None:
+        adp = runtime_util.get_adp(board,adp_file,widen=widen)
+        if adp_locs:
+           num_locs = 1
 
         for cfg in adp.configs:
             blk = board.get_block(cfg.inst.block)
@@ -124,13 +124,13 @@ def characterize_adp(args):
             for mode in cfg_modes:
                 cfg.modes = [mode]
                 characterize_configured_block(runtime,board,blk,cfg, \
-                                              grid_size=args.grid_size, \
-                                              num_locs=args.num_locs,\
-                                              num_hidden_codes=args.num_hidden_codes, \
-                                              adp_locs=args.adp_locs)
+                                              grid_size=grid_size, \
+                                              num_locs=num_locs,\
+                                              num_hidden_codes=num_hidden_codes, \
+                                              adp_locs=adp_locs)
 
     else:
-        if args.adp_locs or args.widen:
+        if adp_locs or widen:
             raise Exception("full board characterization doesn't accept adp-locs or widen parameters")
 
         for block in board.blocks:
@@ -143,9 +143,17 @@ def characterize_adp(args):
                 cfg = BlockConfig.make(block,loc)
                 cfg.modes = [mode]
                 characterize_configured_block(runtime,board,block,cfg, \
-                                                grid_size=args.grid_size, \
-                                                num_locs=args.num_locs,\
-                                                num_hidden_codes=args.num_hidden_codes, \
+                                                grid_size=grid_size, \
+                                                num_locs=num_locs,\
+                                                num_hidden_codes=num_hidden_codes, \
                                                 adp_locs=False)
 
 
+def characterize_adp(args,session=None):
+    with runtime_session.open_session(session) as sess:
+        characterize(sess,args.model_number,adp_file=args.adp, \
+                     grid_size=args.grid_size, \
+                     num_hidden_codes=args.num_hidden_codes, \
+                     num_locs=args.num_locs, \
+                     adp_locs=args.adp_locs, \
+                     widen=args.widen)
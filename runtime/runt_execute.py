@@ -6,10 +6,10 @@ import hwlib.block as blocklib
 import hwlib.hcdc.llenums as llenums
 
 import runtime.runtime_util as runtime_util
+import runtime.runtime_session as runtime_session
 
 import lab_bench.devices.sigilent_osc as osclib
 import lab_bench.devices.sigilent_osc_lib as oscliblib
-import lab_bench.grendel_runner as grendel_runner_lib
 import util.config as configlib
 
 import json
@@ -39,61 +39,75 @@ def test_osc(args):
 
     llcmd.test_oscilloscope(board,osc,program,adp,sim_time)
 
-def exec_adp(args):
-    board =  board = runtime_util \
-                     .get_device(args.model_number,layout=True)
- 
-    with open(args.adp,'r') as fh:
+def execute(session,adp_file,model_number,sim_time=None,osc=False):
+    board = session.get_device(model_number,layout=True)
+
+    with open(adp_file,'r') as fh:
         adp = ADP.from_json(board, \
                             json.loads(fh.read()))
 
 
+    # the adp is executed with the delta models it was scaled with
     model_number = adp.metadata[ADPMetadata.Keys.RUNTIME_PHYS_DB]
-    board.model_number = model_number
+    board = session.get_device(model_number,layout=True)
 
     prog_name = adp.metadata.get(ADPMetadata.Keys.DSNAME)
     program = dsproglib.DSProgDB.get_prog(prog_name)
     sim = dsproglib.DSProgDB.get_sim(prog_name)
-    if not args.osc:
+    if not osc:
         osc = None
     else:
         osc = osclib.Sigilent1020XEOscilloscope(configlib.OSC_IP, \
                                                 configlib.OSC_PORT)
         osc.setup()
 
-    sim_time = sim.sim_time
-    if args.runtime:
-        assert(args.runtime <= program.max_time)
-        sim_time= args.runtime
+    if not sim_time is None:
+        assert(sim_time <= program.max_time)
+    else:
+        sim_time = sim.sim_time
 
-    runtime = grendel_runner_lib.GrendelRunner()
-    runtime.initialize()
+    # the configuration commands are streamed to the board, and all of
+    # them are acknowledged before the simulation starts.
+    runtime = session.runner
     for conn in adp.conns:
         sblk = board.get_block(conn.source_inst.block)
         dblk = board.get_block(conn.dest_inst.block)
         llcmd.set_conn(runtime,sblk,conn.source_inst.loc, \
                        conn.source_port, \
                        dblk,conn.dest_inst.loc, \
-                       conn.dest_port)
+                       conn.dest_port, \
+                       wait=False)
 
     for cfg in adp.configs:
         blk = board.get_block(cfg.inst.block)
-        resp = llcmd.set_state(runtime, \
-                               board,
-                               blk, \
-                               cfg.inst.loc, \
-                               adp)
+        llcmd.set_state(runtime, \
+                        board,
+                        blk, \
+                        cfg.inst.loc, \
+                        adp, \
+                        wait=False)
 
         if blk.name == 'lut':
             llcmd.write_lut(runtime, \
                             board, \
                             blk, \
                             cfg.inst.loc, \
-                            adp)
+                            adp, \
+                            wait=False)
+
+    runtime.drain()
 
     llcmd.execute_simulation(runtime,board, \
                              program, adp,\
                              sim_time=sim_time, \
                              osc=osc, \
                              manual=False)
-    runtime.close()
+
+    # the session's board runs the next adp, so this adp is torn down
+    llcmd.clear(runtime,board,adp)
+
+def exec_adp(args,session=None):
+    with runtime_session.open_session(session) as sess:
+        execute(sess,args.adp,args.model_number, \
+                sim_time=args.runtime, \
+                osc=args.osc)
@@ -1,5 +1,9 @@
 import runtime.runtime_util as runtime_util
 import runtime.runtime_meta_util as runtime_meta_util
+import runtime.runtime_session as runtime_session
+import runtime.runt_characterize as runt_char
+import runtime.runt_profile as runt_prof
+import runtime.runt_mkdeltamodels as runt_mkdeltas
 import runtime.models.exp_delta_model as exp_delta_model_lib
 import runtime.models.exp_phys_model as exp_phys_model_lib
 import runtime.models.exp_profile_dataset as exp_profile_dataset_lib
@@ -97,67 +101,45 @@ def load_code_pool_from_database(char_board,predictor,objectives):
     return code_pool
 
 
-def update_model(logger,char_board,blk,loc,cfg):
-    #"python3 grendel.py mkphys --model-number {model} --max-depth 0 --num-leaves 1 --shrink" 
-    CMDS = [ \
-             "python3 grendel.py mkdeltas {model} --force > deltas.log" \
-    ]
-
-
-    adp_file = runtime_meta_util.generate_adp(char_board,blk,loc,cfg)
-
-    runtime_sec = 0
-    for CMD in CMDS:
-        cmd = CMD.format(adp=adp_file, \
-                         model=char_board.full_model_number)
-        print(">> %s" % cmd)
-        runtime_sec += runtime_meta_util.run_command(cmd)
-
+def update_model(logger,session,char_board,blk,loc,cfg):
+    runtime_sec = runtime_meta_util.run_pass(runt_mkdeltas.derive_delta_models, \
+                                             session, \
+                                             char_board.full_model_number, \
+                                             force=True, \
+                                             log_file="deltas.log")
     logger.log('upd_mdl',runtime_sec)
 
-    runtime_meta_util.remove_file(adp_file)
-
 
 '''
 Do some initial bootstrapping to fit the elicited models.
 '''
-def bootstrap_block(logger,board,blk,loc,cfg,grid_size=9,num_samples=5):
-    CMDS = [ \
-             "python3 grendel.py characterize --adp {adp} --model-number {model} --grid-size {grid_size} --num-hidden-codes {num_samples} --adp-locs > characterize.log" \
-            ]
-
-
+def bootstrap_block(logger,session,board,blk,loc,cfg,grid_size=9,num_samples=5):
     adp_file = runtime_meta_util.generate_adp(board,blk,loc,cfg)
 
-    runtime_sec = 0
-    for CMD in CMDS:
-        cmd = CMD.format(adp=adp_file, \
-                         model=board.full_model_number, \
-                         grid_size=grid_size, \
-                         num_samples=num_samples)
-        print(">> %s" % cmd)
-        runtime_sec += runtime_meta_util.run_command(cmd)
+    runtime_sec = runtime_meta_util.run_pass(runt_char.characterize, \
+                                             session, \
+                                             board.full_model_number, \
+                                             adp_file=adp_file, \
+                                             grid_size=grid_size, \
+                                             num_hidden_codes=num_samples, \
+                                             adp_locs=True, \
+                                             log_file="characterize.log")
 
     logger.log('bootstrap',runtime_sec)
 
     runtime_meta_util.remove_file(adp_file)
 
 
-def profile_block(logger,board,blk,loc,cfg,grid_size=9,calib_obj=llenums.CalibrateObjective.NONE):
-    CMDS = [ \
-             "python3 grendel.py prof {adp} --model-number {model} --grid-size {grid_size} {calib_obj} > profile.log" \
-            ]
-
+def profile_block(logger,session,board,blk,loc,cfg,grid_size=9,calib_obj=llenums.CalibrateObjective.NONE):
     adp_file = runtime_meta_util.generate_adp(board,blk,loc,cfg)
 
-    runtime_sec = 0
-    for CMD in CMDS:
-        cmd = CMD.format(adp=adp_file, \
-                         model=board.full_model_number, \
-                         grid_size=grid_size, \
-                         calib_obj=calib_obj.value)
-        print(">> %s" % cmd)
-        runtime_sec += runtime_meta_util.run_command(cmd)
+    runtime_sec = runtime_meta_util.run_pass(runt_prof.profile, \
+                                             session, \
+                                             board.full_model_number, \
+                                             adp_file, \
+                                             calib_obj, \
+                                             grid_size=grid_size, \
+                                             log_file="profile.log")
 
     logger.log('profile',runtime_sec)
     runtime_meta_util.remove_file(adp_file)
@@ -217,7 +199,7 @@ def write_model_to_database(logger,pool,board,char_board):
 This function takes a point and evaluates it in the hardware to identify
 the delta model parameters. These labels are attached.
 '''
-def query_hidden_codes(logger,pool,board,blk,loc,cfg,hidden_codes,grid_size=9):
+def query_hidden_codes(logger,session,pool,board,blk,loc,cfg,hidden_codes,grid_size=9):
     new_cfg = cfg.copy()
     for var,value in hidden_codes.items():
         int_value = blk.state[var].nearest_value(value)
@@ -228,8 +210,8 @@ def query_hidden_codes(logger,pool,board,blk,loc,cfg,hidden_codes,grid_size=9):
                                                       calib_obj=llenums.CalibrateObjective.NONE)
         exp_delta_model_lib.update(board,exp_model)
 
-    profile_block(logger,board,blk,loc,new_cfg,grid_size)
-    update_model(logger,board,blk,loc,new_cfg)
+    profile_block(logger,session,board,blk,loc,new_cfg,grid_size)
+    update_model(logger,session,board,blk,loc,new_cfg)
 
     mdls = exp_delta_model_lib.get_models(board, \
                                           ['block','loc','static_config','hidden_config'], \
@@ -306,7 +288,7 @@ def add_random_unlabelled_samples(pool,count,total=4000):
 # Block calibration routine
 #
 ###
-def calibrate_block(logger, \
+def calibrate_block(logger,session, \
                     board,xfer_board, \
                     block,loc,config, \
                     grid_size=9, \
@@ -319,7 +301,7 @@ def calibrate_block(logger, \
 
     # get board with initial code pool
     char_model = runtime_meta_util.get_model(board,block,loc,config)
-    char_board = runtime_util.get_device("%s-active-cal/%s" % (board.model_number,char_model),layout=False)
+    char_board = session.get_device("%s-active-cal/%s" % (board.model_number,char_model))
 
     # load physical models for transfer learning. Compute the number of parameters
     phys_models = {}
@@ -334,11 +316,11 @@ def calibrate_block(logger, \
     # and fit all of the initial guesses for the parameters on the transfer model
     # this should give us an initial predictor
     print("==== BOOTSTRAPPING <#samps=%d> ====" % nsamps_reqd)
-    bootstrap_block(logger, \
+    bootstrap_block(logger,session, \
                     char_board,block,loc,config, \
                     grid_size=grid_size, \
                     num_samples=nsamps_reqd)
-    update_model(logger,char_board,block,loc,config)
+    update_model(logger,session,char_board,block,loc,config)
 
     # fit all of the parameters in the predictor.
     update_predictor(predictor,char_board)
@@ -365,38 +347,38 @@ def calibrate_block(logger, \
         for pred_score, hcs in code_pool.get_unlabeled():
             print("=> codes=%s" % hcs)
             print("=> score=%s" % pred_score)
-            query_hidden_codes(logger,code_pool,char_board,block,loc,config,hcs, \
+            query_hidden_codes(logger,session,code_pool,char_board,block,loc,config,hcs, \
                      grid_size=grid_size)
 
     write_model_to_database(logger,code_pool, board,char_board)
 
 def calibrate(args):
-    board = runtime_util.get_device(args.model_number)
-    xfer_board = runtime_util.get_device(args.xfer_db)
-
-    logger = ModelCalibrateLogger('actcal_%s.log' % args.model_number)
-
-
-    if not args.adp is None:
-        adp = runtime_util.get_adp(board,args.adp,widen=args.widen)
-        for cfg in adp.configs:
-            blk = board.get_block(cfg.inst.block)
-            if not blk.requires_calibration():
-                continue
-
-            cfg_modes = cfg.modes
-            for mode in cfg_modes:
-                cfg.modes = [mode]
-
-                calibrate_block(logger, \
-                                board, \
-                                xfer_board, \
-                                blk,cfg.inst.loc,cfg, \
-                                grid_size=args.grid_size, \
-                                rounds=args.rounds, \
-                                samples_per_round=args.samples_per_round, \
-                                max_samples=args.max_samples)
-
-    else:
-        raise Exception("unimplemented")
-
+    with runtime_session.open_session() as session:
+        board = session.get_device(args.model_number)
+        xfer_board = session.get_device(args.xfer_db)
+
+        logger = ModelCalibrateLogger('actcal_%s.log' % args.model_number)
+
+
+        if not args.adp is None:
+            adp = runtime_util.get_adp(board,args.adp,widen=args.widen)
+            for cfg in adp.configs:
+                blk = board.get_block(cfg.inst.block)
+                if not blk.requires_calibration():
+                    continue
+
+                cfg_modes = cfg.modes
+                for mode in cfg_modes:
+                    cfg.modes = [mode]
+
+                    calibrate_block(logger,session, \
+                                    board, \
+                                    xfer_board, \
+                                    blk,cfg.inst.loc,cfg, \
+                                    grid_size=args.grid_size, \
+                                    rounds=args.rounds, \
+                                    samples_per_round=args.samples_per_round, \
+                                    max_samples=args.max_samples)
+
+        else:
+            raise Exception("unimplemented")
@@ -2,10 +2,10 @@ from hwlib.adp import ADP,ADPMetadata
 
 import runtime.runtime_util as runtime_util
 import runtime.runtime_meta_util as runtime_meta_util
+import runtime.runtime_session as runtime_session
 import runtime.models.exp_delta_model as exp_delta_model_lib
 import runtime.models.exp_profile_dataset as exp_profile_dataset_lib
 
-from lab_bench.grendel_runner import GrendelRunner
 import hwlib.hcdc.llcmd_util as llutil
 import hwlib.hcdc.llenums as llenums
 import hwlib.hcdc.llcmd as llcmd
@@ -35,7 +35,7 @@ def is_calibrated(board,block,loc,config,calib_obj):
     return True
   return False
 
-def test_block(board,block,loc,modes, \
+def test_block(session,board,block,loc,modes, \
                minimize_error=False, \
                maximize_fit=False, \
                model_based=False):
@@ -66,7 +66,7 @@ def test_block(board,block,loc,modes, \
     if minimize_error:
       objfun = llenums.CalibrateObjective.MINIMIZE_ERROR
       if not is_calibrated(board,block,loc,blkcfg,objfun):
-        succ &= runtime_meta_util.legacy_calibration(board, \
+        succ &= runtime_meta_util.legacy_calibration(session,board, \
                                                     adp_filename, \
                                                     objfun,logfile=TESTBOARD_LOG, \
                                                     block=block,mode=mode,loc=loc)
@@ -75,7 +75,7 @@ def test_block(board,block,loc,modes, \
     if maximize_fit and succ:
       objfun = llenums.CalibrateObjective.MAXIMIZE_FIT
       if not is_calibrated(board,block,loc,blkcfg,objfun):
-        succ &= runtime_meta_util.legacy_calibration(board, \
+        succ &= runtime_meta_util.legacy_calibration(session,board, \
                                                     adp_filename, \
                                                     objfun,logfile=TESTBOARD_LOG, \
                                                     block=block, mode=mode, loc=loc)
@@ -94,28 +94,28 @@ def test_block(board,block,loc,modes, \
       raise Exception("[ERROR] failed to calibrate block %s.%s" % (block.name,loc))
 
 def test_board(args):
-  board = runtime_util.get_device(args.model_number,layout=True)
-  for chip_id in range(0,2):
-    for tile_id in range(4):
-      for slice_id in [0,2]:
-        for block in board.blocks:
-          if not block.requires_calibration():
-            continue
-
-          modes = list(block.modes)
-          # limit the fanout modes to just positive copies
-          if block.name == "fanout":
-            modes = list(filter(lambda m: not "-" in str(m), block.modes))
-
-          loc = devlib.Location([chip_id,tile_id,slice_id,0])
-          test_block(board,block,loc,modes, \
-                     maximize_fit=args.maximize_fit, \
-                     minimize_error=args.minimize_error, \
-                     model_based=args.model_based)
-
-
-  finalize_test(board, \
-                maximize_fit=args.maximize_fit, \
-                minimize_error=args.minimize_error, \
-                model_based=args.model_based)
-
+  with runtime_session.open_session() as session:
+    board = session.get_device(args.model_number,layout=True)
+    for chip_id in range(0,2):
+      for tile_id in range(4):
+        for slice_id in [0,2]:
+          for block in board.blocks:
+            if not block.requires_calibration():
+              continue
+
+            modes = list(block.modes)
+            # limit the fanout modes to just positive copies
+            if block.name == "fanout":
+              modes = list(filter(lambda m: not "-" in str(m), block.modes))
+
+            loc = devlib.Location([chip_id,tile_id,slice_id,0])
+            test_block(session,board,block,loc,modes, \
+                       maximize_fit=args.maximize_fit, \
+                       minimize_error=args.minimize_error, \
+                       model_based=args.model_based)
+
+
+    finalize_test(board, \
+                  maximize_fit=args.maximize_fit, \
+                  minimize_error=args.minimize_error, \
+                  model_based=args.model_based)
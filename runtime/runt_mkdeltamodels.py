@@ -1,6 +1,6 @@
 from hwlib.adp import ADP,ADPMetadata
 
-import runtime.runtime_util as runtime_util
+import runtime.runtime_session as runtime_session
 import runtime.models.exp_delta_model as exp_delta_model_lib
 import runtime.models.exp_profile_dataset as exp_profile_dataset_lib
 
@@ -11,7 +11,11 @@ import hwlib.hcdc.llcmd as llcmd
 import ops.generic_op as genoplib
 
 import runtime.fit.model_fit as fitlib
+import runtime.models.database as dblib
 import numpy as np
+import multiprocessing
+import tempfile
+import os
 
 def update_delta_model(dev,delta_model,dataset):
     if dataset.method == llenums.ProfileOpType.INPUT_OUTPUT:
@@ -97,7 +101,7 @@ def _update_delta_models_for_configured_block(dev,delta_models,blk,loc,output, \
                   noises.append(noise)
 
     if len(model_errors) == 0:
-        return False
+        return []
 
     for delta_model in delta_models:
         avg_error = np.mean(model_errors)
@@ -109,15 +113,14 @@ def _update_delta_models_for_configured_block(dev,delta_models,blk,loc,output, \
             print("%s %s %s" % (blk.name,loc,config.mode))
             print(delta_model)
 
-        exp_delta_model_lib.update(dev,delta_model)
-
-    return True
-
-def update_delta_models_for_configured_block(dev,blk,loc,cfg, \
-                                             force=False, \
-                                             orphans=True):
-    num_deltas = 0
+    return delta_models
 
+# fit the delta models of a configured block instance without writing
+# them back to the database.
+def fit_delta_models_for_configured_block(dev,blk,loc,cfg, \
+                                          force=False, \
+                                          orphans=True):
+    fitted = []
     for output in blk.outputs:
         delta_models = _get_delta_models(dev,blk,loc,output,cfg,orphans=orphans)
         if all(map(lambda model: model.complete, delta_models)) and not force:
@@ -126,26 +129,103 @@ def update_delta_models_for_configured_block(dev,blk,loc,cfg, \
         for model in delta_models:
             model.clear()
 
-        if _update_delta_models_for_configured_block(dev,delta_models,blk, \
-                                                     loc,output, \
-                                                     cfg, \
-                                                     force=force):
-                num_deltas += 1
+        fitted += _update_delta_models_for_configured_block(dev,delta_models, \
+                                                            blk,loc,output, \
+                                                            cfg, \
+                                                            force=force)
 
-def derive_delta_models_adp(args):
-    board = runtime_util.get_device(args.model_number)
- 
-    if args.no_orphans:
+    return fitted
+
+def update_delta_models_for_configured_block(dev,blk,loc,cfg, \
+                                             force=False, \
+                                             orphans=True):
+    for delta_model in fit_delta_models_for_configured_block(dev,blk,loc,cfg, \
+                                                             force=force, \
+                                                             orphans=orphans):
+        exp_delta_model_lib.update(dev,delta_model)
+
+# worker state, inherited by the forked fitting processes
+_MKDELTAS_CONTEXT = None
+
+def _mkdeltas_init(snapshot):
+    board = _MKDELTAS_CONTEXT[0]
+    # the parent's connection must not be used across the fork. Workers
+    # only read, from a snapshot taken before the pool started.
+    board._physdb = dblib.PhysicalDatabase(snapshot,read_only=True)
+
+def _mkdeltas_worker(index):
+    board,instances,force,orphans = _MKDELTAS_CONTEXT
+    blk,loc,cfg = instances[index]
+    models = fit_delta_models_for_configured_block(board,blk,loc,cfg, \
+                                                   force=force, \
+                                                   orphans=orphans)
+    return list(map(lambda model: exp_delta_model_lib.to_db_row(model), \
+                    models))
+
+def derive_delta_models_parallel(board,instances,force,orphans,jobs, \
+                                 batch_size=16):
+    global _MKDELTAS_CONTEXT
+    fd,snapshot = tempfile.mkstemp(suffix=".db", \
+                                   dir=os.path.dirname(board.physdb.filename))
+    os.close(fd)
+    board.physdb.snapshot(snapshot)
+
+    _MKDELTAS_CONTEXT = (board,instances,force,orphans)
+    rows = []
+    n_models = 0
+    try:
+        ctx = multiprocessing.get_context("fork")
+        with ctx.Pool(processes=jobs, \
+                      initializer=_mkdeltas_init, \
+                      initargs=(snapshot,)) as pool:
+            # this process is the only writer. Results are committed in
+            # instance order, a batch of instances per transaction.
+            for idx,inst_rows in enumerate(pool.imap(_mkdeltas_worker, \
+                                                     range(len(instances)))):
+                rows += inst_rows
+                if (idx+1) % batch_size == 0 or idx+1 == len(instances):
+                    with board.physdb.transaction():
+                        exp_delta_model_lib.update_rows(board,rows)
+                    n_models += len(rows)
+                    rows = []
+                    print("[mkdeltas] %d/%d instances, %d models" \
+                          % (idx+1,len(instances),n_models))
+    finally:
+        _MKDELTAS_CONTEXT = None
+        os.remove(snapshot)
+
+def derive_delta_models(session,model_number,force=False,orphans=True,jobs=1):
+    board = session.get_device(model_number)
+
+    if not orphans:
        exp_delta_model_lib \
            .remove_models(board,['calib_obj'], \
                           calib_obj=llenums.CalibrateObjective.NONE)
 
 
+    if jobs > 1:
+        instances = list(exp_profile_dataset_lib \
+                         .get_configured_block_instances(board))
+        derive_delta_models_parallel(board,instances, \
+                                     force=force, \
+                                     orphans=orphans, \
+                                     jobs=jobs)
+        return
+
     for blk,loc,cfg in exp_profile_dataset_lib \
         .get_configured_block_instances(board):
-        update_delta_models_for_configured_block(board, \
-                                                 blk, \
-                                                 loc, \
-                                                 cfg, \
-                                                 force=args.force, \
-                                                 orphans=not args.no_orphans)
+        # commit the models of each block instance at once
+        with board.physdb.transaction():
+            update_delta_models_for_configured_block(board, \
+                                                     blk, \
+                                                     loc, \
+                                                     cfg, \
+                                                     force=force, \
+                                                     orphans=orphans)
+
+def derive_delta_models_adp(args,session=None):
+    with runtime_session.open_session(session) as sess:
+        derive_delta_models(sess,args.model_number, \
+                            force=args.force, \
+                            orphans=not args.no_orphans, \
+                            jobs=args.jobs)
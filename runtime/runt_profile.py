@@ -5,15 +5,30 @@ import runtime.models.exp_profile_dataset as prof_dataset_lib
 import runtime.profile.planner as planlib
 import runtime.profile.profiler as proflib
 import runtime.runtime_util as runtime_util
-
-from lab_bench.grendel_runner import GrendelRunner
+import runtime.runtime_session as runtime_session
 
 import hwlib.hcdc.llenums as llenums
 import hwlib.hcdc.llcmd as llcmd
 
+def make_planner(planner,blk,loc,output,method,cfg,n,m,reps, \
+                 min_points,max_points):
+    if planner == "adaptive":
+        return planlib.AdaptivePlanner(blk,loc,output,method,cfg, \
+                                       n=n,m=m,reps=reps, \
+                                       max_points=max_points, \
+                                       min_points=min_points)
+    elif planner == "grid":
+        return planlib.SingleDefaultPointPlanner(blk,loc,output,method,cfg, \
+                                                 n=n,m=m,reps=reps)
+    else:
+        raise Exception("unknown planner <%s>" % planner)
+
 def profile_kernel(runtime,board,blk,cfg,calib_obj, \
                    min_points,max_points, \
-                   grid_size,force=False,adp=None):
+                   grid_size,force=False,adp=None,planner="grid"):
+    # the adaptive planner picks points from the full grid, and stops
+    # on its own before <max_points> points are measured.
+    grid_max_points = max_points if planner == "grid" else None
     for exp_delta_model in delta_model_lib.get_models(board, \
                                                           ['block','loc','static_config','calib_obj'],
                                                           block=blk, \
@@ -24,7 +39,7 @@ def profile_kernel(runtime,board,blk,cfg,calib_obj, \
         for method,n,m,reps in runtime_util.get_profiling_steps(exp_delta_model.output, \
                                                                 exp_delta_model.config, \
                                                                 grid_size, \
-                                                                max_points=max_points):
+                                                                max_points=grid_max_points):
 
             dataset = prof_dataset_lib.load(board,blk,cfg.inst.loc, \
                                             exp_delta_model.output, \
@@ -38,48 +53,72 @@ def profile_kernel(runtime,board,blk,cfg,calib_obj, \
             print("dataset npts=%d" % (len(dataset) if not dataset is None else 0));
             print("n=%d m=%d reps=%d" % (n,m,reps))
             print("---------")
-            if not dataset is None and \
+            # the adaptive planner decides itself whether the
+            # input-output dataset needs more points
+            if (planner == "grid" or \
+                method != llenums.ProfileOpType.INPUT_OUTPUT) and \
+            not dataset is None and \
             len(dataset) >= min_points and \
             len(dataset) >= n*m*reps and \
             not force:
                 print("===> <%s> already profiled" % method)
                 continue
 
-            planner = planlib.SingleDefaultPointPlanner(blk, \
-                                                        cfg.inst.loc, \
-                                                        exp_delta_model.output, \
-                                                        method, \
-                                                        exp_delta_model.config,
-                                                        n=n,
-                                                        m=m, \
-                                                        reps=reps)
-            proflib.profile_all_hidden_states(runtime,board,planner,adp=adp)
+            plan = make_planner(planner,blk, \
+                                cfg.inst.loc, \
+                                exp_delta_model.output, \
+                                method, \
+                                exp_delta_model.config, \
+                                n=n, \
+                                m=m, \
+                                reps=reps, \
+                                min_points=min_points, \
+                                max_points=max_points)
+            proflib.profile_all_hidden_states(runtime,board,plan,adp=adp)
 
 
 
-def profile_adp(args):
-    board = runtime_util.get_device(args.model_number)
-    calib_obj = llenums.CalibrateObjective(args.method)
-    runtime = GrendelRunner()
-
-    runtime.initialize()
-    if args.missing:
+def profile(session,model_number,adp_file,calib_obj, \
+            grid_size=15,max_points=255,min_points=0, \
+            missing=False,force=False,widen=False,planner="grid"):
+    board = session.get_device(model_number)
+    runtime = session.runner
+    if missing:
         for exp_delta_model in delta_model_lib.get_all(board):
             profile_kernel(runtime,board, \
                            exp_delta_model.block, \
                            exp_delta_model.config, \
                            calib_obj, \
-                           min_points=args.min_points, \
-                           grid_size=args.grid_size)
+                           min_points=min_points, \
+                           max_points=max_points, \
+                           grid_size=grid_size, \
+                           planner=planner)
 
     else:
-        adp = runtime_util.get_adp(board,args.adp,widen=args.widen)
+        adp = runtime_util.get_adp(board,adp_file,widen=widen)
         for cfg in adp.configs:
             blk = board.get_block(cfg.inst.block)
             cfg_modes = cfg.modes
             for mode in cfg_modes:
                 cfg.modes = [mode]
                 profile_kernel(runtime,board,blk,cfg,calib_obj, \
-                               args.min_points, args.max_points, \
-                               args.grid_size, \
-                               force=args.force, adp=adp)
+                               min_points, max_points, \
+                               grid_size, \
+                               force=force, adp=adp, \
+                               planner=planner)
+
+        # the session's board runs the next pass, so the blocks are torn down
+        llcmd.clear(runtime,board,adp)
+
+
+def profile_adp(args,session=None):
+    calib_obj = llenums.CalibrateObjective(args.method)
+    with runtime_session.open_session(session) as sess:
+        profile(sess,args.model_number,args.adp,calib_obj, \
+                grid_size=args.grid_size, \
+                max_points=args.max_points, \
+                min_points=args.min_points, \
+                missing=args.missing, \
+                force=args.force, \
+                widen=args.widen, \
+                planner=args.planner)
@@ -5,6 +5,7 @@ import ops.generic_op as genoplib
 import util.paths as pathlib
 import hwlib.adp as adplib
 import hwlib.block as blocklib
+import contextlib
 import os
 import json
 import random
@@ -262,46 +263,44 @@ def homogenous_database_get_block_info(board,use_output=True):
     return models_get_block_info(models,use_output)
 
 
-def _profile_command(board,adp,calib_obj,widen=False,log_file=None):
-    CMD = "python3 grendel.py prof --grid-size 50 --max-points 500 --model-number {model} {adp} {calib_obj}"
-    if widen:
-        CMD += " --widen"
-    if not log_file is None:
-        CMD += " > %s" % log_file
-
-    cmd = CMD.format(model=board.model_number, \
-                     adp=adp, \
-                     calib_obj=calib_obj.value)
-
-    return cmd
-
-def _deltas_command(board,force=False,orphans=True,log_file=None):
-    CMD = "python3 grendel.py mkdeltas {model}"
-    if force:
-        CMD += " --force"
-    if not orphans:
-        CMD += " --no-orphans"
-    if not log_file is None:
-        CMD += " > %s" % log_file
-
-    cmd = CMD.format(model=board.model_number)
-    return cmd
+# run a grendel pass in this process. The pass output is written to
+# <log_file> if one is given. Returns the runtime in seconds.
+def run_pass(fn,*args,log_file=None,**kwargs):
+    start = time.time()
+    if log_file is None:
+        fn(*args,**kwargs)
+    else:
+        with open(log_file,'w') as fh:
+            with contextlib.redirect_stdout(fh):
+                fn(*args,**kwargs)
+    end = time.time()
+    runtime_sec = end-start
+    return runtime_sec
 
-def profile_block(board,block,loc,config,calib_obj,log_file=None):
+# the grendel passes import the board and profiling libraries, so they
+# are only imported when a pass is run.
+def profile_block(session,board,block,loc,config,calib_obj,log_file=None):
+    import runtime.runt_profile as runt_prof
     filename = generate_adp(board,block,loc,config)
-    cmd = _profile_command(board,filename,calib_obj,log_file=log_file)
-    run_command(cmd)
+    run_pass(runt_prof.profile,session,board.full_model_number, \
+             filename,calib_obj, \
+             grid_size=50,max_points=500, \
+             log_file=log_file)
 
-def profile(board,char_board,calib_obj,log_file=None):
+def profile(session,board,char_board,calib_obj,log_file=None):
+    import runtime.runt_profile as runt_prof
     block,loc,config = homogenous_database_get_block_info(char_board,use_output=False)
     filename = generate_adp(char_board,block,loc,config)
-    cmd = _profile_command(board,adp,calib_obj,log_file=log_file)
+    run_pass(runt_prof.profile,session,board.full_model_number, \
+             filename,calib_obj, \
+             grid_size=50,max_points=500, \
+             log_file=log_file)
 
-    run_command(cmd)
-
-def fit_delta_models(board,force=False,orphans=True,log_file=None):
-    cmd = _deltas_command(board,force,orphans,log_file)
-    run_command(cmd)
+def fit_delta_models(session,board,force=False,orphans=True,log_file=None):
+    import runtime.runt_mkdeltamodels as runt_mkdeltas
+    run_pass(runt_mkdeltas.derive_delta_models,session,board.full_model_number, \
+             force=force,orphans=orphans, \
+             log_file=log_file)
 
 
 def get_block_databases(model_number):
@@ -318,29 +317,31 @@ def get_calibration_time_logger(board,logname):
   logger = Logger('%s_%s.log' % (logname,board.model_number), fields)
   return logger
 
-def legacy_calibration(board,adp_path,calib_obj,widen=False,logfile='log.txt',**kwargs):
-  CAL_CMD = 'cal',"python3 grendel.py cal {adp_path} --model-number {model_number} {calib_obj} {widen}"
-
-  PROF_CMD = 'prof',_profile_command(board,adp_path,calib_obj,log_file=logfile,widen=widen)
-  MKDELTAS_CMD = 'deltas',_deltas_command(board,force=False,orphans=False,log_file=logfile)
-
-  widen_flag = " --widen" if widen else ""
-  cmds = []
-  for label,CMD in [CAL_CMD, PROF_CMD, MKDELTAS_CMD]:
-    cmd = CMD.format(adp_path=adp_path, \
-                     model_number=board.model_number, \
-                     calib_obj=calib_obj.value, \
-                     widen=widen_flag)
-    cmds.append((label,cmd))
+def legacy_calibration(session,board,adp_path,calib_obj,widen=False,logfile='log.txt',**kwargs):
+  import runtime.runt_calibrate as runt_cal
+  import runtime.runt_profile as runt_prof
+  import runtime.runt_mkdeltamodels as runt_mkdeltas
+
+  model_number = board.full_model_number
+  # the calibration output goes to the console, the profiling and
+  # fitting output goes to the log file.
+  passes = [
+    ('cal',None,runt_cal.calibrate,(adp_path,calib_obj),{'widen':widen}), \
+    ('prof',logfile,runt_prof.profile,(adp_path,calib_obj), \
+     {'grid_size':50,'max_points':500,'widen':widen}), \
+    ('deltas',logfile,runt_mkdeltas.derive_delta_models,(), \
+     {'force':False,'orphans':False}) \
+  ]
 
   logger = None if logfile is None else \
       get_calibration_time_logger(board,logfile)
-  for name,cmd in cmds:
-        print(cmd)
+  for name,log_file,fn,args,fn_kwargs in passes:
+        print("%s %s %s" % (name,model_number,str(args)))
         try:
-           runtime = run_command(cmd)
+           runtime = run_pass(fn,session,model_number,*args, \
+                              log_file=log_file,**fn_kwargs)
         except Exception as e:
-           print("[ERROR] command failed!")
+           print("[ERROR] command failed: %s" % e)
            return False
 
         if not logger is None:
@@ -0,0 +1,77 @@
+import runtime.runtime_util as runtime_util
+
+from lab_bench.grendel_runner import GrendelRunner
+
+from contextlib import contextmanager
+
+'''
+A runtime session holds the resources the grendel passes share: the
+devices, with their open physical databases, and the connection to the
+board. The board is opened the first time a pass needs it. Drivers that
+run many passes (meta-calibration, lexec) open one session and hand it
+to every pass, instead of starting a new grendel process per pass.
+'''
+class RuntimeSession:
+
+    def __init__(self,file_desc=None,native=False):
+        self.file_desc = file_desc
+        self.native = native
+        self._devices = {}
+        self._runner = None
+
+    def get_device(self,model_number,layout=False):
+        key = (model_number,layout)
+        if not key in self._devices:
+            dev = runtime_util.get_device(model_number,layout=layout)
+            # devices bound to the same model share one database connection
+            for other in self._devices.values():
+                if not dev.model_number is None and \
+                   other.full_model_number == dev.full_model_number:
+                    dev._physdb = other.physdb
+                    break
+
+            self._devices[key] = dev
+
+        return self._devices[key]
+
+    @property
+    def runner(self):
+        if self._runner is None:
+            runner = GrendelRunner(file_desc=self.file_desc, \
+                                   native=self.native)
+            runner.initialize()
+            self._runner = runner
+
+        return self._runner
+
+    def close(self):
+        if not self._runner is None:
+            self._runner.close()
+            self._runner = None
+
+        databases = []
+        for dev in self._devices.values():
+            if not dev._physdb is None and \
+               not any(map(lambda db: db is dev._physdb, databases)):
+                databases.append(dev._physdb)
+
+        for db in databases:
+            db.close()
+
+        self._devices = {}
+
+'''
+Use the given session, or open a session that is closed when the block
+exits.
+'''
+@contextmanager
+def open_session(session=None):
+    if not session is None:
+        yield session
+        return
+
+    session = RuntimeSession()
+    try:
+        yield session
+    finally:
+        session.close()
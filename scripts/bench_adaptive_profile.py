@@ -0,0 +1,197 @@
+import sys
+import os
+import time
+import math
+import argparse
+import contextlib
+import io
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),".."))
+
+import numpy as np
+
+import hwlib.hcdc.hcdcv2 as hcdclib
+import hwlib.hcdc.llenums as llenums
+import hwlib.adp as adplib
+import hwlib.device as devlib
+import runtime.runtime_util as runtime_util
+import runtime.fit.model_fit as fitlib
+import runtime.profile.planner as planlib
+import runtime.models.exp_profile_dataset as exp_profile_lib
+
+'''
+Simulated-block harness for the profiling planners. A block output is
+simulated by its delta model with randomly perturbed parameters, plus an
+unmodeled bump at a random point of the input space and measurement
+noise. Each planner profiles the simulated block the way the profiler
+drives it, and the delta model is fit to the collected dataset. The
+harness reports the number of points measured, the model error estimated
+from the dataset (as mkdeltas computes it), and the true model error of
+the fit over a dense grid of the input space.
+'''
+
+class SimulatedBlock:
+
+  def __init__(self,blk,output,cfg,rng,bump=0.05,noise=0.002):
+    self.block = blk
+    self.output = output
+    self.config = cfg
+    spec = output.deltas[cfg.mode]
+    self.relation = llenums.ProfileOpType.INPUT_OUTPUT.get_expr(blk,spec.relation)
+    self.params = {}
+    for par in spec.params:
+      ideal = spec[par].val
+      self.params[par] = ideal + rng.normal(0,0.05*max(1.0,abs(ideal)))
+
+    ival = output.interval[cfg.mode]
+    self.span = ival.upper - ival.lower
+    self.bump = bump*self.span
+    self.noise = noise*self.span
+    self.width = 0.15
+    self.center = None
+    self.rng = rng
+
+  def _bump(self,fields,columns):
+    normed = []
+    for field,col in zip(fields,columns):
+      ival = self._interval(field)
+      normed.append((np.array(col)-ival.lower)/(ival.upper-ival.lower))
+
+    normed = np.array(normed)
+    if self.center is None:
+      self.center = self.rng.uniform(0.1,0.9,size=len(fields))
+    dist2 = np.sum((normed-self.center[:,None])**2,axis=0)
+    return self.bump*np.exp(-dist2/(2*self.width**2))
+
+  def _interval(self,field):
+    if self.block.inputs.has(field):
+      return self.block.inputs[field].interval[self.config.mode]
+    return self.block.data[field].interval[self.config.mode]
+
+  def response(self,columns):
+    data = {'inputs':columns, \
+            'meas_mean':[0.0]*len(list(columns.values())[0])}
+    pred = np.array(fitlib.predict_output(self.params,self.relation,data))
+    return pred + self._bump(list(columns.keys()),list(columns.values()))
+
+  def measure(self,inputs):
+    columns = dict(map(lambda tup: (tup[0],[tup[1]]), inputs.items()))
+    mean = self.response(columns)[0] + self.rng.normal(0,self.noise)
+    return mean,self.noise
+
+def profile(sim,planner,cfg):
+  planner.new_hidden()
+  planner.next_hidden()
+  planner.new_dynamic()
+  dataset = exp_profile_lib.ExpProfileDataset(planner.block,planner.loc, \
+                                              planner.output,cfg, \
+                                              planner.method)
+  # mirrors profiler.profile_hidden_state
+  while True:
+    dynamic = planner.next_dynamic()
+    if dynamic is None and planner.adaptive:
+      planner.observe(dataset)
+      dynamic = planner.next_dynamic()
+
+    if dynamic is None:
+      break
+
+    inputs = {}
+    for name,value in dynamic.items():
+      if planner.block.data.has(name):
+        cfg[name].value = value
+      inputs[name] = value
+
+    mean,std = sim.measure(inputs)
+    dataset.add(config=cfg,inputs=inputs,mean=mean,std=std)
+
+  return dataset
+
+def evaluate(sim,dataset,reference):
+  spec = sim.output.deltas[sim.config.mode]
+  data = {'inputs':{}, 'meas_mean':list(dataset.meas_mean)}
+  for k,v in list(dataset.inputs.items()) + list(dataset.data.items()):
+    data['inputs'][k] = list(v)
+
+  result = fitlib.fit_model(spec.params,sim.relation,data)
+  pred = np.array(fitlib.predict_output(result['params'],sim.relation,data))
+  est_error = math.sqrt(np.mean((np.array(dataset.meas_mean)-pred)**2))
+
+  npts = len(list(reference.values())[0])
+  ref_data = {'inputs':reference, 'meas_mean':[0.0]*npts}
+  ref_pred = np.array(fitlib.predict_output(result['params'], \
+                                            sim.relation,ref_data))
+  true_error = math.sqrt(np.mean((sim.response(reference)-ref_pred)**2) \
+                         + sim.noise**2)
+  return est_error,true_error
+
+parser = argparse.ArgumentParser(description='simulated-block profiling planner benchmark.')
+parser.add_argument('--block', type=str, default='mult', \
+                    help='block to simulate (mult).')
+parser.add_argument('--output', type=str, default='z', \
+                    help='block output to simulate (z).')
+parser.add_argument('--mode', type=str, default='x', \
+                    help='simulate the first mode containing this string (x).')
+parser.add_argument('--grid-size', type=int, default=50, \
+                    help='number of inputs along each axis (50).')
+parser.add_argument('--max-points', type=int, default=500, \
+                    help='maximum number of points to sample (500).')
+parser.add_argument('--trials', type=int, default=5, \
+                    help='number of simulated blocks (5).')
+parser.add_argument('--seed', type=int, default=0, \
+                    help='random seed (0).')
+args = parser.parse_args()
+
+dev = hcdclib.get_device(None,layout=True)
+blk = dev.get_block(args.block)
+loc = devlib.Location(list(dev.layout.instances(blk.name))[0])
+adp = adplib.ADP()
+adp.add_instance(blk,loc)
+cfg = adp.configs.get(blk.name,loc)
+cfg.modes = [list(filter(lambda m: args.mode in str(m), blk.modes))[0]]
+output = blk.outputs[args.output]
+method = llenums.ProfileOpType.INPUT_OUTPUT
+
+# the brute force planner at the grid size runt_profile uses, and the
+# adaptive planner picking points from the full grid
+runs = []
+for name,max_points in [('grid',args.max_points), ('adaptive',None)]:
+  steps = list(runtime_util.get_profiling_steps(output,cfg,args.grid_size, \
+                                                max_points=max_points))
+  _,n,m,reps = steps[0]
+  runs.append((name,n,m,reps))
+
+# the true model error is measured on a denser grid
+dense = planlib.BruteForcePlanner(blk,loc,output,cfg,method,100,100)
+dense.new_hidden()
+dense.new_dynamic()
+points = list(dense.dynamic_iterator)
+reference = dict(map(lambda tup: (tup[1],list(map(lambda pt: pt[tup[0]], points))), \
+                     enumerate(dense._dynamic_fields)))
+
+print("block=%s output=%s mode=%s" % (blk.name,output.name,cfg.mode))
+stats = dict(map(lambda run: (run[0],[]), runs))
+for trial in range(args.trials):
+  for name,n,m,reps in runs:
+    sim = SimulatedBlock(blk,output,cfg,np.random.default_rng(args.seed+trial))
+    if name == 'adaptive':
+      planner = planlib.AdaptivePlanner(blk,loc,output,method,cfg, \
+                                        n=n,m=m,reps=reps, \
+                                        max_points=args.max_points)
+    else:
+      planner = planlib.SingleDefaultPointPlanner(blk,loc,output,method,cfg, \
+                                                  n=n,m=m,reps=reps)
+
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+      dataset = profile(sim,planner,cfg)
+    runtime = time.time()-start
+    est_error,true_error = evaluate(sim,dataset,reference)
+    stats[name].append((len(dataset),est_error,true_error))
+    print("trial=%d %-8s points=%4d est-error=%.5f true-error=%.5f planning=%.2fs" % \
+          (trial,name,len(dataset),est_error,true_error,runtime))
+
+for name,rows in stats.items():
+  rows = np.array(rows)
+  print("%-8s mean points=%.1f est-error=%.5f true-error=%.5f" % \
+        (name,rows[:,0].mean(),rows[:,1].mean(),rows[:,2].mean()))
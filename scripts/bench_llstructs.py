@@ -0,0 +1,124 @@
+import sys
+import os
+import time
+import argparse
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),".."))
+
+import hwlib.hcdc.hcdcv2 as hcdclib
+import hwlib.hcdc.llenums as llenums
+import hwlib.hcdc.llstructs as llstructs
+import hwlib.hcdc.llcmd_util as llutil
+import hwlib.hcdc.llcmd_profile as llcmd_profile
+import hwlib.adp as adplib
+import hwlib.device as devlib
+
+'''
+Round-trip micro-benchmark for the low-level structures exchanged with
+the board while profiling and calibrating. Each command is built and
+parsed back, and each response is parsed and rebuilt. The interpreted
+struct is timed against the compiled struct used by llstructs.build and
+llstructs.parse, and the round trip is checked to reproduce the data.
+'''
+
+# the parsed union holds every member, so only the fields that were
+# built are compared.
+def matches(data,parsed):
+  if isinstance(data,dict):
+    return all(map(lambda k: matches(data[k],parsed[k]), data.keys()))
+  elif isinstance(data,list):
+    return len(data) == len(parsed) and \
+      all(map(lambda tup: matches(tup[0],tup[1]), zip(data,parsed)))
+  elif isinstance(data,float):
+    return abs(data-parsed) <= 1e-6*max(1.0,abs(data))
+  else:
+    return data == parsed
+
+def timeit(fn,reps):
+  start = time.time()
+  for _ in range(reps):
+    fn()
+  return (time.time()-start)/reps*1e6
+
+def bench_command(name,cmd_t,cmd_data,reps):
+  # unions are parsed with the size of the largest member
+  data = cmd_t.build(cmd_data) + bytes(64)
+  parsed = llstructs.parse(cmd_t,data)
+  if not matches(cmd_data,parsed):
+    raise Exception("%s: round trip does not reproduce the command" % name)
+
+  if llstructs.build(cmd_t,cmd_data) != cmd_t.build(cmd_data):
+    raise Exception("%s: compiled build differs" % name)
+
+  def interpreted():
+    cmd_t.parse(cmd_t.build(cmd_data) + bytes(64))
+
+  def compiled():
+    llstructs.parse(cmd_t,llstructs.build(cmd_t,cmd_data) + bytes(64))
+
+  report(name,reps,interpreted,compiled)
+
+def bench_response(name,resp_t,resp_data,reps):
+  # the board sends the whole state union
+  data = resp_t.build(resp_data) + bytes(64)
+  parsed = llstructs.parse(resp_t,data)
+  if not matches(resp_data,parsed):
+    raise Exception("%s: round trip does not reproduce the response" % name)
+
+  def interpreted():
+    resp_t.build(resp_t.parse(data))
+
+  def compiled():
+    llstructs.build(resp_t,llstructs.parse(resp_t,data))
+
+  report(name,reps,interpreted,compiled)
+
+def report(name,reps,interpreted,compiled):
+  t_interp = timeit(interpreted,reps)
+  t_comp = timeit(compiled,reps)
+  print("%-12s interpreted=%7.1fus compiled=%7.1fus speedup=%.2fx" % \
+        (name,t_interp,t_comp,t_interp/t_comp))
+
+parser = argparse.ArgumentParser(description='llstructs round-trip benchmark.')
+parser.add_argument('--reps', type=int, default=2000, \
+                    help='number of round trips per structure.')
+args = parser.parse_args()
+
+dev = hcdclib.get_device(None,layout=True)
+blk = dev.get_block('mult')
+loc = devlib.Location(list(dev.layout.instances('mult'))[0])
+adp = adplib.ADP()
+adp.add_instance(blk,loc)
+cfg = adp.configs.get(blk.name,loc)
+cfg.modes = [list(filter(lambda m: 'x' in str(m), blk.modes))[0]]
+out = blk.outputs['z'].ll_identifier
+inputs = {blk.inputs['x'].ll_identifier:0.5, \
+          blk.inputs['y'].ll_identifier:-0.25}
+
+state = {blk.name:blk.state.concretize(adp,loc)}
+_,loc_d = llutil.make_block_loc_t(blk,loc)
+_,src_d = llutil.make_port_loc(blk,loc,blk.outputs['z'].ll_identifier)
+_,dest_d = llutil.make_port_loc(blk,loc,blk.inputs['x'].ll_identifier)
+spec = llcmd_profile.make_profile_spec(blk,loc,adp,out,inputs)
+
+start = time.time()
+for _ in range(args.reps):
+  llstructs.cmd_t()
+print("cmd_t definition lookup=%.2fus" % ((time.time()-start)/args.reps*1e6))
+
+commands = [
+  ('profile',llenums.CircCmdType.PROFILE,spec),
+  ('set_state',llenums.CircCmdType.SET_STATE,{'inst':loc_d,'state':state}),
+  ('connect',llenums.CircCmdType.CONNECT,{'src':src_d,'dest':dest_d}),
+  ('calibrate',llenums.CircCmdType.CALIBRATE, \
+   {'calib_obj':llenums.CalibrateObjective.MAXIMIZE_FIT.name,'inst':loc_d})
+]
+for name,cmd_type,cmd_data in commands:
+  _,cmd_d = llutil.make_circ_cmd(cmd_type,cmd_data)
+  bench_command(name,llstructs.cmd_t(),cmd_d,args.reps)
+
+bench_response('prof_result',llstructs.profile_result_t(), \
+               {'mean':0.125,'stdev':0.001, \
+                'status':llenums.ProfileStatus.SUCCESS.name, \
+                'spec':spec},args.reps)
+bench_response('state',llstructs.state_t(),state,args.reps)
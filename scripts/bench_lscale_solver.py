@@ -0,0 +1,131 @@
+import sys
+import os
+import time
+import math
+import json
+import argparse
+import contextlib
+import io
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),".."))
+
+import hwlib.hcdc.hcdcv2 as hcdclib
+import hwlib.hcdc.llenums as llenums
+import hwlib.adp as adplib
+import compiler.lscale as lscale
+import compiler.lscale_pass.lscale_ops as scalelib
+from dslang.dsprog import DSProgDB
+import util.paths as paths
+
+'''
+Head-to-head benchmark of the z3 and MILP backends of lscale. Every
+lgraph ADP of the given programs is scaled with both solvers, and the
+time to the first solution and to the requested number of solutions is
+reported. The quality measures of the best solution of each solver are
+compared, since both solve the same problem to optimality. The diversity
+of the enumerated solutions is the mean number of blocks whose mode
+differs between two solutions.
+'''
+
+QUALITY_KEYS = [adplib.ADPMetadata.Keys.LSCALE_AQM, \
+                adplib.ADPMetadata.Keys.LSCALE_DQM, \
+                adplib.ADPMetadata.Keys.LSCALE_DQME, \
+                adplib.ADPMetadata.Keys.LSCALE_AQMST, \
+                adplib.ADPMetadata.Keys.LSCALE_AQMOBS]
+
+def quality(adp,objective):
+  # log of the product of the quality measures, the negated objective
+  score = 0.0
+  for key in QUALITY_KEYS:
+    if adp.metadata.has(key):
+      score += math.log10(adp.metadata.get(key))
+  if objective != scalelib.ObjectiveFun.QUALITY:
+    score += math.log10(adp.tau)
+  return score
+
+def modes(adp):
+  return dict(map(lambda cfg: (str(cfg.inst),str(cfg.mode)), adp.configs))
+
+def diversity(assignments):
+  dists = []
+  for i in range(len(assignments)):
+    for j in range(i+1,len(assignments)):
+      dists.append(len(list(filter(lambda inst: assignments[i][inst] != assignments[j][inst], \
+                                   assignments[i].keys()))))
+  return sum(dists)/len(dists) if len(dists) > 0 else 0.0
+
+def run(dev,program,adp,objective,solver,n_solutions,min_distance,portfolio):
+  scores = []
+  assignments = []
+  start = time.time()
+  first = None
+  with contextlib.redirect_stdout(io.StringIO()):
+    for scale_adp in lscale.scale(dev,program,adp, \
+                                  objective=objective, \
+                                  calib_obj=llenums.CalibrateObjective.MAXIMIZE_FIT, \
+                                  solver=solver, \
+                                  min_distance=min_distance, \
+                                  portfolio=portfolio if solver == 'z3' else 1):
+      if first is None:
+        first = time.time()-start
+      scores.append(quality(scale_adp,objective))
+      assignments.append(modes(scale_adp))
+      if len(scores) >= n_solutions:
+        break
+
+  return first,time.time()-start,scores,diversity(assignments)
+
+parser = argparse.ArgumentParser(description='lscale solver benchmark.')
+parser.add_argument('programs', type=str, nargs='*', \
+                    default=['cos','pend','spring','lotka'], \
+                    help='programs to scale.')
+parser.add_argument('--subset', type=str, default='unrestricted', \
+                    help='subset the lgraph ADPs were generated for.')
+parser.add_argument('--objective', type=str, default='qty', \
+                    help='scaling objective (qty).')
+parser.add_argument('--solutions', type=int, default=3, \
+                    help='number of solutions to enumerate (3).')
+parser.add_argument('--min-mode-distance', type=int, default=1, \
+                    help='number of blocks whose mode differs between solutions (1).')
+parser.add_argument('--portfolio', type=int, default=1, \
+                    help='number of z3 configurations raced for each solution (1).')
+parser.add_argument('--solvers', type=str, default='z3,milp', \
+                    help='comma-separated solvers to run (z3,milp).')
+args = parser.parse_args()
+
+dev = hcdclib.get_device(None,layout=True)
+objective = scalelib.ObjectiveFun(args.objective)
+solvers = args.solvers.split(',')
+totals = dict(map(lambda solver: (solver,0.0), solvers))
+for prog in args.programs:
+  program = DSProgDB.get_prog(prog)
+  path_handler = paths.PathHandler(args.subset,prog,make_dirs=False)
+  dirname = path_handler.lgraph_adp_dir()
+  if not os.path.exists(dirname):
+    print("%s: no lgraph ADPs in %s" % (prog,dirname))
+    continue
+
+  for filename in sorted(os.listdir(dirname)):
+    if not filename.endswith('.adp'):
+      continue
+
+    results = {}
+    for solver in solvers:
+      with open(os.path.join(dirname,filename),'r') as fh:
+        adp = adplib.ADP.from_json(dev,json.loads(fh.read()))
+      results[solver] = run(dev,program,adp,objective,solver,args.solutions, \
+                            args.min_mode_distance,args.portfolio)
+      totals[solver] += results[solver][1]
+
+    best = dict(map(lambda tup: (tup[0],max(tup[1][2]) if tup[1][2] else None), \
+                    results.items()))
+    for solver,(first,total,scores,div) in results.items():
+      print("%-14s %-5s first=%.3fs total=%.3fs solutions=%d best=%s diversity=%.2f" % \
+            (filename,solver,first if not first is None else float('nan'), \
+             total,len(scores), \
+             "%.4f" % best[solver] if not best[solver] is None else "-",div))
+    if not None in best.values() and len(best) > 1:
+      agree = max(best.values())-min(best.values()) < 1e-3
+      print("%-14s agree=%s" % (filename,agree))
+
+print("total %s" % " ".join(map(lambda tup: "%s=%.3fs" % tup, totals.items())))
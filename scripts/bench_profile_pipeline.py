@@ -0,0 +1,116 @@
+import sys
+import os
+import time
+import argparse
+import tempfile
+import contextlib
+import io
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),".."))
+
+import hwlib.hcdc.hcdcv2 as hcdclib
+import hwlib.hcdc.llenums as llenums
+import hwlib.hcdc.llstructs as llstructs
+import hwlib.hcdc.llcmd_profile as llcmd_profile
+import hwlib.adp as adplib
+import hwlib.device as devlib
+import runtime.models.exp_profile_dataset as exp_profile_lib
+from lab_bench.grendel_runner import GrendelRunner
+from lab_bench.devices.fake_arduino import FakeArduinoDue
+
+'''
+Profiling throughput benchmark for the pipelined command protocol. A
+grid of input points of a multiplier is profiled on a fake Arduino that
+replays a synthesized transcript over a pseudo-terminal, first one
+command at a time and then pipelined. The fake models the serial link
+at the given baud rate and the execution time of each measurement.
+'''
+
+def profile_response(blk,spec,mean,stdev):
+  result = llstructs.profile_result_t().build({'mean':mean, \
+                                               'stdev':stdev, \
+                                               'status':llenums.ProfileStatus.SUCCESS.name, \
+                                               'spec':spec})
+  # the board sends the whole state union, which ends the result
+  sizes = dict(map(lambda sc: (sc.name,sc.sizeof()), llstructs.state_t().subcons))
+  result += bytes(max(sizes.values())-sizes[blk.name])
+  payload = " ".join(map(lambda b: str(b), result))
+  return ["\n","AC:>[process]\r\n", \
+          "\n","AC:>[msg]profiling...\r\n", \
+          "\n","AC:>[resp][1]returning profile\r\n", \
+          "\n","AC:>[data][I] %d\r\n" % (len(result)+2), \
+          "\n","AC:>[array]0 %d %s\r\n" % (len(result),payload)]
+
+def make_points(blk,n):
+  in0 = blk.inputs['x'].ll_identifier
+  in1 = blk.inputs['y'].ll_identifier
+  for i in range(n):
+    for j in range(n):
+      yield {in0:-1.0+2.0*i/(n-1), in1:-1.0+2.0*j/(n-1)}
+
+def profile_sequential(runner,dev,blk,loc,adp,out,points):
+  for inputs in points:
+    llcmd_profile.profile(runner,dev,blk,loc,adp,out,inputs,quiet=True)
+
+def profile_pipelined(runner,dev,blk,loc,adp,out,points):
+  with dev.physdb.transaction():
+    for inputs in points:
+      llcmd_profile.submit_profile(runner,dev,blk,loc,adp,out,inputs,quiet=True)
+    runner.drain()
+
+parser = argparse.ArgumentParser(description='pipelined profiling benchmark.')
+parser.add_argument('--grid-size', type=int, default=10, \
+                    help='number of inputs along each axis.')
+parser.add_argument('--baud-rate', type=int, default=115200, \
+                    help='baud rate of the emulated serial link.')
+parser.add_argument('--exec-time', type=float, default=0.002, \
+                    help='execution time of a measurement in seconds.')
+args = parser.parse_args()
+
+dev = hcdclib.get_device(None,layout=True)
+blk = dev.get_block('mult')
+loc = devlib.Location(list(dev.layout.instances('mult'))[0])
+adp = adplib.ADP()
+adp.add_instance(blk,loc)
+cfg = adp.configs.get(blk.name,loc)
+cfg.modes = [list(filter(lambda m: 'x' in str(m), blk.modes))[0]]
+out = blk.outputs['z'].ll_identifier
+points = list(make_points(blk,args.grid_size))
+
+# the transcript holds the measurements of both runs
+commands = []
+lines = []
+for inputs in points*2:
+  spec = llcmd_profile.make_profile_spec(blk,loc,adp,out,inputs)
+  commands.append(llcmd_profile.make_profile_command(blk,loc,adp,out, \
+                                                     inputs,quiet=True).hex())
+  lines += profile_response(blk,spec,sum(spec['in_vals']),0.001)
+
+tmpdir = tempfile.mkdtemp()
+os.chdir(tmpdir)
+fake = FakeArduinoDue(commands,lines,baud_rate=args.baud_rate, \
+                      exec_time=args.exec_time)
+with fake:
+  with contextlib.redirect_stdout(io.StringIO()):
+    runner = GrendelRunner(file_desc=fake.port,quiet=True)
+    runner.initialize()
+
+  # the board writes each response before it reads the next command, so
+  # a run takes at least the response transmission and execution time.
+  resp_bytes = sum(map(lambda line: len(line), lines))/2
+  link_time = resp_bytes*10.0/args.baud_rate + args.exec_time*len(points)
+  print("points=%d link bound=%.3fs" % (len(points),link_time))
+
+  for name,fn in [('sequential',profile_sequential), \
+                  ('pipelined',profile_pipelined)]:
+    dev.set_model("bench-%s" % name)
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+      fn(runner,dev,blk,loc,adp,out,points)
+    runtime = time.time()-start
+    dataset = exp_profile_lib.load(dev,blk,loc,blk.outputs['z'],cfg, \
+                                   llenums.ProfileOpType.INPUT_OUTPUT)
+    print("%-10s time=%.3fs points/s=%.1f stored=%d" % \
+          (name,runtime,len(points)/runtime,len(dataset)))
+
+  runner.close()
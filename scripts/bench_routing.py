@@ -0,0 +1,124 @@
+import sys
+import os
+import time
+import argparse
+import contextlib
+import io
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),".."))
+
+import hwlib.hcdc.hcdcv2 as hcdclib
+import hwlib.block as blocklib
+import compiler.lgraph as lgraph
+import compiler.lgraph_pass.assemble as asmlib
+import compiler.lgraph_pass.route as routelib
+import compiler.lgraph_pass.route_solver as route_solver
+from dslang.dsprog import DSProgDB
+
+'''
+Micro-benchmark for routing problem construction. For every program, a
+single unrouted circuit is synthesized and assembled, and the routing
+problem of each layout view is built from the solution of the previous
+view. Only the problem construction is timed.
+'''
+
+# silence the compiler and the external ILP solver
+@contextlib.contextmanager
+def quiet():
+  sys.stdout.flush()
+  saved = os.dup(1)
+  devnull = os.open(os.devnull,os.O_WRONLY)
+  os.dup2(devnull,1)
+  try:
+    with contextlib.redirect_stdout(io.StringIO()):
+      yield
+  finally:
+    sys.stdout.flush()
+    os.dup2(saved,1)
+    os.close(devnull)
+    os.close(saved)
+
+def unrouted_circuit(board,prog,synth_depth=20):
+  compute_blocks = list(filter(lambda blk: \
+                               blk.type == blocklib.BlockType.COMPUTE, \
+                               board.blocks))
+  assemble_blocks = list(filter(lambda blk: \
+                                blk.type == blocklib.BlockType.ASSEMBLE, \
+                                board.blocks))
+  laws = lgraph.get_laws(board)
+  fragments = {}
+  for variable in prog.variables():
+    fragments[variable] = lgraph.synthesize_fragments(board,compute_blocks, \
+                                                      laws,variable, \
+                                                      prog.binding(variable), \
+                                                      1,synth_depth)
+    if len(fragments[variable]) == 0:
+      return None
+
+  for circuit in lgraph.combine_fragments(fragments):
+    for circ in asmlib.assemble(assemble_blocks,circuit,n_asm_frags=1):
+      return circ
+
+  return None
+
+def benchmark_program(board,prog,trials):
+  with quiet():
+    vadp = unrouted_circuit(board,prog)
+
+  if vadp is None:
+    return None
+
+  timings = []
+  entry = None
+  for view in board.layout.views:
+    times = []
+    for _ in range(trials):
+      start = time.time()
+      with quiet():
+        prob = routelib.routing_problem(board,view,vadp,entry)
+      times.append(time.time()-start)
+
+    timings.append((view,min(times),len(prob.identifier_assigns), \
+                    len(prob.conn_assigns),len(prob.resources)))
+    with quiet():
+      assigns = route_solver.RoutingSolver(prob).solve()
+
+    if assigns is None:
+      break
+    entry = routelib.LocAssignmentStack.Entry(assigns)
+
+  return timings
+
+
+parser = argparse.ArgumentParser(description='routing problem construction benchmark.')
+parser.add_argument('--trials', type=int, default=3, \
+                    help='number of times each problem is built.')
+parser.add_argument('programs', nargs='*', \
+                    help='programs to benchmark (default: all).')
+args = parser.parse_args()
+
+board = hcdclib.get_device(None,layout=True)
+if len(args.programs) == 0:
+  DSProgDB.load()
+  programs = list(DSProgDB.PROGRAMS.keys())
+else:
+  programs = args.programs
+
+total = 0.0
+for name in programs:
+  try:
+    timings = benchmark_program(board,DSProgDB.get_prog(name),args.trials)
+  except Exception as e:
+    print("%-16s error: %s" % (name,e))
+    continue
+
+  if timings is None:
+    print("%-16s no circuit" % name)
+    continue
+
+  for view,runtime,n_inst,n_conn,n_res in timings:
+    print("%-16s view=%-6s build=%.4fs insts=%d conns=%d resources=%d" % \
+          (name,view,runtime,n_inst,n_conn,n_res))
+    total += runtime
+
+print("total build time: %.3fs" % total)
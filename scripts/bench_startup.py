@@ -0,0 +1,50 @@
+import sys
+import os
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),"..")
+
+'''
+Startup benchmark for hcdcv2.get_device. Every trial runs in a fresh
+interpreter, the way grendel.py and legno.py are launched, and measures
+the time to import the device module and build or load the device.
+'''
+
+PROGRAM = '''
+import sys
+import time
+start = time.time()
+import hwlib.hcdc.hcdcv2 as hcdclib
+dev = hcdclib.get_device({model!r},layout={layout},snapshot={snapshot})
+sys.stderr.write("%f\\n" % (time.time()-start))
+'''
+
+def run_trial(model,layout,snapshot):
+  prog = PROGRAM.format(model=model,layout=layout,snapshot=snapshot)
+  start = time.time()
+  proc = subprocess.run([sys.executable,"-c",prog],cwd=ROOT, \
+                        stdout=subprocess.DEVNULL,stderr=subprocess.PIPE, \
+                        universal_newlines=True,check=True)
+  process_time = time.time()-start
+  device_time = float(proc.stderr.strip().split("\n")[-1])
+  return process_time,device_time
+
+parser = argparse.ArgumentParser(description='device startup benchmark.')
+parser.add_argument('--trials', type=int, default=5, \
+                    help='number of interpreters started per configuration.')
+parser.add_argument('--model-number', type=str, default="c0", \
+                    help='model number of the device.')
+args = parser.parse_args()
+
+# make sure the snapshot is up to date before it is timed
+run_trial(args.model_number,True,True)
+
+for layout in [False,True]:
+  for snapshot in [False,True]:
+    times = list(map(lambda _: run_trial(args.model_number,layout,snapshot), \
+                     range(args.trials)))
+    print("layout=%-5s snapshot=%-5s get_device=%.3fs process=%.3fs" % \
+          (layout,snapshot,min(map(lambda t: t[1], times)), \
+           min(map(lambda t: t[0], times))))
@@ -0,0 +1,89 @@
+import sys
+import os
+import tempfile
+import contextlib
+import io
+import numpy as np
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),".."))
+
+import hwlib.hcdc.hcdcv2 as hcdclib
+import hwlib.hcdc.llenums as llenums
+import hwlib.adp as adplib
+import hwlib.device as devlib
+import runtime.models.exp_profile_dataset as exp_profile_lib
+
+'''
+Round-trip check of copying profile datasets between databases. A dataset
+is written to a source database and loaded back, which marks its points
+as stored. It is then copied to a second database the way the
+characterization board datasets are copied to the board, extended with
+new points and written to both databases. Every copy must hold exactly
+the points of the dataset.
+'''
+
+def make_dataset(blk,loc,cfg,start,n):
+  dataset = exp_profile_lib.ExpProfileDataset(blk,loc,blk.outputs['z'],cfg, \
+                                              llenums.ProfileOpType.INPUT_OUTPUT)
+  add_points(dataset,cfg,start,n)
+  return dataset
+
+def add_points(dataset,cfg,start,n):
+  for idx in range(start,start+n):
+    inputs = {'x':-1.0+idx*0.01, 'y':1.0-idx*0.02}
+    dataset.add(cfg,inputs,inputs['x']*inputs['y']+0.001*idx,0.0001*idx)
+
+def load(dev,blk,loc,cfg):
+  return exp_profile_lib.load(dev,blk,loc,blk.outputs['z'],cfg, \
+                              llenums.ProfileOpType.INPUT_OUTPUT)
+
+def same_points(dataset,expected):
+  cols = dict(dataset.columns())
+  exp_cols = dict(expected.columns())
+  return cols.keys() == exp_cols.keys() and \
+    all(map(lambda name: np.array_equal(np.asarray(cols[name]), \
+                                        np.asarray(exp_cols[name])), \
+            exp_cols.keys()))
+
+def check(name,dev,expected,blk,loc,cfg):
+  with contextlib.redirect_stdout(io.StringIO()):
+    datasets = list(exp_profile_lib.get_all(dev))
+    dataset = load(dev,blk,loc,cfg)
+  ok = len(datasets) == 1 and not dataset is None and \
+       same_points(dataset,expected)
+  print("%-24s datasets=%d points=%d ok=%s" % \
+        (name,len(datasets),0 if dataset is None else len(dataset),ok))
+  if not ok:
+    raise Exception("dataset copy does not round-trip: %s" % name)
+
+dev = hcdclib.get_device(None,layout=True)
+blk = dev.get_block('mult')
+loc = devlib.Location(list(dev.layout.instances('mult'))[0])
+adp = adplib.ADP()
+adp.add_instance(blk,loc)
+cfg = adp.configs.get(blk.name,loc)
+cfg.modes = [list(filter(lambda m: 'x' in str(m), blk.modes))[0]]
+
+tmpdir = tempfile.mkdtemp()
+os.chdir(tmpdir)
+with contextlib.redirect_stdout(io.StringIO()):
+  dev.set_model("source")
+  exp_profile_lib.update(dev,make_dataset(blk,loc,cfg,0,25))
+  dataset = load(dev,blk,loc,cfg)
+  dev.set_model("target")
+  exp_profile_lib.update(dev,dataset)
+
+check("copy",dev,make_dataset(blk,loc,cfg,0,25),blk,loc,cfg)
+
+# the new points are appended to the target, and the source, which only
+# holds the original points, receives the whole dataset again.
+add_points(dataset,cfg,25,10)
+with contextlib.redirect_stdout(io.StringIO()):
+  exp_profile_lib.update(dev,dataset)
+  dev.set_model("source")
+  exp_profile_lib.update(dev,dataset)
+
+expected = make_dataset(blk,loc,cfg,0,35)
+check("extended source",dev,expected,blk,loc,cfg)
+dev.set_model("target")
+check("extended target",dev,expected,blk,loc,cfg)
@@ -70,6 +70,18 @@ class DeviceStatePathHandler:
         else:
             return "%s/%s-%s-%s-mdl.png" % (rel_path,loc,output,label.value)
 
+    @staticmethod
+    def get_path_index_file(board):
+        rel_path = DeviceStatePathHandler.DEVICE_STATE_DIR + "/%s" % board
+        util.mkdir_if_dne(rel_path)
+        return "%s/%s-paths.json" % (rel_path,board)
+
+    @staticmethod
+    def get_device_snapshot_file(board):
+        rel_path = DeviceStatePathHandler.DEVICE_STATE_DIR + "/%s" % board
+        util.mkdir_if_dne(rel_path)
+        return "%s/%s-device.pickle" % (rel_path,board)
+
     def set_root_dir(self,root):
         self.ROOT_DIR = root
         self.DATABASE = self.ROOT_DIR + "/%s-%s.db" % (self.board,self.model)
@@ -165,6 +165,9 @@ class Timer:
         self._runs.append(end-self._start)
         self._start = None
 
+    def add(self,runtime):
+        self._runs.append(runtime)
+
     def __repr__(self):
         if len(self._runs) == 0:
             return "%s mean=n/a std=n/a"